@@ -0,0 +1,524 @@
+import os
+import sys
+import json
+import time
+import zlib
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+import statistics
+import importlib.util
+from datetime import datetime, timezone, timedelta
+from botocore.exceptions import ClientError
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+CALCULATOR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'aws-egress-calculator.py')
+BASELINE_FILE = 'bench-baseline.json'
+ROLE_NAME = 'BenchRole'
+ALL_REGIONS = [
+    'us-east-1', 'us-east-2', 'us-west-1', 'us-west-2', 'eu-west-1', 'eu-west-2', 'eu-central-1',
+    'ap-southeast-1', 'ap-southeast-2', 'ap-northeast-1', 'ap-south-1', 'sa-east-1', 'ca-central-1',
+]
+SCENARIOS = ['single', 'org', 'org-incremental', 'dto']
+LIST_ACCOUNTS_PAGE = 20  # Organizations ListAccounts maximum
+LIST_METRICS_PAGE = 500
+METRIC_DATA_PAGE = 100800  # GetMetricData datapoints per response
+# Growth below these amounts is treated as noise when comparing to the baseline
+NOISE_FLOOR = {'wall_seconds': 0.5, 'peak_memory_mb': 5, 'cache_io_seconds': 0.5}
+
+# Startup cases: calculator arguments (None: bare interpreter) and the heavy
+# modules the case must not import. Any such import is a regression.
+HEAVY_MODULES = ('boto3', 'botocore', 'aiobotocore', 'pandas', 'numpy', 'dateutil', 'pyarrow', 'yaml')
+STARTUP_CASES = {
+    'interpreter': (None, ()),
+    'help': (['--help'], HEAVY_MODULES),
+    'merge': (['merge', 'nat-partial-0-of-1.csv'], ('boto3', 'botocore', 'aiobotocore')),
+    'cur': (['cur', 'cur.csv'], ('boto3', 'botocore', 'aiobotocore')),
+}
+STARTUP_NOISE_FLOOR = {'wall_seconds': 0.05}
+
+# ------------ Fake AWS Backend ------------
+
+class FakeOrganization:
+    """
+    In-process stand-in for the AWS APIs the calculator uses. Simulates an
+    Organization of `accounts` accounts with `gateways` NAT Gateways in each
+    of the first `nat_regions` regions, daily NAT datapoints and Cost
+    Explorer DTO usage. Every request sleeps `latency` seconds (with
+    jitter) and is throttled at random with `throttle_rate`, or when more
+    than `tps_limit` requests per second hit one API/region/account.
+    """
+    def __init__(self, accounts=10, regions=4, nat_regions=2, gateways=2, latency=0.02,
+                 throttle_rate=0.0, tps_limit=0, seed=0):
+        self.accounts = [f"{i:012d}" for i in range(1, accounts + 1)]
+        self.regions = ALL_REGIONS[:regions]
+        self.nat_regions = set(self.regions[:nat_regions])
+        self.gateways = gateways
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.tps_limit = tps_limit
+        self.random = random.Random(seed)
+        self.calls = {}
+        self.throttled = 0
+        self.windows = {}  # (api, region, account) -> (second, requests in it)
+        self.lock = threading.Lock()
+
+    def nat_ids(self, account_id, region):
+        if region not in self.nat_regions:
+            return []
+        return [f"nat-{account_id}-{region}-{i}" for i in range(self.gateways)]
+
+    def request(self, api, region, account_id):
+        """
+        Count the request and decide whether it is throttled. Returns the
+        latency to simulate.
+        """
+        with self.lock:
+            self.calls[api] = self.calls.get(api, 0) + 1
+            throttled = self.random.random() < self.throttle_rate
+            if self.tps_limit:
+                second = int(time.monotonic())
+                window, count = self.windows.get((api, region, account_id), (second, 0))
+                count = count + 1 if window == second else 1
+                self.windows[(api, region, account_id)] = (second, count)
+                throttled = throttled or count > self.tps_limit
+            if throttled:
+                self.throttled += 1
+            latency = self.latency * self.random.uniform(0.5, 1.5)
+        if throttled:
+            raise ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'},
+                               'ResponseMetadata': {'HTTPStatusCode': 400}}, api)
+        return latency
+
+    # --- API responses --- #
+
+    def get_caller_identity(self, account_id, region, **kwargs):
+        return {'Account': account_id}
+
+    def assume_role(self, account_id, region, RoleArn, **kwargs):
+        target = RoleArn.split(':')[4]
+        return {'Credentials': {
+            'AccessKeyId': f"AKIA{target}",
+            'SecretAccessKey': 'fake',
+            'SessionToken': 'fake',
+            'Expiration': datetime.now(timezone.utc) + timedelta(seconds=kwargs.get('DurationSeconds', 3600)),
+        }}
+
+    def describe_organization(self, account_id, region, **kwargs):
+        return {'Organization': {'MasterAccountId': self.accounts[0]}}
+
+    def list_accounts(self, account_id, region, NextToken=None, **kwargs):
+        start = int(NextToken or 0)
+        page = {'Accounts': [{'Id': a, 'Status': 'ACTIVE'} for a in self.accounts[start:start + LIST_ACCOUNTS_PAGE]]}
+        if start + LIST_ACCOUNTS_PAGE < len(self.accounts):
+            page['NextToken'] = str(start + LIST_ACCOUNTS_PAGE)
+        return page
+
+    def describe_regions(self, account_id, region, **kwargs):
+        return {'Regions': [{'RegionName': r} for r in self.regions]}
+
+    def describe_nat_gateways(self, account_id, region, **kwargs):
+        return {'NatGateways': [
+            {'NatGatewayId': nat_id, 'State': 'available', 'VpcId': f"vpc-{account_id}",
+             'NatGatewayAddresses': [{'NetworkInterfaceId': f"eni-{nat_id[4:]}"}]}
+            for nat_id in self.nat_ids(account_id, region)
+        ]}
+
+    def list_metrics(self, account_id, region, NextToken=None, **kwargs):
+        nat_ids = self.nat_ids(account_id, region)
+        start = int(NextToken or 0)
+        page = {'Metrics': [
+            {'Namespace': kwargs.get('Namespace'), 'MetricName': kwargs.get('MetricName'),
+             'Dimensions': [{'Name': 'NatGatewayId', 'Value': nat_id}]}
+            for nat_id in nat_ids[start:start + LIST_METRICS_PAGE]
+        ]}
+        if start + LIST_METRICS_PAGE < len(nat_ids):
+            page['NextToken'] = str(start + LIST_METRICS_PAGE)
+        return page
+
+    def get_metric_data(self, account_id, region, MetricDataQueries, StartTime, EndTime, NextToken=None, **kwargs):
+        days = []
+        day = StartTime.replace(hour=0, minute=0, second=0, microsecond=0)
+        while day < EndTime:
+            days.append(day)
+            day += timedelta(days=1)
+        per_page = max(1, METRIC_DATA_PAGE // max(1, len(days)))
+        start = int(NextToken or 0)
+        results = []
+        for query in MetricDataQueries[start:start + per_page]:
+            metric = query['MetricStat']['Metric']
+            nat_id = metric['Dimensions'][0]['Value']
+            # A stable daily volume per gateway/metric, between 0 and 4 GiB
+            daily = float(zlib.crc32(f"{nat_id}/{metric['MetricName']}".encode()) % 4096) * 1024**2
+            results.append({'Id': query['Id'], 'Timestamps': days, 'Values': [daily] * len(days), 'StatusCode': 'Complete'})
+        page = {'MetricDataResults': results}
+        if start + per_page < len(MetricDataQueries):
+            page['NextToken'] = str(start + per_page)
+        return page
+
+    def get_dimension_values(self, account_id, region, **kwargs):
+        return {'DimensionValues': [
+            {'Value': 'DataTransfer-Out-Bytes'}, {'Value': 'USE2-DataTransfer-Out-Bytes'},
+            {'Value': 'EUW1-DataTransfer-Out-Bytes'}, {'Value': 'USE1-DataTransfer-Regional-Bytes'},
+        ]}
+
+    def get_cost_and_usage(self, account_id, region, TimePeriod, Filter, **kwargs):
+        regions = next(f['Dimensions']['Values'] for f in Filter['And'] if f.get('Dimensions', {}).get('Key') == 'REGION')
+        month = datetime.fromisoformat(TimePeriod['Start']).date().replace(day=1)
+        end = datetime.fromisoformat(TimePeriod['End']).date()
+        results = []
+        while month < end:
+            groups = [
+                {'Keys': [a, r], 'Metrics': {'UsageQuantity': {'Amount': str(zlib.crc32(f"{a}/{r}".encode()) % 500), 'Unit': 'GB'}}}
+                for a in self.accounts for r in regions if r in self.nat_regions
+            ]
+            results.append({'TimePeriod': {'Start': month.isoformat()}, 'Groups': groups})
+            month = (month + timedelta(days=32)).replace(day=1)
+        return {'ResultsByTime': results}
+
+class FakeMeta:
+    def __init__(self, region_name):
+        self.region_name = region_name
+
+class FakeClient:
+    """
+    boto3-style client: every API is a method taking keyword arguments.
+    """
+    def __init__(self, org, account_id, region):
+        self.org = org
+        self.account_id = account_id
+        self.meta = FakeMeta(region)
+
+    def __getattr__(self, api):
+        handler = getattr(self.org, api)
+
+        def call(**kwargs):
+            time.sleep(self.org.request(api, self.meta.region_name, self.account_id))
+            return handler(self.account_id, self.meta.region_name, **kwargs)
+        return call
+
+class FakeAsyncClient(FakeClient):
+    """
+    aiobotocore-style client: an async context manager whose APIs are
+    coroutines.
+    """
+    def __getattr__(self, api):
+        handler = getattr(self.org, api)
+
+        async def call(**kwargs):
+            import asyncio
+            await asyncio.sleep(self.org.request(api, self.meta.region_name, self.account_id))
+            return handler(self.account_id, self.meta.region_name, **kwargs)
+        return call
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+class FakeAioSession:
+    def __init__(self, org):
+        self.org = org
+
+    def set_config_variable(self, name, value):
+        pass
+
+    def create_client(self, service, region_name=None, config=None, aws_access_key_id=None, **kwargs):
+        account_id = aws_access_key_id[4:] if aws_access_key_id else self.org.accounts[0]
+        return FakeAsyncClient(self.org, account_id, region_name or 'us-east-1')
+
+def install_fake(calc, org):
+    """
+    Route every client the calculator creates to the fake Organization.
+    Credentials-less clients belong to the management (first) account.
+    """
+    def get_client(service, region=None, credentials=None):
+        account_id = credentials['AccessKeyId'][4:] if credentials else org.accounts[0]
+        return FakeClient(org, account_id, region or 'us-east-1')
+    calc.get_client = get_client
+    calc.get_aio_session = lambda: FakeAioSession(org)
+    calc.AioConfig = lambda **kwargs: None
+
+def load_calculator():
+    spec = importlib.util.spec_from_file_location('aws_egress_calculator', CALCULATOR_PATH)
+    calc = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(calc)
+    return calc
+
+# ------------ Scenario Runner (one per process) ------------
+
+def peak_memory_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return round(peak / (1024**2 if sys.platform == 'darwin' else 1024), 1)
+
+def cache_bytes(calc):
+    files = [calc.CHECKPOINT_FILE, calc.HISTORY_FILE, calc.INVENTORY_FILE]
+    return sum(os.path.getsize(f + suffix) for f in files for suffix in ('', '-wal') if os.path.exists(f + suffix))
+
+def run_scenario(args):
+    """
+    Run one scenario against a fresh fake Organization in the current
+    directory and write its measurements to args.result.
+    """
+    calc = load_calculator()
+    org = FakeOrganization(args.size, args.regions, args.nat_regions, args.gateways,
+                           args.latency_ms / 1000.0, args.throttle_rate, args.tps_limit, args.seed)
+    install_fake(calc, org)
+    calc_args = ['--workers', str(args.workers), '--backend', args.backend]
+    calc.apply_args(calc.parse_args(calc_args))
+    calc.profile_file = None
+    calc.print_both = lambda text="", end="\n", flush=False: None
+    regions = org.regions
+
+    def run():
+        if args.scenario == 'single':
+            return calc.run_single_account_query(regions, False)[0]
+        if args.scenario == 'dto':
+            return calc.run_dto_query(True, regions)[0]
+        return calc.run_org_query(org.accounts, ROLE_NAME, regions, False)[0]
+
+    if args.scenario == 'org-incremental':
+        # Warm the history store and inventory, then time a scheduled re-run
+        run()
+        calc.remove_checkpoint_files()
+        calc.incremental_mode = True
+        org.calls.clear()
+        calc.phase_timings.clear()
+
+    start = time.perf_counter()
+    df = run()
+    wall = time.perf_counter() - start
+    calc.get_checkpoints().flush()
+    calc.get_history().flush()
+
+    result = {
+        'scenario': args.scenario,
+        'size': args.size,
+        'backend': args.backend,
+        'wall_seconds': round(wall, 3),
+        'api_calls': sum(org.calls.values()),
+        'api_calls_by_api': dict(sorted(org.calls.items())),
+        'throttled': org.throttled,
+        'retries': calc.resilience_stats['retries'],
+        'peak_memory_mb': peak_memory_mb(),
+        'cache_io_seconds': round(calc.phase_timings.get('cache_io', {}).get('seconds', 0.0), 4),
+        'cache_bytes': cache_bytes(calc),
+        'rows': len(df),
+    }
+    with open(args.result, 'w') as f:
+        json.dump(result, f)
+    os._exit(0)  # skip the calculator's atexit cleanup
+
+def spawn_scenario(args, scenario, size):
+    workdir = tempfile.mkdtemp(prefix='egress-bench-')
+    result_file = os.path.join(workdir, 'result.json')
+    command = [
+        sys.executable, os.path.abspath(__file__), '--run-scenario', scenario, '--size', str(size),
+        '--result', result_file, '--workers', str(args.workers), '--backend', args.backend,
+        '--regions', str(args.regions), '--nat-regions', str(args.nat_regions), '--gateways', str(args.gateways),
+        '--latency-ms', str(args.latency_ms), '--throttle-rate', str(args.throttle_rate),
+        '--tps-limit', str(args.tps_limit), '--seed', str(args.seed),
+    ]
+    try:
+        completed = subprocess.run(command, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if completed.returncode != 0 or not os.path.exists(result_file):
+            print(f"[!] {scenario} ({size} accounts) failed:\n{completed.stderr}")
+            return None
+        with open(result_file) as f:
+            return json.load(f)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+# ------------ Startup Time ------------
+
+def write_startup_inputs(workdir):
+    """Small merge and CUR inputs, so those cases exercise their full path."""
+    with open(os.path.join(workdir, 'nat-partial-0-of-1.csv'), 'w') as f:
+        f.write('Account,Region,Month,Upload GB,Download GB,Total GB\n')
+        f.write('000000000001,us-east-1,2025-01,1.5,2.5,4.0\n')
+        f.write('000000000002,eu-west-1,2025-01,3.0,1.0,4.0\n')
+    month = datetime.now(timezone.utc).strftime('%Y-%m')
+    with open(os.path.join(workdir, 'cur.csv'), 'w') as f:
+        f.write('lineItem/UsageAccountId,lineItem/LineItemType,lineItem/UsageType,lineItem/UsageAmount,'
+                'lineItem/UsageStartDate,product/region\n')
+        f.write(f'000000000001,Usage,NatGateway-Bytes,12.5,{month}-01T00:00:00Z,us-east-1\n')
+        f.write(f'000000000001,Usage,USE2-DataTransfer-Out-Bytes,3.25,{month}-01T00:00:00Z,us-east-2\n')
+
+def imported_heavy_modules(command, workdir):
+    """Top-level heavy packages the command imports, from -X importtime."""
+    completed = subprocess.run([command[0], '-X', 'importtime', *command[1:]], cwd=workdir, stdin=subprocess.DEVNULL,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    modules = set()
+    for line in completed.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            modules.add(line.rsplit('|', 1)[1].strip().split('.')[0])
+    return sorted(modules & set(HEAVY_MODULES))
+
+def run_startup_cases(args):
+    """
+    Time each startup case as a fresh process (median of --startup-runs)
+    and record which heavy modules it imports.
+    """
+    workdir = tempfile.mkdtemp(prefix='egress-startup-')
+    results = []
+    try:
+        write_startup_inputs(workdir)
+        for case, (calc_args, forbidden) in STARTUP_CASES.items():
+            print(f"[✓] Timing startup: {case}...", flush=True)
+            command = [sys.executable, '-c', 'pass'] if calc_args is None else [sys.executable, CALCULATOR_PATH, *calc_args]
+            timings = []
+            for _ in range(max(1, args.startup_runs)):
+                start = time.perf_counter()
+                completed = subprocess.run(command, cwd=workdir, stdin=subprocess.DEVNULL,
+                                           stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+                timings.append(time.perf_counter() - start)
+                if completed.returncode != 0:
+                    print(f"[!] startup {case} failed:\n{completed.stderr}")
+                    break
+            modules = imported_heavy_modules(command, workdir)
+            results.append({
+                'scenario': f"startup-{case}",
+                'size': 0,
+                'backend': 'n/a',
+                'wall_seconds': round(statistics.median(timings), 3),
+                'api_calls': 0,
+                'heavy_modules': modules,
+                'forbidden_imports': [m for m in modules if m in forbidden],
+            })
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+# ------------ Baseline Comparison ------------
+
+def result_key(result):
+    return f"{result['scenario']}/{result['size']}/{result['backend']}"
+
+def compare_to_baseline(results, baseline, tolerance):
+    """
+    Return regression messages: API calls may not grow at all, startup
+    cases may not import forbidden or new heavy modules, and wall time,
+    peak memory and cache I/O may not grow by more than `tolerance`.
+    """
+    regressions = []
+    for result in results:
+        for module in result.get('forbidden_imports', []):
+            regressions.append(f"{result_key(result)}: imports {module}")
+        base = baseline.get(result_key(result))
+        if not base:
+            continue
+        if result['api_calls'] > base['api_calls']:
+            regressions.append(f"{result_key(result)}: API calls {base['api_calls']} -> {result['api_calls']}")
+        for module in sorted(set(result.get('heavy_modules', [])) - set(base.get('heavy_modules', []))):
+            if module not in result.get('forbidden_imports', []):
+                regressions.append(f"{result_key(result)}: now imports {module}")
+        floors = STARTUP_NOISE_FLOOR if result['scenario'].startswith('startup-') else NOISE_FLOOR
+        for field, floor in floors.items():
+            old, new = base.get(field), result.get(field)
+            if old and new and new > old * (1 + tolerance) and new - old > floor:
+                regressions.append(f"{result_key(result)}: {field} {old} -> {new} (+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+def print_results(results, baseline):
+    startup = [r for r in results if r['scenario'].startswith('startup-')]
+    results = [r for r in results if not r['scenario'].startswith('startup-')]
+    if startup:
+        print(f"\n{'startup':<16} {'wall s':>9}  {'heavy imports':<40} vs. baseline")
+        for result in startup:
+            base = baseline.get(result_key(result))
+            change = f"{(result['wall_seconds'] / base['wall_seconds'] - 1) * 100:+.0f}% wall" if base and base['wall_seconds'] else ''
+            print(f"{result['scenario'][len('startup-'):]:<16} {result['wall_seconds']:>9.3f}  "
+                  f"{', '.join(result['heavy_modules']) or '-':<40} {change}")
+    if not results:
+        return
+    print(f"\n{'scenario':<16} {'accounts':>8} {'wall s':>9} {'API calls':>10} {'peak MB':>8} {'cache I/O s':>11} {'cache KB':>9}  vs. baseline")
+    for result in results:
+        base = baseline.get(result_key(result))
+        change = f"{(result['wall_seconds'] / base['wall_seconds'] - 1) * 100:+.0f}% wall" if base and base['wall_seconds'] else ''
+        print(f"{result['scenario']:<16} {result['size']:>8} {result['wall_seconds']:>9.2f} {result['api_calls']:>10} "
+              f"{result['peak_memory_mb'] or 0:>8.1f} {result['cache_io_seconds']:>11.3f} {result['cache_bytes'] // 1024:>9}  {change}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark aws-egress-calculator against an in-process fake AWS Organization.")
+    parser.add_argument("--sizes", default="10,100,1000", help="Comma-separated Organization sizes in accounts (default: 10,100,1000)")
+    parser.add_argument("--scenarios", default=','.join(SCENARIOS + ['startup']),
+                        help=f"Comma-separated scenarios (default: {','.join(SCENARIOS + ['startup'])})")
+    parser.add_argument("--startup-runs", type=int, default=5, help="Runs per startup case; the median is reported (default: 5)")
+    parser.add_argument("--workers", type=int, default=16, help="--workers passed to the calculator (default: 16)")
+    parser.add_argument("--backend", choices=['threads', 'async'], default='threads', help="Collection backend (default: threads)")
+    parser.add_argument("--regions", type=int, default=4, help=f"Regions per account, up to {len(ALL_REGIONS)} (default: 4)")
+    parser.add_argument("--nat-regions", type=int, default=2, help="Regions per account that have NAT Gateways (default: 2)")
+    parser.add_argument("--gateways", type=int, default=2, help="NAT Gateways per account/region (default: 2)")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Simulated latency per request (default: 20)")
+    parser.add_argument("--throttle-rate", type=float, default=0.01, help="Fraction of requests throttled at random (default: 0.01)")
+    parser.add_argument("--tps-limit", type=int, default=0, help="Throttle above this many requests/s per API/region/account (default: off)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for latency jitter and throttling")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help=f"Baseline results file (default: {BASELINE_FILE})")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed growth in wall time, memory and cache I/O (default: 0.2)")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    # Internal: run one scenario in this process
+    parser.add_argument("--run-scenario", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, default=10, help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    if args.run_scenario:
+        args.scenario = args.run_scenario
+        run_scenario(args)
+        return
+
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    results = []
+    for scenario in scenarios:
+        if scenario == 'startup':
+            results += run_startup_cases(args)
+            continue
+        # The single-account scenario does not scale with the Organization
+        for size in ([1] if scenario == 'single' else sizes):
+            print(f"[✓] Running {scenario} with {size} accounts...", flush=True)
+            result = spawn_scenario(args, scenario, size)
+            if result:
+                results.append(result)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        baseline.update({result_key(r): r for r in results})
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"\n[✓] Saved {len(results)} results to {args.baseline}")
+        return
+
+    regressions = compare_to_baseline(results, baseline, args.tolerance)
+    if regressions:
+        print("\n[!] Regressions against the baseline:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        sys.exit(1)
+    if baseline:
+        print("\n[✓] No regressions against the baseline.")
+
+if __name__ == "__main__":
+    main()
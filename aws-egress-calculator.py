@@ -1,11 +1,76 @@
-import boto3
-import pandas as pd
 import os
 import sys
 import time
+import random
 import atexit
-from datetime import datetime, timezone
-import dateutil.relativedelta
+import bisect
+import warnings
+from array import array
+import argparse
+import threading
+import json
+import re
+import glob
+import gzip
+import ipaddress
+import zlib
+import subprocess
+import sqlite3
+import importlib
+from contextlib import contextmanager, asynccontextmanager, AsyncExitStack
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from itertools import islice
+from datetime import datetime, timezone, timedelta
+
+# --- Lazy imports --- #
+# pandas, numpy, boto3/botocore and the optional libraries take about a
+# second to import, so they are loaded on the code paths that use them:
+# --help never imports them, and merge/cur/flowlogs never import boto3.
+class LazyModule:
+    """Stands in for a module and imports it on first attribute access."""
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+pd = LazyModule('pandas')
+np = LazyModule('numpy')
+asyncio = LazyModule('asyncio')  # only the async backend needs the event loop
+
+get_aio_session = None  # set by load_aiobotocore()
+AioConfig = None
+pa = None  # set by load_pyarrow()
+pa_dataset = None
+pa_compute = None
+pa_parquet = None
+
+def load_aiobotocore():
+    """Import aiobotocore for the async backend; False if it is not installed."""
+    global get_aio_session, AioConfig
+    if get_aio_session is None:
+        try:
+            from aiobotocore.session import get_session as get_aio_session
+            from aiobotocore.config import AioConfig
+        except ImportError:
+            return False
+    return True
+
+def load_pyarrow():
+    """Import pyarrow for Parquet input and --export; False if it is not installed."""
+    global pa, pa_dataset, pa_compute, pa_parquet
+    if pa_dataset is None:
+        try:
+            import pyarrow as pa
+            import pyarrow.compute as pa_compute
+            import pyarrow.dataset as pa_dataset
+            import pyarrow.parquet as pa_parquet
+        except ImportError:
+            return False
+    return True
 
 output_file = None
 
@@ -15,13 +80,26 @@ def print_both(text="", end="\n", flush=False):
         output_file.write(text + end)
 
 success_flag = False
+interactive = True  # False in batch runs: never prompt, fail the target instead
+
+CHECKPOINT_FILE = 'egress_checkpoint.sqlite'
+HISTORY_FILE = 'egress_history.sqlite'
+CREDENTIAL_CACHE_FILE = 'assumed_role_cache.json'
+INVENTORY_FILE = 'nat_gateway_inventory.json'
+INVENTORY_VERSION = 2
+REGIONS_FILE = 'aws_regions.json'
+# Regions enabled by default in every account. Opt-in regions (af-south-1,
+# ap-east-1, me-south-1, ...) are added by --refresh-regions if enabled.
+DEFAULT_REGIONS = [
+    'ap-northeast-1', 'ap-northeast-2', 'ap-northeast-3', 'ap-south-1', 'ap-southeast-1', 'ap-southeast-2',
+    'ca-central-1', 'eu-central-1', 'eu-north-1', 'eu-west-1', 'eu-west-2', 'eu-west-3', 'sa-east-1',
+    'us-east-1', 'us-east-2', 'us-west-1', 'us-west-2',
+]
+refresh_regions = False
 
-NAT_CACHE_FILE = 'nat_org_usage_cache.csv'
-DTO_CACHE_FILE = 'dto_usage_cache.csv'
-
-nat_cache_df = pd.DataFrame()
-dto_cache_df = pd.DataFrame()
 resume_mode = False
+incremental_mode = False
+granularity = 'monthly'  # 'daily' also keeps per-gateway daily series
 
 # Constants
 NAMESPACE_NAT = 'AWS/NATGateway'
@@ -29,41 +107,553 @@ NAMESPACE_BILLING = 'AWS/Billing'
 METRIC_NAT_UPLOAD = 'BytesInFromSource'
 METRIC_NAT_DOWNLOAD = 'BytesInFromDestination'
 METRIC_DTO = 'AWS:DataTransfer-Out-Bytes'
+# Regional internet DTO usage types, e.g. DataTransfer-Out-Bytes (us-east-1),
+# USE2-DataTransfer-Out-Bytes, EUC1-DataTransfer-Out-Bytes, EU- (eu-west-1).
+# CloudFront uses the same suffix with edge-location prefixes (US-, JP-, ...);
+# its EU- types are told apart by service, see DTO_EXCLUDED_SERVICES.
+DTO_USAGE_TYPE_PATTERN = re.compile(r'^(?:(?:[A-Z]{2,4}[0-9]+|EU)-)?DataTransfer-Out-Bytes$')
+# Cost Explorer SERVICE values and CUR product codes whose DTO is not EC2's
+DTO_EXCLUDED_SERVICES = ['Amazon CloudFront']
+DTO_EXCLUDED_PRODUCT_CODES = {'AmazonCloudFront'}
 PERIOD = 86400
-CACHE_FILE = 'nat_org_usage_cache.csv'
-
-# --- Cache Utility Functions --- #
-
-def load_cache(cache_file):
-    if os.path.exists(cache_file):
+NAT_COLUMNS = ['Account', 'Region', 'Month', 'Upload GB', 'Download GB', 'Total GB']
+MAX_METRIC_QUERIES = 500  # GetMetricData limit per request
+
+# GetMetricData calls made vs. the get_metric_statistics calls they replace
+metric_call_stats = {"batched": 0, "legacy": 0, "ce": 0}
+# (account, region) -> reason, for units whose data could not be collected.
+# Their rows carry NaN instead of zeros and are never checkpointed.
+missing_units = {}
+
+# --- Concurrency settings (overridden from the command line) --- #
+max_workers = 1
+# Units queued per worker (or per pooled connection for the async backend).
+# Units are submitted through this window so only the rows of units still
+# in flight are held before they reach the aggregator.
+UNIT_WINDOW_PER_WORKER = 2
+collection_backend = 'threads'
+region_prefilter = True
+REGION_CONCURRENCY = 8
+# In-flight request limits per API and region, kept well under the
+# CloudWatch/STS TPS quotas. STS is global so it shares one slot pool.
+API_CONCURRENCY = {
+    'sts': 4,
+    'list_metrics': 4,
+    'get_metric_data': 8,
+    'describe_regions': 4,
+    'describe_nat_gateways': 8,
+}
+
+_api_semaphores = {}
+_semaphore_lock = threading.Lock()
+client_lock = threading.RLock()
+stats_lock = threading.Lock()
+
+# --- Assumed-role credential cache --- #
+role_duration = 3600  # DurationSeconds requested from STS
+persist_credentials = False
+CREDENTIAL_REFRESH_MARGIN = 300  # refresh credentials this many seconds before expiry
+
+_credential_cache = {}  # (account_id, role_name) -> STS credentials
+_failed_roles = {}  # (account_id, role_name) -> error, never retried during a run
+_credential_lock = threading.Lock()
+_role_locks = {}
+
+# --- Shared client pool --- #
+# Every client is created from one boto3 session per AWS profile so service
+# models are loaded once, and clients are reused per (credentials, service,
+# region) so their HTTP connection pools (and TLS connections) stay warm
+# across units and across batch targets.
+max_pool_connections = 50
+tcp_keepalive = True
+retry_mode = 'standard'
+max_attempts = 1  # botocore's own attempts; call_aws owns retries
+
+aws_profile = None  # named profile for the caller's credentials, None for the default chain
+_base_sessions = {}  # aws_profile -> boto3.Session
+_client_cache = {}  # (access_key_id or aws_profile, service, region) -> client
+_worker_pool = None
+
+def get_base_session():
+    import boto3
+    with client_lock:
+        if aws_profile not in _base_sessions:
+            _base_sessions[aws_profile] = boto3.Session(profile_name=aws_profile)
+        return _base_sessions[aws_profile]
+
+def get_client(service, region=None, credentials=None):
+    """
+    Return a pooled client for the service/region, using the given STS
+    credentials or the caller's credentials (aws_profile) when None.
+    """
+    from botocore.config import Config
+    key = (credentials['AccessKeyId'] if credentials else aws_profile, service, region)
+    with client_lock:
+        client = _client_cache.get(key)
+        if client is None:
+            kwargs = {}
+            if credentials:
+                kwargs = {
+                    'aws_access_key_id': credentials['AccessKeyId'],
+                    'aws_secret_access_key': credentials['SecretAccessKey'],
+                    'aws_session_token': credentials['SessionToken'],
+                }
+            config = Config(
+                max_pool_connections=max_pool_connections,
+                tcp_keepalive=tcp_keepalive,
+                retries={'mode': retry_mode, 'total_max_attempts': max_attempts}
+            )
+            client = get_base_session().client(service, region_name=region, config=config, **kwargs)
+            _client_cache[key] = client
+        return client
+
+def get_worker_pool():
+    """
+    One thread pool for discovery and collection, kept for the whole
+    process so batch targets reuse its threads. Tasks on it must not wait
+    on other tasks submitted to it.
+    """
+    global _worker_pool
+    with client_lock:
+        if _worker_pool is None:
+            _worker_pool = ThreadPoolExecutor(max_workers=max_workers)
+        return _worker_pool
+
+def drop_clients(credentials):
+    with client_lock:
+        for key in [k for k in _client_cache if k[0] == credentials['AccessKeyId']]:
+            del _client_cache[key]
+
+def _get_semaphore(key, limit):
+    with _semaphore_lock:
+        if key not in _api_semaphores:
+            _api_semaphores[key] = threading.BoundedSemaphore(limit)
+        return _api_semaphores[key]
+
+@contextmanager
+def api_slot(api, region='global'):
+    """
+    Hold a per-region and a per-API/region concurrency slot around an AWS call.
+    """
+    region_sem = _get_semaphore(('region', region), REGION_CONCURRENCY)
+    api_sem = _get_semaphore((api, region), API_CONCURRENCY.get(api, REGION_CONCURRENCY))
+    with region_sem, api_sem:
+        yield
+
+# --- Run profile --- #
+# Every AWS request is timed per (api, region, account) into a latency
+# histogram, next to retry/throttle counts, per-unit wall time and time
+# spent in pandas and cache I/O. Written at exit as a JSON run profile and,
+# optionally, a Prometheus textfile.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)  # seconds
+PROFILE_TOP_N = 10
+
+profile_file = None
+prometheus_file = None
+run_started = datetime.now(timezone.utc)
+_call_stats = {}  # (api, region, account_id) -> counters and latency histogram
+phase_timings = {}  # phase -> {'seconds': ..., 'count': ...}
+unit_timings = {}  # (account_id, region) -> seconds spent scanning the unit
+_profile_lock = threading.Lock()
+
+def _call_entry(api, region, account_id):
+    # Caller holds _profile_lock
+    key = (api, region, account_id or '')
+    if key not in _call_stats:
+        _call_stats[key] = {
+            'calls': 0, 'errors': 0, 'retries': 0, 'throttles': 0,
+            'seconds': 0.0, 'max_seconds': 0.0,
+            'buckets': [0] * (len(LATENCY_BUCKETS) + 1),  # last bucket is +Inf
+        }
+    return _call_stats[key]
+
+def record_call(api, region, account_id, seconds, error=None):
+    with _profile_lock:
+        entry = _call_entry(api, region, account_id)
+        entry['calls'] += 1
+        entry['seconds'] += seconds
+        entry['max_seconds'] = max(entry['max_seconds'], seconds)
+        entry['buckets'][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        if error is not None:
+            entry['errors'] += 1
+            if _error_code(error) in THROTTLE_ERRORS:
+                entry['throttles'] += 1
+
+def record_retry(api, region, account_id):
+    with _profile_lock:
+        _call_entry(api, region, account_id)['retries'] += 1
+
+def add_phase_time(phase, seconds):
+    with _profile_lock:
+        timing = phase_timings.setdefault(phase, {'seconds': 0.0, 'count': 0})
+        timing['seconds'] += seconds
+        timing['count'] += 1
+
+@contextmanager
+def timed(phase):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_phase_time(phase, time.perf_counter() - start)
+
+def record_unit_time(account_id, region, seconds):
+    with _profile_lock:
+        unit_timings[(account_id, region)] = unit_timings.get((account_id, region), 0.0) + seconds
+
+# --- Resilience: adaptive rate limits, retry budget, circuit breaker --- #
+# Every AWS request goes through call_aws. Request rates per API/region
+# follow AIMD: each success raises the rate a little, each throttle halves
+# it. Retries use full-jitter backoff and draw on one run-wide budget that
+# successes slowly refill, so an outage cannot turn into a retry storm.
+AIMD_INITIAL_RATE = 50.0  # requests per second per API/region
+AIMD_MIN_RATE = 0.5
+AIMD_MAX_RATE = 500.0
+AIMD_INCREASE = 1.0
+AIMD_DECREASE = 0.5
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 20
+RETRY_BUDGET_REFILL = 0.1  # budget earned back per successful request
+CIRCUIT_BREAKER_THRESHOLD = 3  # AccessDenied errors before an account is skipped
+# Only denials on the collection calls count; the EC2 discovery probes are
+# best-effort and only need permissions the collection does not
+CIRCUIT_BREAKER_APIS = {'sts', 'list_metrics', 'get_metric_data'}
+
+retry_limit = 6  # retries per request
+retry_budget = 100  # retries available across the whole run
+
+THROTTLE_ERRORS = {
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottled',
+    'RequestThrottledException', 'RequestLimitExceeded', 'TooManyRequestsException',
+    'LimitExceededException', 'SlowDown',
+}
+TRANSIENT_ERRORS = {
+    'InternalError', 'InternalFailure', 'InternalServiceError', 'ServiceUnavailable',
+    'ServiceUnavailableException', 'RequestTimeout', 'RequestTimeoutException',
+}
+ACCESS_DENIED_ERRORS = {
+    'AccessDenied', 'AccessDeniedException', 'UnauthorizedOperation', 'AuthFailure',
+    'UnrecognizedClientException', 'InvalidClientTokenId',
+}
+
+_rate_limits = {}  # (api, region) -> {'rate': requests/s, 'next': monotonic time of the next free slot}
+_retry_tokens = None
+_access_denied = {}  # account_id -> AccessDenied errors seen
+open_circuits = {}  # account_id -> error that opened the circuit
+resilience_stats = {"retries": 0, "throttles": 0, "budget_exhausted": 0}
+_resilience_lock = threading.Lock()
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling AWS for an account whose circuit is open."""
+
+def _error_code(e):
+    return (getattr(e, 'response', None) or {}).get('Error', {}).get('Code', '')
+
+def _is_retryable(e):
+    from botocore.exceptions import ConnectionError as BotoConnectionError, HTTPClientError
+    code = _error_code(e)
+    if code in THROTTLE_ERRORS or code in TRANSIENT_ERRORS:
+        return True
+    status = (getattr(e, 'response', None) or {}).get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+    return status >= 500 or isinstance(e, (BotoConnectionError, HTTPClientError))
+
+def check_circuit(account_id):
+    if account_id in open_circuits:
+        raise CircuitOpenError(f"skipping {account_id} after {CIRCUIT_BREAKER_THRESHOLD} AccessDenied errors")
+
+def _reserve_rate_slot(api, region):
+    """
+    Book the next send time for the API/region at its current rate and
+    return how long to wait for it.
+    """
+    with _resilience_lock:
+        limit = _rate_limits.setdefault((api, region), {'rate': AIMD_INITIAL_RATE, 'next': 0.0})
+        now = time.monotonic()
+        start = max(now, limit['next'])
+        limit['next'] = start + 1.0 / limit['rate']
+        return start - now
+
+def _record_success(api, region):
+    global _retry_tokens
+    with _resilience_lock:
+        limit = _rate_limits[(api, region)]
+        limit['rate'] = min(AIMD_MAX_RATE, limit['rate'] + AIMD_INCREASE)
+        if _retry_tokens is not None:
+            _retry_tokens = min(retry_budget, _retry_tokens + RETRY_BUDGET_REFILL)
+
+def _retry_delay(api, region, account_id, e, attempt):
+    """
+    Record a failed request and return the jittered delay before retrying
+    it, or None if it must not be retried.
+    """
+    global _retry_tokens
+    code = _error_code(e)
+    opened = False
+    with _resilience_lock:
+        if _retry_tokens is None:
+            _retry_tokens = retry_budget
+        if code in ACCESS_DENIED_ERRORS and account_id and api in CIRCUIT_BREAKER_APIS:
+            _access_denied[account_id] = _access_denied.get(account_id, 0) + 1
+            if _access_denied[account_id] >= CIRCUIT_BREAKER_THRESHOLD and account_id not in open_circuits:
+                open_circuits[account_id] = f"{code} on {api}"
+                opened = True
+        if code in THROTTLE_ERRORS:
+            limit = _rate_limits[(api, region)]
+            limit['rate'] = max(AIMD_MIN_RATE, limit['rate'] * AIMD_DECREASE)
+            resilience_stats["throttles"] += 1
+        retry = _is_retryable(e) and attempt < retry_limit
+        if retry and _retry_tokens < 1:
+            resilience_stats["budget_exhausted"] += 1
+            retry = False
+        elif retry:
+            _retry_tokens -= 1
+            resilience_stats["retries"] += 1
+    if opened:
+        print_both(f"\n  [!] Circuit open for {account_id}: {CIRCUIT_BREAKER_THRESHOLD} AccessDenied errors, skipping its remaining work")
+    if not retry:
+        return None
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+def call_aws(api, region, account_id, method, **kwargs):
+    """
+    Make one AWS request inside its concurrency slot and adaptive rate
+    limit, retrying throttles and transient errors with jittered backoff
+    while the retry budget lasts. account_id feeds the circuit breaker
+    (None for the caller's own account-level calls).
+    """
+    attempt = 0
+    while True:
+        check_circuit(account_id)
+        wait = _reserve_rate_slot(api, region)
+        if wait > 0:
+            add_phase_time('rate_limit_wait', wait)
+            time.sleep(wait)
         try:
-            return pd.read_csv(cache_file)
-        except:
-            return pd.DataFrame()
-    else:
-        return pd.DataFrame()
-
-def save_to_cache(df, cache_file):
-    df.to_csv(cache_file, index=False)
+            with api_slot(api, region):
+                start = time.perf_counter()
+                try:
+                    response = method(**kwargs)
+                finally:
+                    seconds = time.perf_counter() - start
+        except Exception as e:
+            record_call(api, region, account_id, seconds, e)
+            delay = _retry_delay(api, region, account_id, e, attempt)
+            if delay is None:
+                raise
+            record_retry(api, region, account_id)
+            add_phase_time('retry_backoff', delay)
+            attempt += 1
+            time.sleep(delay)
+            continue
+        record_call(api, region, account_id, seconds)
+        _record_success(api, region)
+        return response
+
+def paginate_aws(api, region, account_id, method, token='NextToken', **kwargs):
+    # Follow pagination tokens by hand so every page goes through call_aws
+    while True:
+        page = call_aws(api, region, account_id, method, **kwargs)
+        yield page
+        if not page.get(token):
+            return
+        kwargs[token] = page[token]
+
+# --- Checkpoint Store --- #
+
+CHECKPOINT_BATCH_ROWS = 500  # commit once this many values are pending...
+CHECKPOINT_FLUSH_SECONDS = 2  # ...or this long after the last commit
+
+class CheckpointStore:
+    """
+    Append-only SQLite (WAL) store of fetched values keyed by
+    (account, region, month, metric), plus the finished account/region
+    units and finalized (closed) months. Keys are indexed in memory at
+    open so resume lookups are O(1); writes are batched into atomic
+    transactions and are safe to call from any worker thread.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        with timed('cache_io'):
+            self._open(path)
+        self.pending_values = []
+        self.pending_units = []
+        self.pending_final = []
+        self.last_flush = time.time()
+
+    def _open(self, path):
+        # Shard processes on one host may share the file; wait out their commits
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS metrics ("
+            " account TEXT, region TEXT, month TEXT, metric TEXT, value REAL,"
+            " PRIMARY KEY (account, region, month, metric)) WITHOUT ROWID"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS units ("
+            " account TEXT, region TEXT, PRIMARY KEY (account, region)) WITHOUT ROWID"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS finalized ("
+            " account TEXT, region TEXT, month TEXT, PRIMARY KEY (account, region, month)) WITHOUT ROWID"
+        )
+        self.values = {
+            (account, region, month, metric): value
+            for account, region, month, metric, value in self.conn.execute("SELECT * FROM metrics")
+        }
+        self.done_units = set(self.conn.execute("SELECT account, region FROM units"))
+        self.final_months = set(self.conn.execute("SELECT account, region, month FROM finalized"))
+
+    def __len__(self):
+        return len(self.values)
+
+    def get(self, account, region, month, metric):
+        return self.values.get((account, region, month, metric))
+
+    def metric_rows(self, metric, months, regions=None, accounts=None):
+        with self.lock:
+            return [
+                (account, region, month, value)
+                for (account, region, month, key_metric), value in self.values.items()
+                if key_metric == metric and month in months
+                and (regions is None or region in regions) and (accounts is None or account in accounts)
+            ]
+
+    def unit_done(self, account, region):
+        return (account, region) in self.done_units
+
+    def is_final(self, account, region, month):
+        return (account, region, month) in self.final_months
+
+    def put(self, rows, unit=None, finalized=()):
+        """
+        Queue (account, region, month, metric, value) rows, and optionally
+        mark an (account, region) unit finished and (account, region, month)
+        keys finalized in the same transaction.
+        """
+        with self.lock:
+            for account, region, month, metric, value in rows:
+                self.values[(account, region, month, metric)] = value
+                self.pending_values.append((account, region, month, metric, value))
+            if unit:
+                self.done_units.add(unit)
+                self.pending_units.append(unit)
+            for key in finalized:
+                self.final_months.add(key)
+                self.pending_final.append(key)
+            if len(self.pending_values) >= CHECKPOINT_BATCH_ROWS or time.time() - self.last_flush >= CHECKPOINT_FLUSH_SECONDS:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if self.pending_values or self.pending_units or self.pending_final:
+            with timed('cache_io'), self.conn:
+                self.conn.execute("BEGIN")
+                self.conn.executemany("INSERT OR REPLACE INTO metrics VALUES (?, ?, ?, ?, ?)", self.pending_values)
+                self.conn.executemany("INSERT OR REPLACE INTO units VALUES (?, ?)", self.pending_units)
+                self.conn.executemany("INSERT OR REPLACE INTO finalized VALUES (?, ?, ?)", self.pending_final)
+            self.pending_values = []
+            self.pending_units = []
+            self.pending_final = []
+        self.last_flush = time.time()
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            self.conn.close()
+
+checkpoints = None
+_checkpoint_lock = threading.Lock()
+
+def get_checkpoints():
+    global checkpoints
+    with _checkpoint_lock:
+        if checkpoints is None:
+            checkpoints = CheckpointStore(CHECKPOINT_FILE)
+        return checkpoints
+
+# Long-lived store of per-month values that survives successful runs.
+# Closed months are marked finalized once CloudWatch has settled and are
+# never fetched again in --incremental mode.
+history = None
+HISTORY_SETTLE_HOURS = 24
+# Cost Explorer keeps revising a closed month's usage for several days
+DTO_SETTLE_HOURS = 96
+
+def get_history():
+    global history
+    with _checkpoint_lock:
+        if history is None:
+            history = CheckpointStore(HISTORY_FILE)
+        return history
+
+def remove_store_files(path):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+def remove_checkpoint_files():
+    global checkpoints
+    if checkpoints is not None:
+        checkpoints.close()
+        checkpoints = None
+    remove_store_files(CHECKPOINT_FILE)
 
 # ----------- Utility Functions ------------
 
-def get_monthly_ranges(months_back=12):
-    now = datetime.now(timezone.utc)
-    end = now.replace(day=1)
+def get_monthly_ranges(months_back=12, now=None):
+    from dateutil.relativedelta import relativedelta
+    now = now or datetime.now(timezone.utc)
+    end = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     ranges = [
         (
-            end - dateutil.relativedelta.relativedelta(months=i + 1),
-            end - dateutil.relativedelta.relativedelta(months=i)
+            end - relativedelta(months=i + 1),
+            end - relativedelta(months=i)
         )
         for i in range(months_back)
     ][::-1]
     ranges.append((end, now))
     return ranges
 
+def get_region_list():
+    """
+    Regions offered by the prompt and used for 'all': the list cached in
+    REGIONS_FILE, else DEFAULT_REGIONS. Only --refresh-regions calls
+    describe_regions (once per process) and rewrites the cache.
+    """
+    global refresh_regions
+    if not refresh_regions:
+        try:
+            with open(REGIONS_FILE) as f:
+                return json.load(f)['Regions']
+        except FileNotFoundError:
+            return list(DEFAULT_REGIONS)
+        except (ValueError, KeyError) as e:
+            print_both(f"[!] Ignoring unreadable {REGIONS_FILE}: {e}")
+            return list(DEFAULT_REGIONS)
+
+    ec2 = get_client('ec2')
+    regions = sorted(r['RegionName'] for r in call_aws('describe_regions', 'global', None, ec2.describe_regions)['Regions'])
+    tmp_file = REGIONS_FILE + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump({'RefreshedAt': datetime.now(timezone.utc).isoformat(), 'Regions': regions}, f, indent=2)
+    os.replace(tmp_file, REGIONS_FILE)
+    print_both(f"[✓] Refreshed {len(regions)} enabled regions into {REGIONS_FILE}")
+    refresh_regions = False
+    return regions
+
+def resolve_regions(value):
+    if value.strip().lower() == 'all':
+        return get_region_list()
+    return [r.strip() for r in value.split(',') if r.strip()]
+
 def prompt_for_regions():
-    ec2 = boto3.client('ec2')
-    all_regions = [r['RegionName'] for r in ec2.describe_regions()['Regions']]
+    all_regions = get_region_list()
     print_both("\nSelect a region to query:")
     print_both("0) All regions")
     for i, r in enumerate(all_regions, start=1):
@@ -81,78 +671,226 @@ def prompt_for_regions():
 
 def get_all_accounts():
     try:
-        org = boto3.client('organizations')
+        org = get_client('organizations')
         accounts = []
-        paginator = org.get_paginator('list_accounts')
-        for page in paginator.paginate():
+        for page in paginate_aws('list_accounts', 'global', None, org.list_accounts):
             for acct in page['Accounts']:
                 if acct['Status'] == 'ACTIVE':
                     accounts.append(acct['Id'])
         return accounts
     except Exception as e:
         print_both(f"[!] Failed to list AWS accounts via Organizations: {e}")
+        if not interactive:
+            raise
         ids = input("Enter comma-separated list of AWS Account IDs to check: ").strip()
         return [a.strip() for a in ids.split(',') if a.strip()]
 
-def assume_role(account_id, role_name):
-    sts = boto3.client('sts')
+def _credentials_valid(credentials):
+    remaining = (credentials['Expiration'] - datetime.now(timezone.utc)).total_seconds()
+    return remaining > CREDENTIAL_REFRESH_MARGIN
+
+def load_credential_cache():
+    if not persist_credentials or not os.path.exists(CREDENTIAL_CACHE_FILE):
+        return
     try:
-        response = sts.assume_role(
-            RoleArn=f"arn:aws:iam::{account_id}:role/{role_name}",
-            RoleSessionName="OrgNATMetricsSession"
-        )
-        creds = response['Credentials']
-        return boto3.Session(
-            aws_access_key_id=creds['AccessKeyId'],
-            aws_secret_access_key=creds['SecretAccessKey'],
-            aws_session_token=creds['SessionToken']
-        )
+        with timed('cache_io'), open(CREDENTIAL_CACHE_FILE) as f:
+            data = json.load(f)
+        loaded = 0
+        for key, creds in data.items():
+            account_id, _, role_name = key.partition('/')
+            creds['Expiration'] = datetime.fromisoformat(creds['Expiration'])
+            if _credentials_valid(creds):
+                _credential_cache[(account_id, role_name)] = creds
+                loaded += 1
+        print_both(f"[✓] Loaded {loaded} cached role credentials from {CREDENTIAL_CACHE_FILE}")
     except Exception as e:
-        print_both(f"  [!] Failed to assume role in {account_id}: {e}")
-        return None
+        print_both(f"[!] Ignoring unreadable credential cache {CREDENTIAL_CACHE_FILE}: {e}")
+
+def save_credential_cache():
+    # Called with _credential_lock held. Written 0600 and swapped in atomically
+    # so a crash never leaves a partial (or world-readable) file behind.
+    data = {
+        f"{account_id}/{role_name}": {
+            'AccessKeyId': creds['AccessKeyId'],
+            'SecretAccessKey': creds['SecretAccessKey'],
+            'SessionToken': creds['SessionToken'],
+            'Expiration': creds['Expiration'].isoformat(),
+        }
+        for (account_id, role_name), creds in _credential_cache.items()
+    }
+    tmp_file = CREDENTIAL_CACHE_FILE + '.tmp'
+    with timed('cache_io'):
+        fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_file, CREDENTIAL_CACHE_FILE)
+
+def _request_role_credentials(sts, account_id, role_name):
+    request = {
+        'RoleArn': f"arn:aws:iam::{account_id}:role/{role_name}",
+        'RoleSessionName': "OrgNATMetricsSession",
+    }
+    try:
+        return call_aws('sts', 'global', account_id, sts.assume_role, DurationSeconds=role_duration, **request)['Credentials']
+    except Exception as e:
+        # Roles default to a 1 hour maximum session; fall back if the longer
+        # duration is rejected.
+        if role_duration == 3600 or 'DurationSeconds' not in str(e):
+            raise
+    return call_aws('sts', 'global', account_id, sts.assume_role, **request)['Credentials']
 
-def discover_nat_ids(cw):
+def assume_role(account_id, role_name):
+    """
+    Return STS credentials for the role, reusing cached ones until shortly
+    before they expire. Accounts that fail are remembered and skipped.
+    """
+    key = (account_id, role_name)
+    with _credential_lock:
+        if key in _failed_roles:
+            return None
+        role_lock = _role_locks.setdefault(key, threading.Lock())
+
+    with role_lock:
+        if key in _failed_roles:
+            return None
+        cached = _credential_cache.get(key)
+        if cached and _credentials_valid(cached):
+            return cached
+
+        try:
+            creds = _request_role_credentials(get_client('sts'), account_id, role_name)
+        except Exception as e:
+            print_both(f"  [!] Failed to assume role in {account_id}: {e}")
+            with _credential_lock:
+                _failed_roles[key] = str(e)
+            record_missing(account_id, '*', f"could not assume {role_name}: {e}")
+            return None
+
+        if cached:
+            drop_clients(cached)
+        with _credential_lock:
+            _credential_cache[key] = creds
+            if persist_credentials:
+                try:
+                    save_credential_cache()
+                except Exception as e:
+                    print_both(f"  [!] Could not persist credential cache: {e}")
+        return creds
+
+def discover_nat_ids(cw, account_id=None):
     seen = set()
-    paginator = cw.get_paginator('list_metrics')
-    for page in paginator.paginate(Namespace=NAMESPACE_NAT, MetricName=METRIC_NAT_UPLOAD):
+    pages = paginate_aws('list_metrics', cw.meta.region_name, account_id, cw.list_metrics,
+                         Namespace=NAMESPACE_NAT, MetricName=METRIC_NAT_UPLOAD)
+    for page in pages:
         for metric in page['Metrics']:
             for d in metric['Dimensions']:
                 if d['Name'] == 'NatGatewayId':
                     seen.add(d['Value'])
-    return list(seen)
-
-def get_metric_sum(cw, namespace, metric_name, dimensions, start, end):
-    try:
-        resp = cw.get_metric_statistics(
-            Namespace=namespace,
-            MetricName=metric_name,
-            Dimensions=dimensions,
-            StartTime=start,
-            EndTime=end,
-            Period=PERIOD,
-            Statistics=['Sum']
+    return sorted(seen)
+
+def build_nat_metric_queries(nat_ids):
+    queries = []
+    query_map = {}
+    for i, nat_id in enumerate(nat_ids):
+        for prefix, metric_name in (("u", METRIC_NAT_UPLOAD), ("d", METRIC_NAT_DOWNLOAD)):
+            query_id = f"{prefix}{i}"
+            queries.append({
+                'Id': query_id,
+                'MetricStat': {
+                    'Metric': {
+                        'Namespace': NAMESPACE_NAT,
+                        'MetricName': metric_name,
+                        'Dimensions': [{'Name': 'NatGatewayId', 'Value': nat_id}]
+                    },
+                    'Period': PERIOD,
+                    'Stat': 'Sum'
+                },
+                'ReturnData': True
+            })
+            query_map[query_id] = (nat_id, metric_name)
+    return queries, query_map
+
+def add_metric_results(monthly, results, query_map, months, unit=None):
+    """
+    Bucket GetMetricData datapoints into the month windows they fall in as
+    each page arrives. Datapoints come back in ascending order
+    (ScanBy=TimestampAscending), so each month is one slice found by
+    bisection and summed without a per-datapoint Python loop. In daily
+    mode the datapoints are also kept per gateway for the (account, region)
+    unit, and with --export the monthly sums are.
+    """
+    labels = [start.strftime('%Y-%m') for start, _ in months]
+    per_gateway = result_export.unit_bytes(unit, labels) if result_export is not None and unit else None
+    for result in results:
+        nat_id, metric_name = query_map[result['Id']]
+        col = 0 if metric_name == METRIC_NAT_UPLOAD else 1
+        timestamps, values = result['Timestamps'], result['Values']
+        if per_gateway is not None:
+            # Gateways without datapoints are exported as zero rows
+            for label in labels:
+                per_gateway[label].setdefault(nat_id, [0.0, 0.0])
+        if not timestamps:
+            continue
+        if unit:
+            record_gateway_datapoints(unit[0], unit[1], nat_id, timestamps[0], timestamps[-1])
+        if gateway_series is not None and unit:
+            gateway_series.add(unit[0], unit[1], nat_id, col, timestamps, values)
+        for label, (start, end) in zip(labels, months):
+            lo = bisect.bisect_left(timestamps, start)
+            hi = bisect.bisect_left(timestamps, end, lo)
+            if hi > lo:
+                month_bytes = sum(values[lo:hi])
+                monthly[label][col] += month_bytes
+                if per_gateway is not None:
+                    per_gateway[label][nat_id][col] += month_bytes
+
+def get_nat_monthly_bytes(cw, nat_ids, months, account_id=None):
+    """
+    Fetch BytesInFromSource/BytesInFromDestination for every gateway over all
+    month windows with batched GetMetricData calls (up to 500 queries each) and
+    bucket the daily datapoints into months locally.
+    Returns {month_label: [upload_bytes, download_bytes]}; raises if any
+    batch fails so partial sums are never mistaken for complete ones.
+    """
+    monthly = {start.strftime('%Y-%m'): [0.0, 0.0] for start, _ in months}
+    if not nat_ids or not months:
+        return monthly
+
+    queries, query_map = build_nat_metric_queries(nat_ids)
+    with stats_lock:
+        metric_call_stats["legacy"] += len(queries) * len(months)
+    for i in range(0, len(queries), MAX_METRIC_QUERIES):
+        pages = paginate_aws(
+            'get_metric_data', cw.meta.region_name, account_id, cw.get_metric_data,
+            MetricDataQueries=queries[i:i + MAX_METRIC_QUERIES],
+            StartTime=months[0][0],
+            EndTime=months[-1][1],
+            ScanBy='TimestampAscending'
         )
-        return sum(dp['Sum'] for dp in resp.get('Datapoints', []))
-    except:
-        return 0
+        for page in pages:
+            with stats_lock:
+                metric_call_stats["batched"] += 1
+            add_metric_results(monthly, page['MetricDataResults'], query_map, months, (account_id, cw.meta.region_name))
+    return monthly
 
 # ------------ Main Query Functions ------------
 def is_management_account():
     try:
-        org = boto3.client('organizations')
-        identity = boto3.client('sts').get_caller_identity()
-        response = org.describe_organization()
+        org = get_client('organizations')
+        identity = call_aws('sts', 'global', None, get_client('sts').get_caller_identity)
+        response = call_aws('organizations', 'global', None, org.describe_organization)
         return identity['Account'] == response['Organization']['MasterAccountId']
     except Exception:
         return False
     
 def get_dto_month_ranges():
+    from dateutil.relativedelta import relativedelta
     now = datetime.now(timezone.utc)
-    end = now.replace(day=1)
+    end = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     ranges = [
         (
-            (end - dateutil.relativedelta.relativedelta(months=i + 1)).strftime('%Y-%m-%d'),
-            (end - dateutil.relativedelta.relativedelta(months=i)).strftime('%Y-%m-%d')
+            (end - relativedelta(months=i + 1)).strftime('%Y-%m-%d'),
+            (end - relativedelta(months=i)).strftime('%Y-%m-%d')
         )
         for i in range(12)
     ][::-1]
@@ -162,305 +900,1115 @@ def get_dto_month_ranges():
     ))
     return ranges
 
-def run_dto_query(use_org, regions):
-    global dto_cache_df  # <-- move this to top
-    ce = boto3.client('ce')
+def ce_pages(method, **kwargs):
+    # Cost Explorer pages by NextPageToken rather than NextToken
+    for response in paginate_aws('ce', 'global', None, method, token='NextPageToken', **kwargs):
+        with stats_lock:
+            metric_call_stats["ce"] += 1
+        yield response
+
+def get_dto_usage_types(ce, time_period):
+    usage_types = set()
+    for page in ce_pages(ce.get_dimension_values, TimePeriod=time_period, Dimension='USAGE_TYPE', SearchString='DataTransfer-Out-Bytes'):
+        for value in page['DimensionValues']:
+            if DTO_USAGE_TYPE_PATTERN.match(value['Value']):
+                usage_types.add(value['Value'])
+    return sorted(usage_types)
+
+def fetch_dto_usage(ce, start, end, regions):
+    """
+    One MONTHLY get_cost_and_usage query over the whole window, grouped by
+    linked account and region. Returns [(account, region, month, gb), ...].
+    """
+    time_period = {"Start": start, "End": end}
+    usage_types = get_dto_usage_types(ce, time_period)
+    if not usage_types:
+        return []
+    rows = []
+    pages = ce_pages(
+        ce.get_cost_and_usage,
+        TimePeriod=time_period,
+        Granularity="MONTHLY",
+        Metrics=["UsageQuantity"],
+        Filter={"And": [
+            {"Dimensions": {"Key": "USAGE_TYPE", "Values": usage_types}},
+            {"Dimensions": {"Key": "REGION", "Values": list(regions)}},
+            {"Not": {"Dimensions": {"Key": "SERVICE", "Values": DTO_EXCLUDED_SERVICES}}},
+        ]},
+        GroupBy=[
+            {"Type": "DIMENSION", "Key": "LINKED_ACCOUNT"},
+            {"Type": "DIMENSION", "Key": "REGION"},
+        ]
+    )
+    for page in pages:
+        for result in page['ResultsByTime']:
+            month_label = result['TimePeriod']['Start'][:7]
+            for group in result.get('Groups', []):
+                account_id, region = group['Keys']
+                gb = float(group['Metrics']['UsageQuantity'].get("Amount", 0))
+                rows.append((account_id, region, month_label, gb))
+    return rows
+
+def run_dto_query(use_org, regions, accounts=None):
+    """
+    DTO usage per account/region/month for the selected regions (and, in Org
+    mode, accounts). Cached values are kept per caller (payer) account and
+    months are finalized per payer and region set, so a run with another
+    profile or --regions never reuses months fetched for a different scope.
+    """
+    store = get_checkpoints()
     month_ranges = get_dto_month_ranges()
-    dto_monthly = {}
+    month_labels = [start[:7] for start, _ in month_ranges]
+    wanted_regions = set(regions)
+    wanted_accounts = set(accounts) if use_org and accounts else None
 
     try:
-        for start, end in month_ranges:
-            month_label = start[:7]
-
-            # --- RESUME CHECK ---
-            if resume_mode:
-                cached = dto_cache_df[dto_cache_df['Month'] == month_label]
-                if not cached.empty:
-                    dto_monthly[month_label] = cached.iloc[0]['GB']
-                    continue
-            # --------------------
-
-            response = ce.get_cost_and_usage(
-                TimePeriod={"Start": start, "End": end},
-                Granularity="MONTHLY",
-                Metrics=["UsageQuantity"],
-                Filter={
-                    "Dimensions": {
-                        "Key": "USAGE_TYPE",
-                        "Values": ["DataTransfer-Out-Bytes"]
-                    }
-                }
-            )
-            gb = float(response['ResultsByTime'][0]['Total']['UsageQuantity'].get("Amount", 0))
-            dto_monthly[month_label] = gb
-
-            # --- CACHE SAVE ---
-            new_row = pd.DataFrame([{'Month': month_label, 'GB': gb}])
-            dto_cache_df = pd.concat([dto_cache_df, new_row], ignore_index=True)
-            save_to_cache(dto_cache_df, DTO_CACHE_FILE)
-            # -----------------
-
+        payer = call_aws('sts', 'global', None, get_client('sts').get_caller_identity)['Account']
+        metric = f"{METRIC_DTO}@{payer}"
+        unit = (payer, 'DTO:' + ','.join(sorted(wanted_regions)))
+        # --- RESUME CHECK ---
+        if resume_mode and store.unit_done(*unit):
+            dto_rows = store.metric_rows(metric, set(month_labels), wanted_regions, wanted_accounts)
+        # --------------------
+        else:
+            hist = get_history()
+            final = {m for m in month_labels if incremental_mode and hist.is_final(*unit, m)}
+            dto_rows = hist.metric_rows(metric, final, wanted_regions, wanted_accounts)
+            pending = [(start, end) for start, end in month_ranges if start[:7] not in final]
+            # The current month is empty on the 1st; Cost Explorer rejects Start == End
+            if pending and pending[0][0] < pending[-1][1]:
+                fetched = fetch_dto_usage(get_client('ce'), pending[0][0], pending[-1][1], regions)
+                fetched_at = datetime.now(timezone.utc)
+                values = [(a, r, m, metric, gb) for a, r, m, gb in fetched]
+                finalized = [
+                    (*unit, start[:7]) for start, end in pending
+                    if datetime.fromisoformat(end).replace(tzinfo=timezone.utc) + timedelta(hours=DTO_SETTLE_HOURS) <= fetched_at
+                ]
+                # --- CACHE SAVE ---
+                store.put(values, unit=unit)
+                hist.put(values, finalized=finalized)
+                # -----------------
+                dto_rows += [row for row in fetched if wanted_accounts is None or row[0] in wanted_accounts]
     except Exception as e:
         print_both(f"[!] Warning: Failed to retrieve DTO metrics: {e}")
-        return None, {"Total DTO GB": 0, "Average DTO GB per month": 0}
-
-    # Summarize
-    total_dto_gb = sum(dto_monthly.values())
-    nonzero_months = sum(1 for v in dto_monthly.values() if v > 0)
+        record_missing('DTO', 'all regions', str(e))
+        return pd.DataFrame(columns=['Account', 'Region', 'Month', 'DTO GB']), {"Total DTO GB": 0, "Average DTO GB per month": 0}
+
+    store.flush()
+    with timed('pandas'):
+        dto_df = pd.DataFrame(dto_rows, columns=['Account', 'Region', 'Month', 'DTO GB'])
+        dto_df = dto_df.sort_values(['Month', 'Account', 'Region'], ignore_index=True)
+    return dto_df, summarize_dto(dto_df)
+
+def summarize_dto(dto_df):
+    with timed('pandas'):
+        dto_monthly = dto_df.groupby('Month')['DTO GB'].sum()
+    total_dto_gb = float(dto_monthly.sum())
+    nonzero_months = int((dto_monthly > 0).sum())
     avg_dto_gb = total_dto_gb / nonzero_months if nonzero_months > 0 else 0
 
-    return dto_monthly, {
+    return {
         "Total DTO GB": round(total_dto_gb, 2),
         "Average DTO GB per month": round(avg_dto_gb, 2)
     }
 
-def run_single_account_query(regions, include_dto):
-    global nat_cache_df  # <-- ADD THIS AT TOP
-    session = boto3.Session()
-    account_id = boto3.client('sts').get_caller_identity()['Account']
-    cw_clients = {region: session.client('cloudwatch', region_name=region) for region in regions}
-    months = get_monthly_ranges()
-    nat_results = []
-    dto_results = []
-
-    start_time = time.time()
-    total_steps = len(months)
-
-    for i, (start, end) in enumerate(months):
-        month_label = start.strftime('%Y-%m')
-        step_label = f"Processing month: {month_label} ({i+1}/{total_steps})"
-
-        for region in regions:
-            cw = cw_clients[region]
-            nat_ids = discover_nat_ids(cw)
-            if not nat_ids:
-                continue
+# ------------ NAT Gateway Inventory ------------
+
+# Persistent index of NAT gateways per account/region, merged from
+# describe_nat_gateways (which also returns recently deleted gateways),
+# list_metrics and every previous run:
+# {account_id: {'EnabledRegions': {'RefreshedAt': ..., 'Regions': [...]},
+#               'Regions': {region: {'RefreshedAt': ..., 'Gateways': {nat_id: {...}}}}}}
+# RefreshedAt is None while a pair has never been fully refreshed.
+nat_inventory = {}
+inventory_ttl_hours = 24
+inventory_lock = threading.Lock()
+
+def load_inventory():
+    global nat_inventory
+    if not os.path.exists(INVENTORY_FILE):
+        return
+    try:
+        with timed('cache_io'), open(INVENTORY_FILE) as f:
+            data = json.load(f)
+        if data.get('Version') == INVENTORY_VERSION:
+            nat_inventory = data['Accounts']
+            print_both(f"[✓] Loaded NAT Gateway inventory for {len(nat_inventory)} accounts from {INVENTORY_FILE}")
+    except Exception as e:
+        print_both(f"[!] Ignoring unreadable inventory {INVENTORY_FILE}: {e}")
+
+def save_inventory():
+    with inventory_lock:
+        data = json.dumps({'Version': INVENTORY_VERSION, 'Accounts': nat_inventory}, indent=2)
+    tmp_file = INVENTORY_FILE + '.tmp'
+    with timed('cache_io'):
+        with open(tmp_file, 'w') as f:
+            f.write(data)
+        os.replace(tmp_file, INVENTORY_FILE)
+
+def merge_inventory(accounts):
+    """
+    Fold another inventory's accounts (e.g. a shard's) into nat_inventory,
+    keeping the newest refresh of each region and the union of gateways.
+    """
+    with inventory_lock:
+        for account_id, account in accounts.items():
+            known = nat_inventory.setdefault(account_id, {})
+            enabled = account.get('EnabledRegions')
+            if enabled and (enabled.get('RefreshedAt') or '') > ((known.get('EnabledRegions') or {}).get('RefreshedAt') or ''):
+                known['EnabledRegions'] = enabled
+            for region, entry in account.get('Regions', {}).items():
+                target = known.setdefault('Regions', {}).setdefault(region, {'RefreshedAt': None, 'Gateways': {}})
+                if (entry.get('RefreshedAt') or '') > (target.get('RefreshedAt') or ''):
+                    target['RefreshedAt'] = entry['RefreshedAt']
+                for nat_id, gw in entry.get('Gateways', {}).items():
+                    current = target['Gateways'].get(nat_id)
+                    if current is None:
+                        target['Gateways'][nat_id] = dict(gw)
+                        continue
+                    older, newer = sorted((current, gw), key=lambda g: g.get('LastSeen') or '')
+                    merged = dict(older, **newer)
+                    merged['FirstSeen'] = min(current['FirstSeen'], gw['FirstSeen'])
+                    merged['Sources'] = list(dict.fromkeys(current.get('Sources', []) + gw.get('Sources', [])))
+                    for field, pick in (('FirstDatapoint', min), ('LastDatapoint', max)):
+                        seen = [g[field] for g in (current, gw) if g.get(field)]
+                        if seen:
+                            merged[field] = pick(seen)
+                    target['Gateways'][nat_id] = merged
+
+def _is_fresh(entry):
+    if not entry or not entry.get('RefreshedAt'):
+        return False
+    age = datetime.now(timezone.utc) - datetime.fromisoformat(entry['RefreshedAt'])
+    return age.total_seconds() < inventory_ttl_hours * 3600
+
+def _region_entry(account_id, region):
+    # Caller holds inventory_lock
+    regions = nat_inventory.setdefault(account_id, {}).setdefault('Regions', {})
+    return regions.setdefault(region, {'RefreshedAt': None, 'Gateways': {}})
+
+def region_inventory_fresh(account_id, region):
+    with inventory_lock:
+        return _is_fresh(nat_inventory.get(account_id, {}).get('Regions', {}).get(region))
+
+def record_gateways(account_id, region, gateways, source):
+    now = datetime.now(timezone.utc).isoformat()
+    with inventory_lock:
+        known_gateways = _region_entry(account_id, region)['Gateways']
+        for gw in gateways:
+            known = known_gateways.setdefault(gw['NatGatewayId'], {'FirstSeen': now, 'Sources': []})
+            known['LastSeen'] = now
+            for field in ('State', 'VpcId', 'NetworkInterfaceIds', 'CreateTime', 'DeleteTime'):
+                if gw.get(field):
+                    known[field] = gw[field]
+            if source not in known['Sources']:
+                known['Sources'].append(source)
+
+def record_gateway_datapoints(account_id, region, nat_id, first, last):
+    """
+    Widen the span of CloudWatch datapoints seen for a gateway. It bounds
+    the lifetime of gateways DescribeNatGateways never returned.
+    """
+    first, last = first.isoformat(), last.isoformat()
+    with inventory_lock:
+        entry = nat_inventory.get(account_id, {}).get('Regions', {}).get(region) or {}
+        gw = entry.get('Gateways', {}).get(nat_id)
+        if gw is None:
+            return
+        gw['FirstDatapoint'] = min(first, gw.get('FirstDatapoint', first))
+        gw['LastDatapoint'] = max(last, gw.get('LastDatapoint', last))
+
+def mark_region_refreshed(account_id, region, refreshed_at):
+    # refreshed_at is taken before the refresh, so every gateway it saw has
+    # LastSeen >= RefreshedAt and older ones are known to be gone
+    with inventory_lock:
+        _region_entry(account_id, region)['RefreshedAt'] = refreshed_at
+
+def inventory_nat_ids(account_id, region, since):
+    """
+    Gateway IDs known for the pair that may have traffic after `since`,
+    including gateways that have since been deleted.
+    """
+    since = since.astimezone(timezone.utc).isoformat()
+    with inventory_lock:
+        entry = nat_inventory.get(account_id, {}).get('Regions', {}).get(region)
+        if not entry:
+            return []
+        return sorted(
+            nat_id for nat_id, gw in entry['Gateways'].items()
+            if (gw.get('DeleteTime') or gw['LastSeen']) >= since
+        )
 
-            upload = download = 0
-            for nat_id in nat_ids:
-                upload += get_metric_sum(cw, NAMESPACE_NAT, METRIC_NAT_UPLOAD, [{'Name': 'NatGatewayId', 'Value': nat_id}], start, end)
-                download += get_metric_sum(cw, NAMESPACE_NAT, METRIC_NAT_DOWNLOAD, [{'Name': 'NatGatewayId', 'Value': nat_id}], start, end)
-
-            upload_gb = round(upload / (1024**3), 2)
-            download_gb = round(download / (1024**3), 2)
-            total_gb = round(upload_gb + download_gb, 2)
-
-            # --- RESUME CHECK ---
-            if resume_mode:
-                existing = nat_cache_df[
-                    (nat_cache_df['Account'] == account_id) &
-                    (nat_cache_df['Region'] == region) &
-                    (nat_cache_df['Month'] == month_label)
-                ]
-                if not existing.empty:
-                    continue
-            # --------------------
-
-            nat_results.append({
-                'Account': account_id,
-                'Region': region,
-                'Month': month_label,
-                'Upload GB': upload_gb,
-                'Download GB': download_gb,
-                'Total GB': total_gb,
+def get_enabled_regions(account_id, credentials):
+    ec2 = get_client('ec2', credentials=credentials)
+    # Without AllRegions, only regions the account has opted into are returned
+    return {r['RegionName'] for r in call_aws('describe_regions', 'global', account_id, ec2.describe_regions)['Regions']}
+
+def describe_region_nat_gateways(account_id, credentials, region):
+    ec2 = get_client('ec2', region, credentials)
+    gateways = []
+    for page in paginate_aws('describe_nat_gateways', region, account_id, ec2.describe_nat_gateways):
+        for gw in page['NatGateways']:
+            gateways.append({
+                'NatGatewayId': gw['NatGatewayId'],
+                'State': gw.get('State'),
+                'VpcId': gw.get('VpcId'),
+                'NetworkInterfaceIds': [a['NetworkInterfaceId'] for a in gw.get('NatGatewayAddresses', []) if 'NetworkInterfaceId' in a],
+                'CreateTime': gw['CreateTime'].astimezone(timezone.utc).isoformat() if gw.get('CreateTime') else None,
+                'DeleteTime': gw['DeleteTime'].astimezone(timezone.utc).isoformat() if gw.get('DeleteTime') else None,
             })
+    return gateways
 
-            # --- CACHE SAVE ---
-            new_row = pd.DataFrame([{
-                'Account': account_id,
-                'Region': region,
-                'Month': month_label,
-                'Upload GB': upload_gb,
-                'Download GB': download_gb,
-                'Total GB': total_gb,
-            }])
-            nat_cache_df = pd.concat([nat_cache_df, new_row], ignore_index=True)
-            save_to_cache(nat_cache_df, NAT_CACHE_FILE)
-            # ------------------
-
-        # Progress bar
-        elapsed = time.time() - start_time
-        remaining = max(0, int((elapsed / (i + 1)) * (total_steps - (i + 1))))
-        bar = "[" + "#" * int((i+1)/total_steps*30) + "-" * (30 - int((i+1)/total_steps*30)) + "]"
-        print_both(f"\r{step_label} {bar} Est. time remaining: {remaining} sec", end="", flush=True)
+def refresh_region_inventory(account_id, region, credentials):
+    started = datetime.now(timezone.utc).isoformat()
+    complete = True
+    try:
+        record_gateways(account_id, region, describe_region_nat_gateways(account_id, credentials, region), 'describe_nat_gateways')
+    except Exception as e:
+        print_both(f"  [!] Could not describe NAT Gateways in {account_id}/{region}: {e}")
+        complete = False
+    try:
+        nat_ids = discover_nat_ids(get_client('cloudwatch', region, credentials), account_id)
+        record_gateways(account_id, region, [{'NatGatewayId': nat_id} for nat_id in nat_ids], 'list_metrics')
+    except Exception as e:
+        print_both(f"  [!] Could not list NAT Gateway metrics in {account_id}/{region}: {e}")
+        complete = False
+    if complete:
+        mark_region_refreshed(account_id, region, started)
+
+def enabled_regions_for(account_id, regions, credentials_for):
+    with inventory_lock:
+        cached = nat_inventory.get(account_id, {}).get('EnabledRegions')
+    if _is_fresh(cached):
+        enabled = set(cached['Regions'])
+    else:
+        credentials = credentials_for(account_id)
+        if credentials is False:
+            return []
+        try:
+            enabled = get_enabled_regions(account_id, credentials)
+        except Exception as e:
+            print_both(f"  [!] Could not list enabled regions for {account_id}, checking all selected regions: {e}")
+            return list(regions)
+        with inventory_lock:
+            nat_inventory.setdefault(account_id, {})['EnabledRegions'] = {
+                'RefreshedAt': datetime.now(timezone.utc).isoformat(),
+                'Regions': sorted(enabled),
+            }
+    return [r for r in regions if r in enabled]
+
+def discover_nat_units(accounts, regions, credentials_for, window_start):
+    """
+    Find the (account, region) pairs that have NAT gateways in the window so
+    only those are scheduled for metric collection. Pairs refreshed within
+    the inventory TTL are answered from the index without any API call;
+    stale pairs are refreshed in parallel. Pairs that could not be fully
+    refreshed are kept so nothing is missed.
+    """
+    pool = get_worker_pool()
+    enabled = pool.map(lambda a: enabled_regions_for(a, regions, credentials_for), accounts)
+    candidates = [(account_id, region) for account_id, account_regions in zip(accounts, enabled) for region in account_regions]
+    stale = [(a, r) for a, r in candidates if not region_inventory_fresh(a, r)]
+
+    def refresh(unit):
+        if unit[0] in open_circuits:
+            return
+        credentials = credentials_for(unit[0])
+        if credentials is not False:
+            refresh_region_inventory(unit[0], unit[1], credentials)
+
+    list(pool.map(refresh, stale))
 
-    print_both()
-    nat_df = pd.DataFrame(nat_results)
-    dto_df = pd.DataFrame(dto_results)
-    return nat_df, dto_df
+    try:
+        save_inventory()
+    except Exception as e:
+        print_both(f"[!] Could not write {INVENTORY_FILE}: {e}")
+
+    units = [
+        (a, r) for a, r in candidates
+        if inventory_nat_ids(a, r, window_start) or not region_inventory_fresh(a, r)
+    ]
+    print_both(f"[✓] Discovery: {len(units)} of {len(accounts) * len(regions)} account/region pairs have NAT Gateways "
+               f"({len(stale)} refreshed, {len(candidates) - len(stale)} from {INVENTORY_FILE})")
+    return units
+
+# ------------ Result Aggregation ------------
+
+class NatAggregator:
+    """
+    Streaming store for NAT usage rows. Each row is appended to compact typed
+    arrays as its unit finishes, keyed by interned account, region and month
+    indexes, and per-month totals are kept up to date as rows arrive, so
+    summaries never need a DataFrame. DataFrames are built only for output.
+    Missing (NaN) rows are kept but left out of the totals. Rows with a
+    total but NaN upload/download (CUR input has no direction) count
+    towards the total only.
+    """
+    def __init__(self):
+        self.accounts, self.account_index = [], {}
+        self.regions, self.region_index = [], {}
+        self.months, self.month_index = [], {}
+        self.account_col = array('I')
+        self.region_col = array('I')
+        self.month_col = array('I')
+        self.upload = array('d')
+        self.download = array('d')
+        self.total = array('d')
+        # Per month index: totals over collected rows and the missing row count
+        self.month_upload = array('d')
+        self.month_download = array('d')
+        self.month_total = array('d')
+        self.month_missing = array('I')
+        self.undirected_rows = 0
+
+    def __len__(self):
+        return len(self.total)
+
+    @staticmethod
+    def _intern(values, index, value):
+        if value not in index:
+            index[value] = len(values)
+            values.append(value)
+        return index[value]
+
+    def add(self, account_id, region, month_label, upload_gb, download_gb, total_gb):
+        month = self.month_index.get(month_label)
+        if month is None:
+            month = self._intern(self.months, self.month_index, month_label)
+            for column in (self.month_upload, self.month_download, self.month_total):
+                column.append(0.0)
+            self.month_missing.append(0)
+        self.account_col.append(self._intern(self.accounts, self.account_index, account_id))
+        self.region_col.append(self._intern(self.regions, self.region_index, region))
+        self.month_col.append(month)
+        self.upload.append(upload_gb)
+        self.download.append(download_gb)
+        self.total.append(total_gb)
+        if total_gb != total_gb:  # NaN marks a missing row
+            self.month_missing[month] += 1
+            return
+        self.month_total[month] += total_gb
+        if upload_gb != upload_gb or download_gb != download_gb:
+            self.undirected_rows += 1
+        else:
+            self.month_upload[month] += upload_gb
+            self.month_download[month] += download_gb
+
+    def add_rows(self, rows):
+        for row in rows:
+            self.add(row['Account'], row['Region'], row['Month'], row['Upload GB'], row['Download GB'], row['Total GB'])
+
+    @classmethod
+    def from_frame(cls, df):
+        aggregator = cls()
+        for row in df[NAT_COLUMNS].itertuples(index=False):
+            aggregator.add(*row)
+        return aggregator
+
+    def summary(self):
+        """
+        Totals and non-zero-month averages over the last 12 months seen.
+        """
+        last_12 = sorted(range(len(self.months)), key=lambda m: self.months[m])[-12:]
+        nonzero = [m for m in last_12 if self.month_total[m] > 0]
+        total_nat_gb = sum(self.month_total[m] for m in nonzero)
+        total_nat_upload = sum(self.month_upload[m] for m in nonzero)
+        total_nat_download = sum(self.month_download[m] for m in nonzero)
+        months_nonzero = len(nonzero)
+
+        avg_nat_gb = total_nat_gb / months_nonzero if months_nonzero > 0 else 0
+        avg_nat_upload = total_nat_upload / months_nonzero if months_nonzero > 0 else 0
+        avg_nat_download = total_nat_download / months_nonzero if months_nonzero > 0 else 0
+
+        return {
+            "Missing NAT rows": sum(self.month_missing[m] for m in last_12),
+            "Directional": self.undirected_rows == 0,
+            "Total NAT GB": total_nat_gb,
+            "Total NAT Upload GB": total_nat_upload,
+            "Total NAT Download GB": total_nat_download,
+            "Average NAT Upload GB per month": avg_nat_upload,
+            "Average NAT Download GB per month": avg_nat_download,
+            "Average NAT GB per month": avg_nat_gb
+        }
 
-def run_org_query(accounts, role_name, regions, include_dto):
-    global nat_cache_df  # <-- ADD THIS AT TOP
-    months = get_monthly_ranges()
-    nat_results = []
+    def to_frame(self, accounts=None, regions=None):
+        """
+        Build the output DataFrame, ordered by month, then by the account and
+        region order the user asked for, so output is deterministic.
+        """
+        def ranks(values, order):
+            position = {v: i for i, v in enumerate(order or sorted(values))}
+            return np.array([position.get(v, len(position)) for v in values], dtype=np.int64)
+
+        account_col = np.asarray(self.account_col, dtype=np.int64)
+        region_col = np.asarray(self.region_col, dtype=np.int64)
+        month_col = np.asarray(self.month_col, dtype=np.int64)
+        order = np.lexsort((
+            ranks(self.regions, regions)[region_col] if len(self) else region_col,
+            ranks(self.accounts, accounts)[account_col] if len(self) else account_col,
+            ranks(self.months, None)[month_col] if len(self) else month_col,
+        ))
+        return pd.DataFrame({
+            'Account': np.array(self.accounts, dtype=object)[account_col[order]] if len(self) else [],
+            'Region': np.array(self.regions, dtype=object)[region_col[order]] if len(self) else [],
+            'Month': np.array(self.months, dtype=object)[month_col[order]] if len(self) else [],
+            'Upload GB': np.asarray(self.upload)[order],
+            'Download GB': np.asarray(self.download)[order],
+            'Total GB': np.asarray(self.total)[order],
+        }, columns=NAT_COLUMNS)
+
+class GatewaySeries:
+    """
+    Per-gateway daily bytes for --granularity daily: one (gateway x day)
+    float array per direction, rows indexed by interned
+    (account, region, gateway) keys and grown by doubling. Days without a
+    datapoint stay NaN so the statistics skip them.
+    """
+    def __init__(self, months):
+        self.origin = months[0][0].replace(hour=0, minute=0, second=0, microsecond=0)
+        self.days = (months[-1][1] - self.origin).days + 1
+        self.month_labels = [start.strftime('%Y-%m') for start, _ in months]
+        self.month_starts = [(start.date() - self.origin.date()).days for start, _ in months]
+        self.keys, self.index = [], {}
+        self.values = np.full((2, 64, self.days), np.nan)  # [upload/download, gateway, day]
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _row(self, key):
+        # Caller holds self.lock
+        if key not in self.index:
+            if len(self.keys) == self.values.shape[1]:
+                grown = np.full((2, 2 * len(self.keys), self.days), np.nan)
+                grown[:, :len(self.keys)] = self.values
+                self.values = grown
+            self.index[key] = len(self.keys)
+            self.keys.append(key)
+        return self.index[key]
+
+    def add(self, account_id, region, nat_id, col, timestamps, values):
+        days = np.fromiter(((ts - self.origin).days for ts in timestamps), dtype=np.int64, count=len(timestamps))
+        values = np.asarray(values, dtype=float)
+        keep = (days >= 0) & (days < self.days)
+        days, values = days[keep], values[keep]
+        with self.lock:
+            series = self.values[col, self._row((account_id, region, nat_id))]
+            series[days] = np.nan_to_num(series[days]) + values
+
+    def _daily_gb(self):
+        """
+        (egress, total) daily GB per gateway; NaN where neither direction
+        has a datapoint.
+        """
+        count = len(self.keys)
+        upload = self.values[0, :count] / (1024**3)
+        download = self.values[1, :count] / (1024**3)
+        empty = np.isnan(upload) & np.isnan(download)
+        egress = np.where(empty, np.nan, np.nan_to_num(upload))
+        total = np.where(empty, np.nan, np.nan_to_num(upload) + np.nan_to_num(download))
+        return egress, total
+
+    def stats_frame(self):
+        """
+        Peak day, p95 daily egress, average daily traffic, last full month
+        egress and month-over-month egress growth for every gateway,
+        computed over the whole fleet at once.
+        """
+        columns = ['Account', 'Region', 'Gateway', 'Peak Day', 'Peak Day GB', 'P95 Daily Egress GB',
+                   'Avg Daily GB', 'Last Month Egress GB', 'MoM Growth %']
+        egress, total = self._daily_gb()
+        has_data = ~np.isnan(total).all(axis=1)
+        if not has_data.any():
+            return pd.DataFrame(columns=columns)
+        egress, total = egress[has_data], total[has_data]
+        keys = [key for key, keep in zip(self.keys, has_data) if keep]
+
+        peak = np.where(np.isnan(total), -np.inf, total).argmax(axis=1)
+        peak_gb = total[np.arange(len(keys)), peak]
+        peak_day = (np.datetime64(self.origin.date()) + peak).astype(str)
+        p95_egress = np.nanpercentile(egress, 95, axis=1)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            avg_daily = np.nanmean(total, axis=1)
+
+        # Sum each month's days; the last month is still open, so growth
+        # compares the two most recent full months.
+        monthly_egress = np.add.reduceat(np.nan_to_num(egress), self.month_starts, axis=1)
+        if monthly_egress.shape[1] >= 3:
+            last, previous = monthly_egress[:, -2], monthly_egress[:, -3]
+        else:
+            last, previous = monthly_egress[:, -1], np.zeros(len(keys))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            growth = np.where(previous > 0, (last - previous) / previous * 100, np.nan)
+
+        return pd.DataFrame({
+            'Account': [k[0] for k in keys],
+            'Region': [k[1] for k in keys],
+            'Gateway': [k[2] for k in keys],
+            'Peak Day': peak_day,
+            'Peak Day GB': peak_gb.round(2),
+            'P95 Daily Egress GB': p95_egress.round(2),
+            'Avg Daily GB': avg_daily.round(2),
+            'Last Month Egress GB': last.round(2),
+            'MoM Growth %': growth.round(1),
+        }, columns=columns)
+
+    def fleet_stats(self):
+        """
+        Fleet-wide peak day and p95 daily egress across every gateway.
+        """
+        egress, total = self._daily_gb()
+        active = ~np.isnan(total).all(axis=0)
+        if not active.any():
+            return None
+        fleet_total = np.nansum(total, axis=0)
+        fleet_egress = np.nansum(egress, axis=0)
+        peak = int(np.where(active, fleet_total, -np.inf).argmax())
+        return {
+            'Peak Day': str(np.datetime64(self.origin.date()) + peak),
+            'Peak Day GB': float(fleet_total[peak]),
+            'P95 Daily Egress GB': float(np.percentile(fleet_egress[active], 95)),
+        }
 
-    start_time = time.time()
-    total_steps = len(months)
+# Set by collect_units in --granularity daily mode
+gateway_series = None
+
+def nat_row(account_id, region, month_label, upload, download):
+    upload_gb = round(upload / (1024**3), 2)
+    download_gb = round(download / (1024**3), 2)
+    return {
+        'Account': account_id,
+        'Region': region,
+        'Month': month_label,
+        'Upload GB': upload_gb,
+        'Download GB': download_gb,
+        'Total GB': round(upload_gb + download_gb, 2),
+    }
 
-    for i, (start, end) in enumerate(months):
+def record_missing(account_id, region, reason):
+    with stats_lock:
+        missing_units[(account_id, region)] = reason
+
+def missing_nat_rows(account_id, region, months):
+    """
+    NaN rows marking months that could not be collected, so gaps are never
+    mistaken for zero traffic. Nothing is checkpointed; a resumed run
+    retries them.
+    """
+    return [nat_row(account_id, region, start.strftime('%Y-%m'), float('nan'), float('nan')) for start, _ in months]
+
+def failed_nat_rows(account_id, region, months, error):
+    if not isinstance(error, CircuitOpenError):
+        print_both(f"\n  [!] Failed to fetch NAT Gateway metrics for {account_id}/{region}: {error}")
+    record_missing(account_id, region, str(error))
+    return missing_nat_rows(account_id, region, months)
+
+def checkpointed_nat_rows(account_id, region, months):
+    """
+    Rows for a unit finished by a previous run, or None if it still has to be
+    fetched. Checked before any AWS call so cached units are truly skipped.
+    """
+    store = get_checkpoints()
+    if not resume_mode or not store.unit_done(account_id, region):
+        return None
+    rows = []
+    for start, _ in months:
         month_label = start.strftime('%Y-%m')
-        label = f"Processing month: {month_label} ({i+1}/{total_steps})"
-
-        for account_id in accounts:
-            session = assume_role(account_id, role_name)
-            if not session:
-                continue
-
-            for region in regions:
-                cw = session.client('cloudwatch', region_name=region)
-                nat_ids = discover_nat_ids(cw)
-                if not nat_ids:
-                    continue
-
-                upload = download = 0
-                for nat_id in nat_ids:
-                    upload += get_metric_sum(cw, NAMESPACE_NAT, METRIC_NAT_UPLOAD, [{'Name': 'NatGatewayId', 'Value': nat_id}], start, end)
-                    download += get_metric_sum(cw, NAMESPACE_NAT, METRIC_NAT_DOWNLOAD, [{'Name': 'NatGatewayId', 'Value': nat_id}], start, end)
-
-                upload_gb = round(upload / (1024**3), 2)
-                download_gb = round(download / (1024**3), 2)
-                total_gb = round(upload_gb + download_gb, 2)
-
-                # --- RESUME CHECK ---
-                if resume_mode:
-                    existing = nat_cache_df[
-                        (nat_cache_df['Account'] == account_id) &
-                        (nat_cache_df['Region'] == region) &
-                        (nat_cache_df['Month'] == month_label)
-                    ]
-                    if not existing.empty:
-                        continue
-                # --------------------
-
-                nat_results.append({
-                    'Account': account_id,
-                    'Region': region,
-                    'Month': month_label,
-                    'Upload GB': upload_gb,
-                    'Download GB': download_gb,
-                    'Total GB': total_gb,
-                })
+        upload = store.get(account_id, region, month_label, METRIC_NAT_UPLOAD)
+        download = store.get(account_id, region, month_label, METRIC_NAT_DOWNLOAD)
+        if upload is not None and download is not None:
+            rows.append(nat_row(account_id, region, month_label, upload, download))
+    return rows
+
+def history_nat_rows(account_id, region, months):
+    """
+    In --incremental mode, split the window into rows for finalized months
+    kept in the history store and the months that still need fetching.
+    """
+    if not incremental_mode:
+        return [], months
+    store = get_history()
+    rows = []
+    missing = []
+    for start, end in months:
+        month_label = start.strftime('%Y-%m')
+        if store.is_final(account_id, region, month_label):
+            rows.append(nat_row(
+                account_id, region, month_label,
+                store.get(account_id, region, month_label, METRIC_NAT_UPLOAD),
+                store.get(account_id, region, month_label, METRIC_NAT_DOWNLOAD)
+            ))
+        else:
+            missing.append((start, end))
+    return rows, missing
+
+def finish_nat_unit(account_id, region, months, monthly, fetched_at):
+    """
+    Turn fetched monthly bytes into rows and record them in the checkpoint
+    and history stores. Months closed long enough before fetched_at are
+    marked final.
+    """
+    rows = []
+    values = []
+    finalized = []
+    for start, end in months:
+        month_label = start.strftime('%Y-%m')
+        upload, download = monthly[month_label]
+        rows.append(nat_row(account_id, region, month_label, upload, download))
+        values.append((account_id, region, month_label, METRIC_NAT_UPLOAD, upload))
+        values.append((account_id, region, month_label, METRIC_NAT_DOWNLOAD, download))
+        if end + timedelta(hours=HISTORY_SETTLE_HOURS) <= fetched_at:
+            finalized.append((account_id, region, month_label))
+
+    # --- CHECKPOINT SAVE ---
+    get_checkpoints().put(values, unit=(account_id, region))
+    get_history().put(values, finalized=finalized)
+    # -----------------------
+    return rows
+
+def collect_nat_rows(cw, account_id, region, months):
+    """
+    Scan one account/region once for the given month windows and return one
+    row per month.
+    """
+    if not region_inventory_fresh(account_id, region):
+        record_gateways(account_id, region, [{'NatGatewayId': n} for n in discover_nat_ids(cw, account_id)], 'list_metrics')
+    nat_ids = inventory_nat_ids(account_id, region, months[0][0])
+    if not nat_ids:
+        get_checkpoints().put([], unit=(account_id, region))
+        return []
+
+    fetched_at = datetime.now(timezone.utc)
+    monthly = get_nat_monthly_bytes(cw, nat_ids, months, account_id)
+    return finish_nat_unit(account_id, region, months, monthly, fetched_at)
+
+def cached_nat_rows(account_id, region, months):
+    """
+    Rows available without AWS calls: finalized months from history
+    (--incremental), then a checkpoint from an interrupted run (resume).
+    Returns (rows, months that still have to be fetched).
+    """
+    if gateway_series is not None:
+        # Cached months have no daily series, so daily mode fetches the window
+        return [], months
+    rows, missing = history_nat_rows(account_id, region, months)
+    if missing:
+        cached = checkpointed_nat_rows(account_id, region, missing)
+        if cached is not None:
+            return rows + cached, []
+    return rows, missing
+
+def scan_nat_unit(account_id, region, months, get_cw):
+    """
+    Rows for one account/region, going to CloudWatch only for months that
+    are not cached. get_cw() returns the CloudWatch client, or None if the
+    account cannot be accessed. Months that cannot be collected come back
+    as NaN rows.
+    """
+    rows, missing = cached_nat_rows(account_id, region, months)
+    if not missing:
+        return rows
+    if account_id in open_circuits:
+        return rows + failed_nat_rows(account_id, region, missing, CircuitOpenError(open_circuits[account_id]))
+    cw = get_cw()
+    if cw is None:
+        # Already recorded against the account by assume_role
+        return rows + missing_nat_rows(account_id, region, missing)
+    try:
+        return rows + collect_nat_rows(cw, account_id, region, missing)
+    except Exception as e:
+        return rows + failed_nat_rows(account_id, region, missing, e)
+
+def print_progress(label, done, total, start_time):
+    elapsed = time.time() - start_time
+    remaining = max(0, int((elapsed / done) * (total - done)))
+    bar = "[" + "#" * int(done/total*30) + "-" * (30 - int(done/total*30)) + "]"
+    print_both(f"\r{label} ({done}/{total}) {bar} Est. time remaining: {remaining} sec", end="", flush=True)
+
+def collect_units(units, scan_unit, label, role_name, months):
+    """
+    Scan every unit on the configured backend and return a NatAggregator
+    holding their rows.
+    """
+    global gateway_series, result_export
+    if granularity == 'daily' and gateway_series is None:
+        gateway_series = GatewaySeries(months)
+    if export_dir and result_export is None:
+        result_export = ResultExport(export_dir, export_format)
+    if collection_backend == 'async':
+        results = asyncio.run(AsyncCollector(role_name, months).run(units, label))
+        get_checkpoints().flush()
+        get_history().flush()
+    else:
+        results = scan_units(units, scan_unit, label)
+    # Keep the gateways and datapoint spans seen while collecting
+    try:
+        save_inventory()
+    except Exception as e:
+        print_both(f"[!] Could not write {INVENTORY_FILE}: {e}")
+    return results
 
-                # --- CACHE SAVE ---
-                new_row = pd.DataFrame([{
-                    'Account': account_id,
-                    'Region': region,
-                    'Month': month_label,
-                    'Upload GB': upload_gb,
-                    'Download GB': download_gb,
-                    'Total GB': total_gb,
-                }])
-                nat_cache_df = pd.concat([nat_cache_df, new_row], ignore_index=True)
-                save_to_cache(nat_cache_df, NAT_CACHE_FILE)
-                # ------------------
-
-        elapsed = time.time() - start_time
-        remaining = max(0, int((elapsed / (i + 1)) * (total_steps - (i + 1))))
-        bar = "[" + "#" * int((i+1)/total_steps*30) + "-" * (30 - int((i+1)/total_steps*30)) + "]"
-        print_both(f"\r{label} {bar} Est. time remaining: {remaining} sec", end="", flush=True)
+def build_nat_df(nat_results, accounts, regions):
+    # Units finish in any order under concurrency; to_frame sorts on month,
+    # then the account and region order the user asked for.
+    with timed('pandas'):
+        return nat_results.to_frame(accounts, regions)
 
+def timed_scan(scan_unit, account_id, region):
+    start = time.perf_counter()
+    try:
+        return scan_unit(account_id, region)
+    finally:
+        record_unit_time(account_id, region, time.perf_counter() - start)
+
+def scan_units(units, scan_unit, label):
+    """
+    Run scan_unit(account_id, region) for every (account, region) unit on the
+    worker pool and stream the rows into a NatAggregator. Progress is
+    reported from this thread only, as units complete.
+    """
+    results = NatAggregator()
+    start_time = time.time()
+    total_steps = len(units)
+    pool = get_worker_pool()
+    window = max_workers * UNIT_WINDOW_PER_WORKER
+    pending = iter(units)
+    futures = {}
+    done = 0
+    while True:
+        for account_id, region in islice(pending, window - len(futures)):
+            futures[pool.submit(timed_scan, scan_unit, account_id, region)] = (account_id, region)
+        if not futures:
+            break
+        finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in finished:
+            account_id, region = futures.pop(future)
+            rows = future.result()
+            results.add_rows(rows)
+            if result_export is not None:
+                result_export.write_unit(account_id, region, rows)
+            done += 1
+            print_progress(label.format(account=account_id, region=region), done, total_steps, start_time)
+    get_checkpoints().flush()
+    get_history().flush()
     print_both()
-    nat_df = pd.DataFrame(nat_results)
-    return nat_df, None
-
-# ------------ Output Section ------------
+    return results
 
-def print_summary(accounts, regions, use_org, include_dto, nat_totals, dto_totals):
-    print_both("\n=== Analysis Summary ===")
-    print_both(f"- AWS Organizations mode: {'Yes' if use_org else 'No'}")
-    print_both(f"- NAT Gateway Analysis: Yes")
-    print_both(f"- DTO Analysis: {'Yes' if include_dto else 'No'}")
-    print_both(f"- AWS Accounts analyzed: {', '.join(accounts)}")
-    print_both(f"- Regions analyzed: {', '.join(regions)}")
+def run_single_account_query(regions, include_dto):
+    account_id = call_aws('sts', 'global', None, get_client('sts').get_caller_identity)['Account']
+    months = get_monthly_ranges()
+    dto_results = []
 
-    # If DTO enabled, show difference vs egress
-    if include_dto:
-        nat_egress = nat_totals["Total NAT Upload GB"]
-        dto_total = dto_totals["Total DTO GB"]
-        diff = dto_total - nat_egress
-        print_both("\n=== DTO vs NAT Upload Comparison ===")
-        print_both("\n- Total DTO (Data Transfer Out) traffic over last 12 months: {:.2f} GB".format(dto_totals["Total DTO GB"]))
-        print_both("- Average monthly DTO traffic for quoting: {:.2f} GB".format(dto_totals["Average DTO GB per month"]))
-        print_both("- Difference (DTO vs NAT Egress): {:.2f} GB".format(diff))
+    def scan_unit(account_id, region):
+        return scan_nat_unit(account_id, region, months, lambda: get_client('cloudwatch', region))
 
-    print_both("\n=== NAT Gateway Traffic Breakdown ===")
+    units = [(account_id, region) for region in regions]
+    if region_prefilter:
+        units = discover_nat_units([account_id], regions, lambda a: None, months[0][0])
+    nat_results = collect_units(units, scan_unit, "Processing region: {region}", None, months)
+    return nat_results, pd.DataFrame(dto_results)
 
-    print_both("- Total NAT Gateway Upload (egress) over last 12 months: {:.2f} GB".format(nat_totals["Total NAT Upload GB"]))
-    print_both("- Average monthly NAT Gateway Upload: {:.2f} GB".format(nat_totals["Average NAT Upload GB per month"]))
+def run_org_query(accounts, role_name, regions, include_dto):
+    months = get_monthly_ranges()
 
-    print_both("- Total NAT Gateway Download (ingress) over last 12 months: {:.2f} GB".format(nat_totals["Total NAT Download GB"]))
-    print_both("- Average monthly NAT Gateway Download: {:.2f} GB".format(nat_totals["Average NAT Download GB per month"]))
+    def get_cw(account_id, region):
+        # Cached per account, so this only reaches STS on first use or refresh
+        credentials = assume_role(account_id, role_name)
+        if not credentials:
+            return None
+        return get_client('cloudwatch', region, credentials)
+
+    def scan_unit(account_id, region):
+        return scan_nat_unit(account_id, region, months, lambda: get_cw(account_id, region))
+
+    units = [(account_id, region) for account_id in accounts for region in regions]
+    if region_prefilter:
+        # False (not None) marks an account whose role could not be assumed
+        units = discover_nat_units(accounts, regions, lambda a: assume_role(a, role_name) or False, months[0][0])
+    return collect_units(units, scan_unit, "Processing account/region: {account}/{region}", role_name, months), None
+
+# ------------ Async Collection Backend ------------
+
+class AsyncCollector:
+    """
+    asyncio/aiobotocore implementation of the collection path (assume_role,
+    discover_nat_ids and the GetMetricData fetch). It shares the credential
+    cache, gateway inventory and checkpoint/history stores with the threaded
+    path and produces the same rows; in-flight requests are bounded by
+    per-region and per-API/region semaphores instead of a thread per request,
+    and go through the same rate limits, retry budget and circuit breaker.
+    Checkpoint and history I/O (SQLite) runs in worker threads so it does
+    not block the event loop.
+    """
+    def __init__(self, role_name, months):
+        self.role_name = role_name
+        self.months = months
+        self.session = get_aio_session()
+        if aws_profile:
+            self.session.set_config_variable('profile', aws_profile)
+        self.config = AioConfig(
+            max_pool_connections=max_pool_connections,
+            retries={'mode': retry_mode, 'total_max_attempts': max_attempts}
+        )
+        # (account, service, region) -> (AccessKeyId, exit stack, client)
+        self.clients = {}
+        self.client_lock = asyncio.Lock()
+        self.semaphores = {}
+        self.role_locks = {}
+
+    async def client(self, service, region=None, credentials=None, account_id=None):
+        # One client per account/service/region; when the account's
+        # credentials rotate the old client and its connection pool are closed
+        key = (account_id, service, region)
+        access_key = credentials['AccessKeyId'] if credentials else None
+        async with self.client_lock:
+            current = self.clients.get(key)
+            if current is not None and current[0] == access_key:
+                return current[2]
+            if current is not None:
+                await current[1].aclose()
+            kwargs = {}
+            if credentials:
+                kwargs = {
+                    'aws_access_key_id': credentials['AccessKeyId'],
+                    'aws_secret_access_key': credentials['SecretAccessKey'],
+                    'aws_session_token': credentials['SessionToken'],
+                }
+            stack = AsyncExitStack()
+            client = await stack.enter_async_context(
+                self.session.create_client(service, region_name=region, config=self.config, **kwargs)
+            )
+            self.clients[key] = (access_key, stack, client)
+            return client
+
+    async def close(self):
+        for _, stack, _ in self.clients.values():
+            await stack.aclose()
+        self.clients.clear()
+
+    def _semaphore(self, key, limit):
+        if key not in self.semaphores:
+            self.semaphores[key] = asyncio.BoundedSemaphore(limit)
+        return self.semaphores[key]
+
+    @asynccontextmanager
+    async def slot(self, api, region='global'):
+        region_sem = self._semaphore(('region', region), REGION_CONCURRENCY)
+        api_sem = self._semaphore((api, region), API_CONCURRENCY.get(api, REGION_CONCURRENCY))
+        async with region_sem, api_sem:
+            yield
+
+    async def call(self, api, region, account_id, method, **kwargs):
+        # Async twin of call_aws
+        attempt = 0
+        while True:
+            check_circuit(account_id)
+            wait = _reserve_rate_slot(api, region)
+            if wait > 0:
+                add_phase_time('rate_limit_wait', wait)
+                await asyncio.sleep(wait)
+            try:
+                async with self.slot(api, region):
+                    start = time.perf_counter()
+                    try:
+                        response = await method(**kwargs)
+                    finally:
+                        seconds = time.perf_counter() - start
+            except Exception as e:
+                record_call(api, region, account_id, seconds, e)
+                delay = _retry_delay(api, region, account_id, e, attempt)
+                if delay is None:
+                    raise
+                record_retry(api, region, account_id)
+                add_phase_time('retry_backoff', delay)
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            record_call(api, region, account_id, seconds)
+            _record_success(api, region)
+            return response
+
+    async def pages(self, api, region, account_id, method, **kwargs):
+        while True:
+            page = await self.call(api, region, account_id, method, **kwargs)
+            yield page
+            if not page.get('NextToken'):
+                return
+            kwargs['NextToken'] = page['NextToken']
+
+    async def assume_role(self, account_id):
+        key = (account_id, self.role_name)
+        if key in _failed_roles:
+            return None
+        async with self.role_locks.setdefault(key, asyncio.Lock()):
+            if key in _failed_roles:
+                return None
+            cached = _credential_cache.get(key)
+            if cached and _credentials_valid(cached):
+                return cached
+            sts = await self.client('sts')
+            request = {
+                'RoleArn': f"arn:aws:iam::{account_id}:role/{self.role_name}",
+                'RoleSessionName': "OrgNATMetricsSession",
+            }
+            try:
+                try:
+                    response = await self.call('sts', 'global', account_id, sts.assume_role, DurationSeconds=role_duration, **request)
+                except Exception as e:
+                    if role_duration == 3600 or 'DurationSeconds' not in str(e):
+                        raise
+                    response = await self.call('sts', 'global', account_id, sts.assume_role, **request)
+            except Exception as e:
+                print_both(f"  [!] Failed to assume role in {account_id}: {e}")
+                with _credential_lock:
+                    _failed_roles[key] = str(e)
+                record_missing(account_id, '*', f"could not assume {self.role_name}: {e}")
+                return None
+            creds = response['Credentials']
+            with _credential_lock:
+                _credential_cache[key] = creds
+                if persist_credentials:
+                    try:
+                        save_credential_cache()
+                    except Exception as e:
+                        print_both(f"  [!] Could not persist credential cache: {e}")
+            return creds
+
+    async def discover_nat_ids(self, cw, account_id, region):
+        seen = set()
+        pages = self.pages('list_metrics', region, account_id, cw.list_metrics,
+                           Namespace=NAMESPACE_NAT, MetricName=METRIC_NAT_UPLOAD)
+        async for page in pages:
+            for metric in page['Metrics']:
+                for d in metric['Dimensions']:
+                    if d['Name'] == 'NatGatewayId':
+                        seen.add(d['Value'])
+        return sorted(seen)
+
+    async def get_nat_monthly_bytes(self, cw, account_id, region, nat_ids, months):
+        monthly = {start.strftime('%Y-%m'): [0.0, 0.0] for start, _ in months}
+        queries, query_map = build_nat_metric_queries(nat_ids)
+        metric_call_stats["legacy"] += len(queries) * len(months)
+        for i in range(0, len(queries), MAX_METRIC_QUERIES):
+            pages = self.pages(
+                'get_metric_data', region, account_id, cw.get_metric_data,
+                MetricDataQueries=queries[i:i + MAX_METRIC_QUERIES],
+                StartTime=months[0][0],
+                EndTime=months[-1][1],
+                ScanBy='TimestampAscending'
+            )
+            async for page in pages:
+                metric_call_stats["batched"] += 1
+                add_metric_results(monthly, page['MetricDataResults'], query_map, months, (account_id, region))
+        return monthly
+
+    async def collect_rows(self, cw, account_id, region, months):
+        if not region_inventory_fresh(account_id, region):
+            nat_ids = await self.discover_nat_ids(cw, account_id, region)
+            record_gateways(account_id, region, [{'NatGatewayId': n} for n in nat_ids], 'list_metrics')
+        nat_ids = inventory_nat_ids(account_id, region, months[0][0])
+        if not nat_ids:
+            await asyncio.to_thread(get_checkpoints().put, [], unit=(account_id, region))
+            return []
+        fetched_at = datetime.now(timezone.utc)
+        monthly = await self.get_nat_monthly_bytes(cw, account_id, region, nat_ids, months)
+        return await asyncio.to_thread(finish_nat_unit, account_id, region, months, monthly, fetched_at)
+
+    async def scan_unit(self, account_id, region):
+        rows, missing = await asyncio.to_thread(cached_nat_rows, account_id, region, self.months)
+        if not missing:
+            return rows
+        if account_id in open_circuits:
+            return rows + failed_nat_rows(account_id, region, missing, CircuitOpenError(open_circuits[account_id]))
+        credentials = None
+        if self.role_name:
+            credentials = await self.assume_role(account_id)
+            if not credentials:
+                return rows + missing_nat_rows(account_id, region, missing)
+        cw = await self.client('cloudwatch', region, credentials, account_id)
+        try:
+            return rows + await self.collect_rows(cw, account_id, region, missing)
+        except Exception as e:
+            return rows + failed_nat_rows(account_id, region, missing, e)
 
-    # Existing Total NAT traffic
-    print_both("\n- Total NAT Gateway traffic over last 12 months: {:.2f} GB".format(nat_totals["Total NAT GB"]))
-    print_both("- Average monthly NAT Gateway traffic for quoting: {:.2f} GB".format(nat_totals["Average NAT GB per month"]))
+    async def _scan(self, account_id, region):
+        start = time.perf_counter()
+        try:
+            return account_id, region, await self.scan_unit(account_id, region)
+        finally:
+            record_unit_time(account_id, region, time.perf_counter() - start)
+
+    async def run(self, units, label):
+        results = NatAggregator()
+        start_time = time.time()
+        window = max_pool_connections * UNIT_WINDOW_PER_WORKER
+        pending = iter(units)
+        tasks = set()
+        done = 0
+        try:
+            while True:
+                for account_id, region in islice(pending, window - len(tasks)):
+                    tasks.add(asyncio.ensure_future(self._scan(account_id, region)))
+                if not tasks:
+                    break
+                finished, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    account_id, region, rows = task.result()
+                    results.add_rows(rows)
+                    if result_export is not None:
+                        result_export.write_unit(account_id, region, rows)
+                    done += 1
+                    print_progress(label.format(account=account_id, region=region), done, len(units), start_time)
+                del finished
+        finally:
+            await self.close()
+        print_both()
+        return results
 
 # ------------ Runner ------------
 def run_nat_query(use_org, accounts, role_name, regions, include_dto):
+    """
+    Returns (NatAggregator, totals). Build a DataFrame from the aggregator
+    with build_nat_df only when rows need to be written or tabulated.
+    """
     if use_org:
-        df, _ = run_org_query(accounts, role_name, regions, include_dto)
+        nat, _ = run_org_query(accounts, role_name, regions, include_dto)
     else:
-        df, _ = run_single_account_query(regions, include_dto)
+        nat, _ = run_single_account_query(regions, include_dto)
+    return nat, nat.summary()
 
-    if df.empty:
-        return df, {"Total NAT GB": 0, "Average NAT GB per month": 0}
+def summarize_nat(df):
+    with timed('pandas'):
+        return NatAggregator.from_frame(df).summary()
 
-    all_months_sorted = sorted(df["Month"].unique())
-    last_12_months = all_months_sorted[-12:]
-    df_nonzero = df[df["Month"].isin(last_12_months) & (df["Total GB"] > 0)]
-
-    total_nat_gb = df_nonzero["Total GB"].sum()
-    total_nat_upload = df_nonzero["Upload GB"].sum()
-    total_nat_download = df_nonzero["Download GB"].sum()
-    months_nonzero = df_nonzero["Month"].nunique()
-
-    avg_nat_gb = total_nat_gb / months_nonzero if months_nonzero > 0 else 0
-    avg_nat_upload = total_nat_upload / months_nonzero if months_nonzero > 0 else 0
-    avg_nat_download = total_nat_download / months_nonzero if months_nonzero > 0 else 0
-
-    avg_nat_gb = total_nat_gb / months_nonzero if months_nonzero > 0 else 0
-    avg_nat_upload = total_nat_upload / months_nonzero if months_nonzero > 0 else 0
-    avg_nat_download = total_nat_download / months_nonzero if months_nonzero > 0 else 0
-
-    return df, {
-        "Total NAT GB": total_nat_gb,
-        "Total NAT Upload GB": total_nat_upload,
-        "Total NAT Download GB": total_nat_download,
-        "Average NAT Upload GB per month": avg_nat_upload,
-        "Average NAT Download GB per month": avg_nat_download,
-        "Average NAT GB per month": avg_nat_gb
-    }
+def open_output_file(name=None):
+    global output_file
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M")
+    outfile_name = f"aws-output-{name}-{timestamp}.txt" if name else f"aws-output-{timestamp}.txt"
+    output_file = open(outfile_name, "w")
+    print_both(f"\n[✓] Output will also be saved to: {outfile_name}\n")
 
 def run_aws_analysis():
-    global success_flag
-    global nat_cache_df, dto_cache_df, resume_mode
+    global resume_mode
 
-    if os.path.exists(NAT_CACHE_FILE) or os.path.exists(DTO_CACHE_FILE):
+    if os.path.exists(CHECKPOINT_FILE):
         choice = input("\n[!] Existing cache detected. Resume from previous run? (y/n): ").strip().lower()
         if choice == 'y':
             resume_mode = True
-            if os.path.exists(NAT_CACHE_FILE):
-                nat_cache_df = load_cache(NAT_CACHE_FILE)
-                print_both(f"[✓] Loaded {len(nat_cache_df)} cached NAT entries from {NAT_CACHE_FILE}")
-            if os.path.exists(DTO_CACHE_FILE):
-                dto_cache_df = load_cache(DTO_CACHE_FILE)
-                print_both(f"[✓] Loaded {len(dto_cache_df)} cached DTO entries from {DTO_CACHE_FILE}")
+            store = get_checkpoints()
+            print_both(f"[✓] Loaded {len(store)} cached values for {len(store.done_units)} account/region pairs from {CHECKPOINT_FILE}")
             print_both("\n[✓] Resuming from previous run.\n")
         else:
             try:
-                if os.path.exists(NAT_CACHE_FILE):
-                    os.remove(NAT_CACHE_FILE)
-                if os.path.exists(DTO_CACHE_FILE):
-                    os.remove(DTO_CACHE_FILE)
+                remove_checkpoint_files()
                 print_both("\n[✓] Old cache files deleted. Starting fresh run.\n")
             except Exception as e:
                 print_both(f"[!] Failed to delete cache files: {e}")
 
-    timestamp = datetime.now().strftime("%Y%m%d-%H%M")
-    outfile_name = f"aws-output-{timestamp}.txt"
-    global output_file
-    output_file = open(outfile_name, "w")
-    print_both(f"\n[✓] Output will also be saved to: {outfile_name}\n")
+    load_credential_cache()
+    load_inventory()
+    open_output_file()
 
     # ---> First ask user
     use_org = input("Run against AWS Organizations? (y/n): ").strip().lower() == "y"
@@ -472,13 +2020,8 @@ def run_aws_analysis():
 
     regions = prompt_for_regions()
 
-    if include_dto and use_org:
-        if not is_management_account():
-            print_both("\n[!] Note: DTO (Data Transfer Out) metrics are only collected from the current account.")
-            print_both("    To get full DTO across all Org accounts, run this script from the AWS Organizations management account.\n")
-
     role_name = None
-    accounts = []
+    accounts = None
 
     if use_org:
         role_name = input("Enter IAM role name to assume in each account: ").strip()
@@ -487,33 +2030,441 @@ def run_aws_analysis():
         except:
             ids = input("Enter comma-separated list of AWS Account IDs to check: ").strip()
             accounts = [a.strip() for a in ids.split(',') if a.strip()]
-    else:
-        session = boto3.Session()
-        account_id = boto3.client('sts').get_caller_identity()['Account']
+
+    if not analyze(use_org, include_dto, regions, role_name, accounts):
+        sys.exit(0)
+
+def analyze(use_org, include_dto, regions, role_name=None, accounts=None, show_details=None):
+    """
+    Run the NAT (and optionally DTO) queries for one target and print the
+    summary. Without Org mode the caller's own account is analyzed.
+    show_details=None asks whether to print the detailed tables.
+    Returns False when no NAT Gateway usage was found.
+    """
+    global success_flag
+    if include_dto and use_org:
+        if not is_management_account():
+            print_both("\n[!] Note: DTO (Data Transfer Out) metrics are only collected from the current account.")
+            print_both("    To get full DTO across all Org accounts, run this script from the AWS Organizations management account.\n")
+
+    if not use_org:
+        account_id = call_aws('sts', 'global', None, get_client('sts').get_caller_identity)['Account']
         accounts = [account_id]
 
-    nat_df, nat_totals = run_nat_query(use_org, accounts, role_name, regions, include_dto)
+    nat, nat_totals = run_nat_query(use_org, accounts, role_name, regions, include_dto)
 
+    dto_df = None
     if include_dto:
-        dto_df, dto_totals = run_dto_query(use_org, regions)
+        dto_df, dto_totals = run_dto_query(use_org, regions, accounts)
     else:
         dto_totals = {
             "Total DTO GB": 0,
             "Average DTO GB per month": 0
         }
 
-    if nat_df.empty:
+    if result_export is not None:
+        if dto_df is not None and len(dto_df):
+            result_export.write_dto(dto_df)
+        print_both(f"[✓] Exported {result_export.files} {export_format} files to {export_dir}")
+
+    if not len(nat):
         print_both("No NAT Gateway usage data found.")
-        sys.exit(0)
+        return False
 
+    nat_df = build_nat_df(nat, accounts, regions) if price_table is not None else None
+    costs = estimate_costs(nat_df, dto_df)
     success_flag = True
     print_both("\n=== ORG NAT + DTO Usage Summary ===\n")
-    print_summary(accounts, regions, use_org, include_dto, nat_totals, dto_totals)
-    show_details = input("\nShow detailed tables per AWS account and region? (y/n): ").strip().lower() == "y"
+    print_summary(accounts, regions, use_org, include_dto, nat_totals, dto_totals, costs)
+    if show_details is None:
+        show_details = input("\nShow detailed tables per AWS account and region? (y/n): ").strip().lower() == "y"
     if show_details:
-        print_detailed_tables(nat_df)
+        print_detailed_tables(nat_df if nat_df is not None else build_nat_df(nat, accounts, regions), dto_df, costs)
+    if costs is not None and interactive:
+        what_if_prompt(costs)
+    return True
+
+# ------------ Columnar Result Export ------------
+
+# --export writes the results as a Hive-partitioned dataset, so BI tools can
+# read only the accounts and months they need:
+#   <dir>/nat/account=<id>/month=<YYYY-MM>/<region>.parquet
+#   <dir>/dto/account=<id>/month=<YYYY-MM>/dto.parquet
+# NAT files are written as each account/region unit completes, so the full
+# result set is never held in memory, and are replaced whole on re-runs.
+export_dir = None
+export_format = 'parquet'
+EXPORT_SUFFIXES = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+class ResultExport:
+    """
+    Per-gateway monthly bytes buffered per (account, region) unit while it
+    is fetched, then written with the unit's rows by write_unit. Months
+    answered from the checkpoint or history store only have account/region
+    totals and are written with a null gateway; months that could not be
+    collected are written with null bytes.
+    """
+    def __init__(self, path, file_format):
+        self.path = path
+        self.file_format = file_format
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.files = 0
+        # The account is also stored as a string column: readers that infer
+        # partition types (Spark, Athena) turn account=0123... into an integer.
+        # It is not named `account`, which would clash with the partition key.
+        self.nat_schema = pa.schema([
+            ('account_id', pa.string()),
+            ('region', pa.string()),
+            ('gateway', pa.string()),
+            ('upload_bytes', pa.int64()),
+            ('download_bytes', pa.int64()),
+            ('total_bytes', pa.int64()),
+        ])
+        self.dto_schema = pa.schema([('account_id', pa.string()), ('region', pa.string()), ('dto_gb', pa.float64())])
+
+    def unit_bytes(self, unit, labels):
+        """{month: {nat_id: [upload, download]}} for a unit being fetched."""
+        with self.lock:
+            per_gateway = self.pending.setdefault(unit, {})
+        # Only the worker scanning this unit writes to it
+        for label in labels:
+            per_gateway.setdefault(label, {})
+        return per_gateway
+
+    def _write(self, kind, account_id, month, name, columns, schema):
+        directory = os.path.join(self.path, kind, f"account={account_id}", f"month={month}")
+        path = os.path.join(directory, name + EXPORT_SUFFIXES[self.file_format])
+        # Dataset readers skip dot files, so a half-written file is never read
+        tmp_path = os.path.join(directory, f".{name}.{os.getpid()}.tmp")
+        rows = len(next(iter(columns.values())))
+        table = pa.table(dict(account_id=[str(account_id)] * rows, **columns), schema=schema)
+        with timed('export'):
+            os.makedirs(directory, exist_ok=True)
+            if self.file_format == 'arrow':
+                with pa.ipc.new_file(tmp_path, schema) as writer:
+                    writer.write_table(table)
+            else:
+                pa_parquet.write_table(table, tmp_path)
+            os.replace(tmp_path, path)
+        self.files += 1
+
+    def write_unit(self, account_id, region, rows):
+        """Write one file per month for a finished unit; called from one thread."""
+        with self.lock:
+            per_gateway = self.pending.pop((account_id, region), {})
+        for row in rows:
+            month = row['Month']
+            if np.isnan(row['Total GB']):
+                gateways, upload, download = [None], [None], [None]
+            elif per_gateway.get(month):
+                gateways = sorted(per_gateway[month])
+                upload = [round(per_gateway[month][nat_id][0]) for nat_id in gateways]
+                download = [round(per_gateway[month][nat_id][1]) for nat_id in gateways]
+            else:
+                gateways = [None]
+                upload = [stored_nat_bytes(account_id, region, month, METRIC_NAT_UPLOAD)]
+                download = [stored_nat_bytes(account_id, region, month, METRIC_NAT_DOWNLOAD)]
+            self._write('nat', account_id, month, region, {
+                'region': [region] * len(gateways),
+                'gateway': gateways,
+                'upload_bytes': upload,
+                'download_bytes': download,
+                'total_bytes': [None if u is None or d is None else u + d for u, d in zip(upload, download)],
+            }, self.nat_schema)
+
+    def write_dto(self, dto_df):
+        for (account_id, month), group in dto_df.groupby(['Account', 'Month'], sort=False):
+            self._write('dto', account_id, month, 'dto', {
+                'region': group['Region'].tolist(),
+                'dto_gb': group['DTO GB'].tolist(),
+            }, self.dto_schema)
+
+# Set by collect_units when --export is given
+result_export = None
+
+def stored_nat_bytes(account_id, region, month_label, metric):
+    """Exact bytes behind a cached row; the rows themselves are rounded GB."""
+    for store in (get_checkpoints(), get_history()):
+        value = store.get(account_id, region, month_label, metric)
+        if value is not None:
+            return round(value)
+    return None
+
+# ------------ Cost Model ------------
+
+# Versionable per-region list prices; see egress_prices.json next to this
+# script for the format. Regions missing from the table use its "Default".
+PRICES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'egress_prices.json')
+FORECAST_MONTHS = 12
+price_table = None  # set by apply_args unless --no-costs
+what_if_scenarios = []  # (name, factors) from --what-if
+
+# What-if factors multiply a volume or a rate when the estimate is repriced
+WHAT_IF_FACTORS = {
+    'nat': "NAT Gateway GB processed",
+    'dto': "internet DTO GB",
+    'gateways': "NAT Gateway hours",
+    'nat_price': "NAT Gateway per-GB rate",
+    'hour_price': "NAT Gateway hourly rate",
+    'dto_price': "DTO rates",
+}
+COST_COLUMNS = ['NAT Processing', 'NAT Hours', 'DTO', 'Total']
+
+class PriceTable:
+    """
+    NAT Gateway per-GB and hourly rates and tiered internet DTO rates per
+    region, read from a local JSON price table. DTO tiers are
+    [from_gb, rate] pairs over one region's monthly volume.
+    """
+    def __init__(self, path):
+        with open(path) as f:
+            data = json.load(f)
+        self.path = path
+        self.version = str(data.get('Version', 'unversioned'))
+        self.currency = data.get('Currency', 'USD')
+        default = data['Default']
+        self.default = self._entry(default)
+        self.regions = {region: self._entry(dict(default, **values)) for region, values in data.get('Regions', {}).items()}
+
+    @staticmethod
+    def _entry(values):
+        tiers = sorted((float(start), float(rate)) for start, rate in values['DataTransferOutTiers'])
+        if not tiers or tiers[0][0] != 0:
+            raise ValueError("DataTransferOutTiers must start at 0 GB")
+        return float(values['NatGatewayPerGB']), float(values['NatGatewayPerHour']), tiers
+
+    def unlisted(self, regions):
+        return sorted(r for r in set(regions) if r not in self.regions)
+
+    def rates(self, regions):
+        """
+        Rate arrays aligned with `regions`: NAT per GB, NAT per hour, and DTO
+        tier starts and rates padded to a common width. Padding tiers start
+        at infinity, so they are never reached.
+        """
+        entries = [self.regions.get(r, self.default) for r in regions]
+        width = max([len(tiers) for _, _, tiers in entries] or [1])
+        starts = np.full((len(entries), width), np.inf)
+        tier_rates = np.zeros((len(entries), width))
+        for i, (_, _, tiers) in enumerate(entries):
+            starts[i, :len(tiers)] = [start for start, _ in tiers]
+            tier_rates[i, :len(tiers)] = [rate for _, rate in tiers]
+        nat_gb = np.array([entry[0] for entry in entries], dtype=float)
+        nat_hour = np.array([entry[1] for entry in entries], dtype=float)
+        return nat_gb, nat_hour, starts, tier_rates
+
+def tiered_cost(volume, starts, rates):
+    """Cost of each volume under its own row of tier starts and rates."""
+    ends = np.concatenate([starts[:, 1:], np.full((len(starts), 1), np.inf)], axis=1)
+    width = np.subtract(ends, starts, out=np.full(ends.shape, np.inf), where=~np.isinf(ends))
+    in_tier = np.minimum(np.maximum(volume[:, None] - starts, 0), width)
+    return (in_tier * rates).sum(axis=1)
+
+def gateway_hours_frame(pairs, months):
+    """
+    (NAT Gateway hours per account/region/month, number of approximated
+    gateways) from the inventory. A gateway runs from its CreateTime until
+    its DeleteTime, its LastSeen when a later refresh of the region no
+    longer found it, or now. Gateways known only from metrics have no
+    CreateTime and run from their first datapoint (or FirstSeen); in regions
+    never fully refreshed they run until their last datapoint (or LastSeen).
+    Both are counted as approximated.
+    """
+    spans = []
+    approximated = 0
+    with inventory_lock:
+        for account_id, region in pairs:
+            entry = nat_inventory.get(account_id, {}).get('Regions', {}).get(region) or {}
+            refreshed_at = entry.get('RefreshedAt')
+            for gw in entry.get('Gateways', {}).values():
+                start = gw.get('CreateTime')
+                approximate = not start
+                if not start:
+                    start = gw.get('FirstDatapoint') or gw['FirstSeen']
+                if gw.get('DeleteTime'):
+                    end = gw['DeleteTime']
+                elif gw.get('State') in ('deleting', 'deleted', 'failed') or (refreshed_at and gw['LastSeen'] < refreshed_at):
+                    end = gw['LastSeen']
+                elif not refreshed_at:
+                    end = max(gw['LastSeen'], gw.get('LastDatapoint', ''))
+                    approximate = True
+                else:
+                    end = None
+                approximated += approximate
+                spans.append((account_id, region, start, end))
+    if not spans or not months:
+        return None, 0
+
+    periods = pd.PeriodIndex(months, freq='M')
+    month_start = periods.start_time.to_numpy()
+    month_end = (periods + 1).start_time.to_numpy()
+    now = np.datetime64(datetime.now(timezone.utc).replace(tzinfo=None), 'ns')
+    start = pd.to_datetime([s[2] for s in spans], utc=True).tz_localize(None).to_numpy()
+    end = pd.to_datetime([s[3] for s in spans], utc=True).tz_localize(None).to_numpy()
+    end = np.where(np.isnat(end), now, np.minimum(end, now))
+    # [gateway, month] overlap of the gateway's lifetime with each month
+    overlap = np.minimum(end[:, None], month_end[None, :]) - np.maximum(start[:, None], month_start[None, :])
+    hours = np.maximum(overlap / np.timedelta64(1, 'h'), 0)
+    frame = pd.DataFrame(hours, columns=list(months))
+    frame['Account'] = [s[0] for s in spans]
+    frame['Region'] = [s[1] for s in spans]
+    frame = frame.groupby(['Account', 'Region']).sum()
+    frame.columns.name = 'Month'
+    return frame.stack().rename('Gateway Hours').reset_index(), approximated
+
+def usage_frame(nat_df, dto_df=None, hours_df=None):
+    """
+    One row per account/region/month with NAT GB processed, DTO GB and
+    gateway hours. NAT rows that could not be collected stay NaN.
+    """
+    keys = ['Account', 'Region', 'Month']
+    usage = nat_df[keys + ['Total GB']].rename(columns={'Total GB': 'NAT GB'})
+    usage['NAT Missing'] = usage['NAT GB'].isna()
+    for other in (dto_df, hours_df):
+        if other is not None and len(other):
+            usage = usage.merge(other, on=keys, how='outer')
+    usage = usage.reindex(columns=keys + ['NAT GB', 'NAT Missing', 'DTO GB', 'Gateway Hours'])
+    missing = usage['NAT Missing'].eq(True).to_numpy()
+    usage = usage.drop(columns='NAT Missing').fillna({'NAT GB': 0.0, 'DTO GB': 0.0, 'Gateway Hours': 0.0})
+    usage.loc[missing, 'NAT GB'] = np.nan
+    return usage
+
+def price_usage(usage, prices, scenario=None):
+    """
+    Price every account/region/month row at once. DTO tiers apply to each
+    region's monthly volume across all accounts (as under consolidated
+    billing), and every account pays its share at the blended rate.
+    scenario maps WHAT_IF_FACTORS keys to multipliers.
+    """
+    factors = dict.fromkeys(WHAT_IF_FACTORS, 1.0)
+    factors.update(scenario or {})
+    region_codes, regions = pd.factorize(usage['Region'])
+    nat_gb, nat_hour, starts, tier_rates = prices.rates(list(regions))
+
+    dto = usage['DTO GB'].to_numpy(dtype=float) * factors['dto']
+    groups = usage.groupby(['Region', 'Month'], sort=False).ngroup().to_numpy()
+    volume = np.bincount(groups, weights=dto, minlength=int(groups.max()) + 1 if len(groups) else 0)
+    group_region = np.zeros(len(volume), dtype=int)
+    group_region[groups] = region_codes
+    group_cost = tiered_cost(volume, starts[group_region], tier_rates[group_region]) * factors['dto_price']
+    share = np.divide(dto, volume[groups], out=np.zeros_like(dto), where=volume[groups] > 0)
+
+    cost = usage[['Account', 'Region', 'Month']].copy()
+    cost['NAT Processing'] = usage['NAT GB'].to_numpy(dtype=float) * factors['nat'] * nat_gb[region_codes] * factors['nat_price']
+    cost['NAT Hours'] = usage['Gateway Hours'].to_numpy(dtype=float) * factors['gateways'] * nat_hour[region_codes] * factors['hour_price']
+    cost['DTO'] = group_cost[groups] * share
+    cost['Total'] = cost[['NAT Processing', 'NAT Hours', 'DTO']].sum(axis=1)
+    return cost
+
+def linear_trend(values, x, future):
+    """
+    Least-squares line through each row of `values` (NaN = no data),
+    evaluated at `future` and floored at zero. Rows with one point stay flat.
+    """
+    known = ~np.isnan(values)
+    n = known.sum(axis=1)
+    xs = np.where(known, x[None, :], 0.0)
+    ys = np.where(known, values, 0.0)
+    sx, sy = xs.sum(axis=1), ys.sum(axis=1)
+    sxx, sxy = (xs * xs).sum(axis=1), (xs * ys).sum(axis=1)
+    denom = n * sxx - sx * sx
+    slope = np.divide(n * sxy - sx * sy, denom, out=np.zeros(len(values)), where=denom > 0)
+    intercept = np.divide(sy - slope * sx, n, out=np.zeros(len(values)), where=n > 0)
+    return np.maximum(intercept[:, None] + slope[:, None] * future[None, :], 0)
+
+def forecast_usage(usage, horizon=FORECAST_MONTHS, now=None):
+    """
+    Project each account/region `horizon` months past the last closed
+    calendar month with a linear trend over its full months. Months without
+    rows count as zero; only NAT rows that could not be collected are left
+    out of the fit. Gateway hours carry the last closed month's average
+    gateway count forward.
+    """
+    last = pd.Period(now or datetime.now(timezone.utc), freq='M') - 1
+    full = usage[usage['Month'] <= str(last)]
+    if full.empty:
+        return usage.iloc[0:0]
+    window = pd.period_range(full['Month'].min(), last, freq='M')
+    labels = window.strftime('%Y-%m')
+    series = (full.set_index(['Account', 'Region', 'Month'])[['NAT GB', 'DTO GB', 'Gateway Hours']]
+              .unstack('Month', fill_value=0.0)
+              .reindex(columns=pd.MultiIndex.from_product([['NAT GB', 'DTO GB', 'Gateway Hours'], labels], names=[None, 'Month']), fill_value=0.0))
+    x = (window.asi8 - last.ordinal).astype(float)
+    future_periods = pd.period_range(last + 1, periods=horizon, freq='M')
+    future = np.arange(1, horizon + 1, dtype=float)
+
+    nat = linear_trend(series['NAT GB'].to_numpy(dtype=float), x, future)
+    dto = linear_trend(series['DTO GB'].to_numpy(dtype=float), x, future)
+    gateways = np.nan_to_num(series['Gateway Hours'][str(last)].to_numpy(dtype=float)) / (last.days_in_month * 24)
+    hours = gateways[:, None] * (np.asarray(future_periods.days_in_month) * 24)[None, :]
+    return pd.DataFrame({
+        'Account': np.repeat(series.index.get_level_values('Account'), horizon),
+        'Region': np.repeat(series.index.get_level_values('Region'), horizon),
+        'Month': np.tile(future_periods.strftime('%Y-%m'), len(series)),
+        'NAT GB': nat.ravel(),
+        'DTO GB': dto.ravel(),
+        'Gateway Hours': hours.ravel(),
+    })
+
+def estimate_costs(nat_df, dto_df=None):
+    """
+    Price the last 12 months of usage and a 12-month trend forecast per
+    account/region. Returns None without a price table.
+    """
+    if price_table is None or nat_df is None:
+        return None
+    with timed('pandas'):
+        pairs = nat_df[['Account', 'Region']].drop_duplicates().itertuples(index=False, name=None)
+        hours_df, approximated = gateway_hours_frame(list(pairs), sorted(nat_df['Month'].unique()))
+        usage = usage_frame(nat_df, dto_df, hours_df)
+        last_12_months = sorted(usage['Month'].unique())[-12:]
+        window = usage[usage['Month'].isin(last_12_months)].reset_index(drop=True)
+        forecast = forecast_usage(usage)
+        return {
+            'usage': window,
+            'cost': price_usage(window, price_table),
+            'forecast': forecast,
+            'forecast_cost': price_usage(forecast, price_table),
+            'unlisted': price_table.unlisted(usage['Region']),
+            'approximated_gateways': approximated,
+        }
+
+def cost_totals(costs, scenario=None):
+    """Totals for the estimate, repriced first when a what-if scenario is given."""
+    with timed('pandas'):
+        cost = price_usage(costs['usage'], price_table, scenario) if scenario else costs['cost']
+        forecast = price_usage(costs['forecast'], price_table, scenario) if scenario else costs['forecast_cost']
+        monthly = cost.groupby('Month')['Total'].sum()
+    nonzero = monthly[monthly > 0]
+    totals = {column: float(cost[column].sum()) for column in COST_COLUMNS}
+    totals['Average per month'] = float(nonzero.mean()) if len(nonzero) else 0.0
+    totals['Forecast'] = float(forecast['Total'].sum())
+    return totals
+
+def parse_what_if(spec):
+    """
+    '[name:]factor=value,...' -> (name, {factor: multiplier}). A value is a
+    multiplier (0.6) or a percentage change (-40%).
+    """
+    name, _, body = spec.rpartition(':')
+    factors = {}
+    for item in body.split(','):
+        key, sep, value = (part.strip() for part in item.partition('='))
+        if not sep or key not in WHAT_IF_FACTORS:
+            raise ValueError(f"'{item.strip()}' in '{spec}' (factors: {', '.join(WHAT_IF_FACTORS)})")
+        try:
+            factor = 1 + float(value[:-1]) / 100 if value.endswith('%') else float(value)
+        except ValueError:
+            raise ValueError(f"'{item.strip()}' in '{spec}' is not a multiplier or percentage") from None
+        if factor < 0:
+            raise ValueError(f"'{item.strip()}' in '{spec}' would make costs negative")
+        factors[key] = factor
+    return name.strip() or body.strip(), factors
+
+# ------------ Output Section ------------
 
-def print_summary(accounts, regions, use_org, include_dto, nat_totals, dto_totals):
+def print_summary(accounts, regions, use_org, include_dto, nat_totals, dto_totals, costs=None):
     print_both("\n=== Analysis Summary ===")
     print_both(f"- AWS Organizations mode: {'Yes' if use_org else 'No'}")
     print_both(f"- NAT Gateway Analysis: Yes")
@@ -524,68 +2475,354 @@ def print_summary(accounts, regions, use_org, include_dto, nat_totals, dto_total
     if include_dto:
         print_both("\n[!] Reminder: DTO data shown below is based on billing visibility from the current account session. For Org-wide DTO totals, run from the management account.\n")
 
-        nat_egress = nat_totals["Total NAT Upload GB"]
+        directional = nat_totals.get("Directional", True)
+        nat_egress = nat_totals["Total NAT Upload GB"] if directional else nat_totals["Total NAT GB"]
         dto_total = dto_totals["Total DTO GB"]
         diff = dto_total - nat_egress
-        print_both("\n=== DTO vs NAT Upload Comparison ===")
+        print_both("\n=== DTO vs NAT Upload Comparison ===" if directional else "\n=== DTO vs NAT Processed Comparison ===")
         print_both("\n- Total DTO (Data Transfer Out) traffic over last 12 months: {:.2f} GB".format(dto_totals["Total DTO GB"]))
         print_both("- Average monthly DTO traffic for quoting: {:.2f} GB".format(dto_totals["Average DTO GB per month"]))
         print_both("- Difference (DTO vs NAT Egress): {:.2f} GB".format(diff))
 
     print_both("\n=== NAT Gateway Traffic Breakdown ===")
 
-    print_both("- Total NAT Gateway Upload (egress) over last 12 months: {:.2f} GB".format(nat_totals["Total NAT Upload GB"]))
-    print_both("- Average monthly NAT Gateway Upload: {:.2f} GB".format(nat_totals["Average NAT Upload GB per month"]))
+    if nat_totals.get("Directional", True):
+        print_both("- Total NAT Gateway Upload (egress) over last 12 months: {:.2f} GB".format(nat_totals["Total NAT Upload GB"]))
+        print_both("- Average monthly NAT Gateway Upload: {:.2f} GB".format(nat_totals["Average NAT Upload GB per month"]))
 
-    print_both("- Total NAT Gateway Download (ingress) over last 12 months: {:.2f} GB".format(nat_totals["Total NAT Download GB"]))
-    print_both("- Average monthly NAT Gateway Download: {:.2f} GB".format(nat_totals["Average NAT Download GB per month"]))
+        print_both("- Total NAT Gateway Download (ingress) over last 12 months: {:.2f} GB".format(nat_totals["Total NAT Download GB"]))
+        print_both("- Average monthly NAT Gateway Download: {:.2f} GB".format(nat_totals["Average NAT Download GB per month"]))
+    else:
+        print_both("- Upload/Download split: not available (billing data only reports bytes processed in both directions)")
 
     print_both("\n- Total NAT Gateway traffic over last 12 months: {:.2f} GB".format(nat_totals["Total NAT GB"]))
     print_both("- Average monthly NAT Gateway traffic for quoting: {:.2f} GB".format(nat_totals["Average NAT GB per month"]))
 
-def print_detailed_tables(df):
+    if costs is not None:
+        print_cost_summary(costs, include_dto)
+
+    if metric_call_stats["legacy"]:
+        saved = metric_call_stats["legacy"] - metric_call_stats["batched"]
+        print_both("\n=== CloudWatch API Usage ===")
+        print_both(f"- GetMetricData calls made: {metric_call_stats['batched']}")
+        print_both(f"- API calls saved vs. per-gateway get_metric_statistics: {saved}")
+    if metric_call_stats["ce"]:
+        print_both(f"- Cost Explorer calls made: {metric_call_stats['ce']}")
+    if resilience_stats["retries"] or resilience_stats["throttles"] or resilience_stats["budget_exhausted"]:
+        print_both(f"- Retries: {resilience_stats['retries']}, throttled responses: {resilience_stats['throttles']}, "
+                   f"retries refused by the retry budget: {resilience_stats['budget_exhausted']}")
+
+    print_missing_data(nat_totals.get("Missing NAT rows", 0))
+    if gateway_series is not None and len(gateway_series):
+        print_daily_summary()
+
+def print_cost_summary(costs, include_dto):
+    totals = cost_totals(costs)
+    currency = price_table.currency
+    gateway_hours = costs['usage']['Gateway Hours'].sum()
+    print_both(f"\n=== Estimated Cost ({currency}, price table {price_table.version}) ===")
+    print_both("- NAT Gateway data processing over last 12 months: {:.2f} {}".format(totals['NAT Processing'], currency))
+    if gateway_hours:
+        print_both("- NAT Gateway hours over last 12 months: {:.2f} {} ({:.0f} gateway-hours)".format(totals['NAT Hours'], currency, gateway_hours))
+    else:
+        print_both("- NAT Gateway hours: not priced (no gateways for these accounts in the inventory)")
+    if include_dto:
+        print_both("- Internet DTO over last 12 months: {:.2f} {}".format(totals['DTO'], currency))
+    print_both("- Total over last 12 months: {:.2f} {}".format(totals['Total'], currency))
+    print_both("- Average monthly cost for quoting: {:.2f} {}".format(totals['Average per month'], currency))
+    forecast = costs['forecast']
+    if len(forecast):
+        volumes = "{:.2f} GB NAT processed".format(forecast['NAT GB'].sum())
+        if include_dto:
+            volumes += ", {:.2f} GB DTO".format(forecast['DTO GB'].sum())
+        print_both("- Forecast for the next {} months (linear trend per account/region): {:.2f} {} ({})".format(
+            FORECAST_MONTHS, totals['Forecast'], currency, volumes))
+    if costs['approximated_gateways']:
+        print_both(f"[!] Gateway hours are approximate for {costs['approximated_gateways']} gateway(s) known only from CloudWatch "
+                   "or in regions never fully refreshed: they run from their first to their last datapoint or sighting")
+    if costs['unlisted']:
+        print_both(f"[!] Regions missing from {os.path.basename(price_table.path)}, priced at its default rates: {', '.join(costs['unlisted'])}")
+    if what_if_scenarios:
+        print_what_if(costs, what_if_scenarios)
+
+def print_what_if(costs, scenarios):
+    """Reprice the estimate once per scenario and compare it to the baseline."""
+    baseline = cost_totals(costs)
+    rows = []
+    for name, factors in [('baseline', {})] + list(scenarios):
+        totals = cost_totals(costs, factors) if factors else baseline
+        row = {'Scenario': name}
+        row.update((column, totals[column]) for column in COST_COLUMNS)
+        row['Change'] = totals['Total'] - baseline['Total']
+        row[f'Forecast {FORECAST_MONTHS} Months'] = totals['Forecast']
+        rows.append(row)
+    print_both(f"\n=== What-if Scenarios ({price_table.currency}, last 12 months) ===")
+    print_both(pd.DataFrame(rows).round(2).to_string(index=False))
+
+def what_if_prompt(costs):
+    if input("\nTry what-if scenarios on the cost estimate? (y/n): ").strip().lower() != "y":
+        return
+    print_both(f"Factors: {', '.join(f'{key} ({label})' for key, label in WHAT_IF_FACTORS.items())}")
+    print_both("Values are multipliers or percentage changes, e.g. endpoints:nat=0.6 or nat_price=-10%")
+    scenarios = []
+    while True:
+        spec = input("What-if scenario (blank to finish): ").strip()
+        if not spec:
+            return
+        try:
+            scenarios.append(parse_what_if(spec))
+        except ValueError as e:
+            print_both(f"[!] Invalid scenario: {e}")
+            continue
+        print_what_if(costs, scenarios)
+
+def print_daily_summary(top_n=5):
+    stats = gateway_series.stats_frame()
+    fleet = gateway_series.fleet_stats()
+    if stats.empty or fleet is None:
+        return
+    print_both("\n=== NAT Gateway Daily Analytics ===")
+    print_both(f"- NAT Gateways with daily data: {len(stats)}")
+    print_both("- Fleet peak day: {} ({:.2f} GB)".format(fleet['Peak Day'], fleet['Peak Day GB']))
+    print_both("- Fleet p95 daily egress: {:.2f} GB".format(fleet['P95 Daily Egress GB']))
+    print_both(f"- Top {min(top_n, len(stats))} NAT Gateways by p95 daily egress:")
+    for _, row in stats.nlargest(top_n, 'P95 Daily Egress GB').iterrows():
+        growth = "n/a" if pd.isna(row['MoM Growth %']) else f"{row['MoM Growth %']:+.1f}%"
+        print_both(f"  - {row['Account']}/{row['Region']}/{row['Gateway']}: p95 {row['P95 Daily Egress GB']:.2f} GB/day, "
+                   f"peak {row['Peak Day GB']:.2f} GB on {row['Peak Day']}, MoM growth {growth}")
+
+def print_missing_data(missing_rows, limit=20):
+    if not missing_rows and not missing_units:
+        return
+    print_both("\n=== Missing Data ===")
+    if missing_rows:
+        print_both(f"- {missing_rows} account/region/month values could not be collected; the totals above exclude them")
+    if open_circuits:
+        print_both(f"- Accounts skipped by the circuit breaker: {', '.join(sorted(open_circuits))}")
+    for (account_id, region), reason in sorted(missing_units.items())[:limit]:
+        print_both(f"  - {account_id}/{region}: {reason}")
+    if len(missing_units) > limit:
+        print_both(f"  - ... and {len(missing_units) - limit} more")
+
+def print_detailed_tables(df, dto_df=None, costs=None):
+    with timed('pandas'):
+        gw_stats = gateway_series.stats_frame() if gateway_series is not None else None
+        _print_detailed_tables(df, dto_df, gw_stats, costs)
+
+def _print_detailed_tables(df, dto_df, gw_stats, costs=None):
     # Get last 12 full months only
     all_months_sorted = sorted(df["Month"].unique())
     last_12_months = all_months_sorted[-12:]
     df = df[df["Month"].isin(last_12_months)]
-
-    accounts = df["Account"].unique()
+    if dto_df is not None:
+        dto_df = dto_df[dto_df["Month"].isin(last_12_months)]
+
+    accounts = list(df["Account"].unique())
+    if dto_df is not None:
+        accounts += [a for a in dto_df["Account"].unique() if a not in accounts]
+
+    # Split once instead of filtering the whole frame for every account
+    nat_groups = dict(tuple(df.groupby("Account", sort=False)))
+    dto_groups = dict(tuple(dto_df.groupby("Account", sort=False))) if dto_df is not None else {}
+    gw_groups = dict(tuple(gw_stats.groupby("Account", sort=False))) if gw_stats is not None else {}
+    cost_groups = {}
+    if costs is not None:
+        by_region = costs["cost"].groupby(["Account", "Region"])[COST_COLUMNS].sum()
+        forecast = costs["forecast_cost"].groupby(["Account", "Region"])["Total"].sum()
+        by_region[f"Forecast {FORECAST_MONTHS} Months"] = forecast.reindex(by_region.index).fillna(0)
+        cost_groups = {account: table.droplevel("Account") for account, table in by_region.groupby(level="Account", sort=False)}
 
     for account in accounts:
-        print_both(f"\n=== Detailed NAT Gateway Traffic for Account: {account} ===")
-        subset = df[df["Account"] == account]
-
-        pivot = subset.pivot_table(
-            index="Region",
-            columns="Month",
-            values="Total GB",
-            aggfunc="sum",
-            fill_value=0
-        )
+        subset = nat_groups.get(account, df.iloc[0:0])
+        if subset.empty or subset["Upload GB"].notna().any():
+            nat_label, nat_upload = "NAT Upload", subset["Upload GB"].sum()
+        else:
+            nat_label, nat_upload = "NAT processed", subset["Total GB"].sum()
 
-        # Add a total row
-        pivot.loc["Total"] = pivot.sum()
+        if not subset.empty:
+            print_both(f"\n=== Detailed NAT Gateway Traffic for Account: {account} ===")
 
-        # Calculate grand total across all regions and months
-        grand_total = pivot.loc["Total"].sum()
+            pivot = subset.pivot_table(
+                index="Region",
+                columns="Month",
+                values="Total GB",
+                aggfunc="sum",
+                fill_value=0
+            )
 
-        # Print the table and grand total
-        print_both(pivot.round(2).to_string())
-        print_both(f"\n[✓] Grand Total NAT traffic for {account}: {grand_total:.2f} GB")
+            # Add a total row
+            pivot.loc["Total"] = pivot.sum()
+
+            # Calculate grand total across all regions and months
+            grand_total = pivot.loc["Total"].sum()
+
+            # Print the table and grand total
+            print_both(pivot.round(2).to_string())
+            print_both(f"\n[✓] Grand Total NAT traffic for {account}: {grand_total:.2f} GB")
+            gaps = subset[subset["Total GB"].isna()]
+            if not gaps.empty:
+                print_both(f"[!] {len(gaps)} region/month values could not be collected for {account} and are excluded "
+                           f"(regions: {', '.join(sorted(gaps['Region'].unique()))})")
+
+        gateways = gw_groups.get(account)
+        if gateways is not None and not gateways.empty:
+            print_both(f"\n=== Per-Gateway Daily Statistics for Account: {account} ===")
+            gateways = gateways.drop(columns="Account").sort_values(["Region", "Gateway"])
+            print_both(gateways.to_string(index=False, na_rep="n/a"))
+
+        dto_subset = dto_groups.get(account) if dto_df is not None else None
+        if dto_subset is not None and not dto_subset.empty:
+            print_both(f"\n=== Detailed DTO (Data Transfer Out) for Account: {account} ===")
+            dto_pivot = dto_subset.pivot_table(
+                index="Region",
+                columns="Month",
+                values="DTO GB",
+                aggfunc="sum",
+                fill_value=0
+            )
+            dto_pivot.loc["Total"] = dto_pivot.sum()
+            dto_total = dto_pivot.loc["Total"].sum()
+            print_both(dto_pivot.round(2).to_string())
+            print_both(f"\n[✓] Grand Total DTO for {account}: {dto_total:.2f} GB "
+                       f"({nat_label}: {nat_upload:.2f} GB, difference: {dto_total - nat_upload:.2f} GB)")
+
+        account_costs = cost_groups.get(account)
+        if account_costs is not None:
+            print_both(f"\n=== Estimated Cost for Account: {account} ({price_table.currency}) ===")
+            account_costs = account_costs.copy()
+            account_costs.loc["Total"] = account_costs.sum()
+            print_both(account_costs.round(2).to_string())
+
+# ------------ Run Profile ------------
+
+def _rollup(calls, field):
+    """
+    Sum per-call counters by one label (api, region or account).
+    """
+    totals = {}
+    for call in calls:
+        total = totals.setdefault(call[field], {'calls': 0, 'errors': 0, 'retries': 0, 'throttles': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+        for key in ('calls', 'errors', 'retries', 'throttles', 'seconds'):
+            total[key] += call[key]
+        total['max_seconds'] = max(total['max_seconds'], call['max_seconds'])
+    return [{field: name, **total} for name, total in sorted(totals.items(), key=lambda t: -t[1]['seconds'])]
+
+def build_profile():
+    with _profile_lock:
+        calls = [
+            {'api': api, 'region': region, 'account': account_id, **entry, 'buckets': list(entry['buckets'])}
+            for (api, region, account_id), entry in sorted(_call_stats.items())
+        ]
+        phases = {phase: dict(timing) for phase, timing in phase_timings.items()}
+        units = sorted(unit_timings.items(), key=lambda t: -t[1])
+
+    api_totals = _rollup(calls, 'api')
+    for total in api_totals:
+        buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        for call in calls:
+            if call['api'] == total['api']:
+                buckets = [a + b for a, b in zip(buckets, call['buckets'])]
+        total['buckets'] = buckets
+
+    return {
+        'started_at': run_started.isoformat(),
+        'wall_seconds': round((datetime.now(timezone.utc) - run_started).total_seconds(), 3),
+        'args': sys.argv[1:],
+        'latency_buckets': list(LATENCY_BUCKETS),
+        'totals': {key: sum(call[key] for call in calls) for key in ('calls', 'errors', 'retries', 'throttles', 'seconds')},
+        'phases': phases,
+        'by_api': api_totals,
+        'slowest_accounts': _rollup(calls, 'account')[:PROFILE_TOP_N],
+        'slowest_regions': _rollup(calls, 'region')[:PROFILE_TOP_N],
+        'slowest_units': [{'account': a, 'region': r, 'seconds': round(sec, 3)} for (a, r), sec in units[:PROFILE_TOP_N]],
+        'metric_calls': dict(metric_call_stats),
+        'resilience': dict(resilience_stats),
+        'calls': calls,
+    }
+
+def _prometheus_labels(**labels):
+    return ','.join(f'{key}="{value}"' for key, value in labels.items())
+
+def write_prometheus_textfile(profile, path):
+    """
+    Write the profile in the node_exporter textfile format. Swapped in
+    atomically so the collector never reads a partial file.
+    """
+    lines = []
+    counters = (
+        ('calls', 'egress_aws_requests_total', 'AWS requests made'),
+        ('errors', 'egress_aws_request_errors_total', 'AWS requests that failed'),
+        ('retries', 'egress_aws_request_retries_total', 'AWS requests retried'),
+        ('throttles', 'egress_aws_request_throttles_total', 'AWS requests throttled'),
+    )
+    for field, name, help_text in counters:
+        lines += [f"# HELP {name} {help_text}, by API, region and account.", f"# TYPE {name} counter"]
+        for call in profile['calls']:
+            labels = _prometheus_labels(api=call['api'], region=call['region'], account=call['account'])
+            lines.append(f"{name}{{{labels}}} {call[field]}")
+
+    name = 'egress_aws_request_duration_seconds'
+    lines += [f"# HELP {name} AWS request latency, by API, region and account.", f"# TYPE {name} histogram"]
+    for call in profile['calls']:
+        labels = _prometheus_labels(api=call['api'], region=call['region'], account=call['account'])
+        cumulative = 0
+        for le, count in zip([*LATENCY_BUCKETS, '+Inf'], call['buckets']):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {call['seconds']:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {call['calls']}")
+
+    name = 'egress_phase_seconds'
+    lines += [f"# HELP {name} Time spent per run phase.", f"# TYPE {name} gauge"]
+    for phase, timing in sorted(profile['phases'].items()):
+        lines.append(f'{name}{{phase="{phase}"}} {timing["seconds"]:.6f}')
+    lines += [
+        "# HELP egress_run_duration_seconds Wall time of the run.",
+        "# TYPE egress_run_duration_seconds gauge",
+        f"egress_run_duration_seconds {profile['wall_seconds']}",
+        "# HELP egress_run_timestamp_seconds When the run started.",
+        "# TYPE egress_run_timestamp_seconds gauge",
+        f"egress_run_timestamp_seconds {run_started.timestamp():.0f}",
+    ]
+
+    tmp_file = path + '.tmp'
+    with open(tmp_file, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmp_file, path)
+
+def write_profile():
+    if not (profile_file or prometheus_file) or not (_call_stats or unit_timings):
+        return
+    profile = build_profile()
+    if profile_file:
+        with open(profile_file, 'w') as f:
+            json.dump(profile, f, indent=2)
+        print_both(f"[✓] Run profile written to {profile_file}")
+    if prometheus_file:
+        write_prometheus_textfile(profile, prometheus_file)
+        print_both(f"[✓] Prometheus metrics written to {prometheus_file}")
 
 @atexit.register
 def cleanup_cache():
     global success_flag, output_file
     try:
         if success_flag:
-            if os.path.exists(NAT_CACHE_FILE):
-                os.remove(NAT_CACHE_FILE)
-            if os.path.exists(DTO_CACHE_FILE):
-                os.remove(DTO_CACHE_FILE)
+            remove_checkpoint_files()
+            if os.path.exists(CREDENTIAL_CACHE_FILE):
+                os.remove(CREDENTIAL_CACHE_FILE)
             print_both(f"\n[✓] Deleted cache files after successful run.")
+        elif checkpoints is not None:
+            checkpoints.close()
+        if history is not None:
+            history.close()
     except Exception as e:
         print_both(f"\n[!] Could not delete cache files: {e}")
 
+    try:
+        write_profile()
+    except Exception as e:
+        print_both(f"[!] Could not write run profile: {e}")
+
     # Finally close output file (after all prints are done)
     if output_file:
         try:
@@ -593,6 +2830,1022 @@ def cleanup_cache():
         except Exception as e:
             print(f"[!] Could not close output file cleanly: {e}")
 
+# ------------ Sharded Runs ------------
+
+PARTIAL_FILE_PATTERN = 'nat-partial-{index}-of-{count}.csv'
+SHARD_SUFFIX = '.shard-{index}-of-{count}'
+
+def shard_file(path, index, count):
+    """path with the shard suffix before its extension, e.g. x.shard-0-of-4.json."""
+    root, ext = os.path.splitext(path)
+    return root + SHARD_SUFFIX.format(index=index, count=count) + ext
+
+def merge_shard_inventories():
+    """
+    Fold the shard inventories (nat_gateway_inventory.shard-I-of-N.json)
+    into the loaded main inventory, save it, and return the merged files.
+    """
+    merged = []
+    for path in sorted(glob.glob(shard_file(INVENTORY_FILE, '*', '*'))):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            if data.get('Version') != INVENTORY_VERSION:
+                raise ValueError(f"unsupported version {data.get('Version')}")
+        except Exception as e:
+            print_both(f"[!] Ignoring shard inventory {path}: {e}")
+            continue
+        merge_inventory(data['Accounts'])
+        merged.append(path)
+    if merged:
+        save_inventory()
+        print_both(f"[✓] Merged {len(merged)} shard inventories into {INVENTORY_FILE}")
+    return merged
+
+def parse_shard(value):
+    index, _, count = value.partition('/')
+    index, count = int(index), int(count)
+    if not 0 <= index < count:
+        raise ValueError(f"shard index must be between 0 and {count - 1}")
+    return index, count
+
+def shard_of(account_id, shard_count):
+    # crc32 is stable across processes and hosts, unlike hash()
+    return zlib.crc32(account_id.encode()) % shard_count
+
+def shard_accounts(args):
+    if args.accounts:
+        return [a.strip() for a in args.accounts.split(',') if a.strip()]
+    return get_all_accounts()
+
+def run_shard(args):
+    """
+    Collect NAT usage for the accounts in one shard and write a partial
+    result file for `merge`. Runs unattended; unfinished units in the
+    checkpoint store are resumed.
+    """
+    global resume_mode
+    shard_index, shard_count = parse_shard(args.shard)
+    if not args.role_name:
+        print_both("[!] --shard requires --role-name")
+        sys.exit(2)
+    resume_mode = True
+    load_credential_cache()
+    load_inventory()
+
+    regions = resolve_regions(args.regions)
+    accounts = [a for a in shard_accounts(args) if shard_of(a, shard_count) == shard_index]
+    print_both(f"[✓] Shard {shard_index}/{shard_count}: {len(accounts)} accounts, {len(regions)} regions")
+
+    nat, _ = run_org_query(accounts, args.role_name, regions, False)
+    nat_df = build_nat_df(nat, accounts, regions)
+    partial_file = args.partial_output or PARTIAL_FILE_PATTERN.format(index=shard_index, count=shard_count)
+    nat_df.to_csv(partial_file, index=False)
+    print_both(f"[✓] Shard {shard_index}/{shard_count}: wrote {len(nat_df)} rows to {partial_file}")
+
+def run_local_shards(args, argv):
+    """
+    Run every shard as a separate local process, then merge the partials.
+    """
+    shard_count = args.shards
+    if not args.role_name:
+        print_both("[!] --shards requires --role-name")
+        sys.exit(2)
+    if not args.resume:
+        for index in range(shard_count):
+            remove_store_files(shard_file(CHECKPOINT_FILE, index, shard_count))
+
+    # List accounts (and refresh regions) once here instead of once per shard
+    accounts = ','.join(shard_accounts(args))
+    if refresh_regions:
+        get_region_list()
+    base_args = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg == '--refresh-regions':
+            continue
+        elif arg in ('--shards', '--accounts', '--shard-processes'):
+            skip = True
+        elif not arg.startswith(('--shards=', '--accounts=', '--shard-processes=')):
+            base_args.append(arg)
+
+    def run_one(index):
+        log_file = f"shard-{index}-of-{shard_count}.log"
+        command = [sys.executable, os.path.abspath(__file__), *base_args,
+                   '--shard', f"{index}/{shard_count}", '--accounts', accounts]
+        with open(log_file, 'w') as log:
+            return subprocess.run(command, stdout=log, stderr=subprocess.STDOUT).returncode, log_file
+
+    processes = args.shard_processes or shard_count
+    print_both(f"[✓] Launching {shard_count} shards ({processes} at a time); logs in shard-*-of-{shard_count}.log")
+    with ThreadPoolExecutor(max_workers=processes) as pool:
+        results = list(pool.map(run_one, range(shard_count)))
+
+    failed = [log_file for returncode, log_file in results if returncode != 0]
+    if failed:
+        print_both(f"[!] {len(failed)} shard(s) failed, see: {', '.join(failed)}. Re-run with --resume to retry them.")
+        sys.exit(1)
+    run_merge([PARTIAL_FILE_PATTERN.format(index=i, count=shard_count) for i in range(shard_count)], args.details)
+    # Merged: the shards' checkpoint stores are only needed to resume them
+    for index in range(shard_count):
+        remove_store_files(shard_file(CHECKPOINT_FILE, index, shard_count))
+
+def run_merge(files, show_details=False):
+    """
+    Combine partial shard files, de-duplicate them and print the usual
+    summary over the union. Shard inventories are folded into the main
+    inventory. Makes no AWS calls, and leaves the checkpoint store and
+    credential cache of other runs alone.
+    """
+    files = files or sorted(glob.glob(PARTIAL_FILE_PATTERN.format(index='*', count='*')))
+    if not files:
+        print_both("[!] No partial result files to merge.")
+        sys.exit(1)
+
+    open_output_file()
+    # Account IDs can have leading zeros, so never let pandas parse them as numbers
+    with timed('pandas'):
+        frames = [pd.read_csv(f, dtype={'Account': str}) for f in files]
+        nat_df = pd.concat(frames, ignore_index=True)
+        nat_df = nat_df.drop_duplicates(subset=['Account', 'Region', 'Month'], keep='last')
+        nat_df = nat_df.sort_values(['Month', 'Account', 'Region'], ignore_index=True)
+    print_both(f"[✓] Merged {len(nat_df)} rows from {len(files)} partial files")
+
+    if nat_df.empty:
+        print_both("No NAT Gateway usage data found.")
+        sys.exit(0)
+
+    accounts = sorted(nat_df['Account'].unique())
+    regions = sorted(nat_df['Region'].unique())
+    dto_totals = {"Total DTO GB": 0, "Average DTO GB per month": 0}
+    # Gateway hours and flowlogs ENIs need the gateways every shard found
+    load_inventory()
+    shard_inventories = merge_shard_inventories()
+    costs = estimate_costs(nat_df)
+    print_both("\n=== ORG NAT + DTO Usage Summary ===\n")
+    print_summary(accounts, regions, True, False, summarize_nat(nat_df), dto_totals, costs)
+    if show_details:
+        print_detailed_tables(nat_df, costs=costs)
+
+    # Merged: the shard inventories are folded in and the shards' cached
+    # credentials are no longer needed
+    for path in shard_inventories + glob.glob(shard_file(CREDENTIAL_CACHE_FILE, '*', '*')):
+        os.remove(path)
+
+# ------------ Batch Runs ------------
+# One target is one headless run of the usual analysis. Keys not set on a
+# target fall back to the config's `defaults`, then to these values.
+TARGET_DEFAULTS = {
+    'name': None,
+    'profile': None,  # AWS named profile for the caller's credentials
+    'org': None,  # defaults to True when role_name is set
+    'role_name': None,
+    'accounts': None,  # list (or comma-separated string); Org mode lists the Organization when unset
+    'regions': 'all',
+    'dto': False,
+    'details': False,
+    'resume': False,  # continue the target's own checkpoint store if a previous run left one
+}
+
+def _as_list(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return [v.strip() for v in value.split(',') if v.strip()]
+    return [str(v).strip() for v in value]
+
+def make_target(values, index):
+    unknown = set(values) - set(TARGET_DEFAULTS)
+    if unknown:
+        raise ValueError(f"unknown target setting(s): {', '.join(sorted(unknown))}")
+    target = dict(TARGET_DEFAULTS, **values)
+    target['name'] = str(target['name'] or target['profile'] or f"target-{index + 1}")
+    target['slug'] = re.sub(r'[^A-Za-z0-9_.-]+', '-', target['name'])
+    target['accounts'] = _as_list(target['accounts'])
+    if isinstance(target['regions'], str) and target['regions'].strip().lower() == 'all':
+        target['regions'] = 'all'
+    else:
+        target['regions'] = _as_list(target['regions'])
+    if target['org'] is None:
+        target['org'] = bool(target['role_name'])
+    if target['org'] and not target['role_name']:
+        raise ValueError(f"target {target['name']}: Org mode needs role_name")
+    return target
+
+def load_batch_config(path):
+    """
+    Read batch targets from a YAML (.yaml/.yml, needs PyYAML) or TOML file:
+
+        [defaults]
+        regions = ["us-east-1", "eu-west-1"]
+        dto = true
+
+        [[targets]]
+        name = "payer-a"
+        profile = "payer-a"
+        role_name = "EgressReaderRole"
+    """
+    if path.lower().endswith('.toml'):
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise RuntimeError("reading TOML configs needs Python 3.11+ or tomli (pip install tomli)")
+        with open(path, 'rb') as f:
+            data = tomllib.load(f)
+    else:
+        try:
+            import yaml
+        except ImportError:
+            raise RuntimeError("reading YAML configs needs PyYAML (pip install pyyaml), or use a .toml config")
+        with open(path) as f:
+            data = yaml.safe_load(f) or {}
+    defaults = data.get('defaults') or {}
+    targets = [make_target(dict(defaults, **t), i) for i, t in enumerate(data.get('targets') or [])]
+    if not targets:
+        raise ValueError(f"{path} defines no targets")
+    names = [t['slug'] for t in targets]
+    duplicates = sorted({n for n in names if names.count(n) > 1})
+    if duplicates:
+        raise ValueError(f"target names must be unique: {', '.join(duplicates)}")
+    return targets
+
+def target_from_args(args):
+    return make_target({
+        'name': args.target_name,
+        'profile': args.aws_profile,
+        'org': True if args.org else None,
+        'role_name': args.role_name,
+        'accounts': args.accounts,
+        'regions': args.regions,
+        'dto': args.dto,
+        'details': args.details,
+        'resume': args.resume,
+    }, 0)
+
+def reset_target_state():
+    """
+    Forget the previous target's results and failures. Sessions, clients,
+    the worker pool, assumed-role credentials, learned rate limits, the
+    inventory and the history store are kept.
+    """
+    global gateway_series, result_export, _retry_tokens
+    with _resilience_lock:
+        missing_units.clear()
+        open_circuits.clear()
+        _access_denied.clear()
+        _retry_tokens = None
+        for key in resilience_stats:
+            resilience_stats[key] = 0
+    with stats_lock:
+        for key in metric_call_stats:
+            metric_call_stats[key] = 0
+    with _credential_lock:
+        # A role may be assumable with the next target's caller credentials
+        _failed_roles.clear()
+    gateway_series = None
+    result_export = None
+
+def close_checkpoints():
+    global checkpoints
+    with _checkpoint_lock:
+        if checkpoints is not None:
+            checkpoints.close()
+            checkpoints = None
+
+def run_target(target):
+    global resume_mode, CHECKPOINT_FILE, aws_profile, success_flag
+    # analyze() marks each finished target successful; an interrupted target
+    # must not inherit that, or cleanup_cache would delete its checkpoint
+    # store. run_batch sets the flag once every target has run.
+    success_flag = False
+    CHECKPOINT_FILE = f"egress_checkpoint.{target['slug']}.sqlite"
+    aws_profile = target['profile']
+    reset_target_state()
+    print_both(f"=== Target: {target['name']} ===")
+    print_both(f"- AWS profile: {target['profile'] or 'default credentials'}")
+    resume_mode = target['resume'] and os.path.exists(CHECKPOINT_FILE)
+    if resume_mode:
+        print_both(f"[✓] Resuming {len(get_checkpoints().done_units)} finished account/region pairs from {CHECKPOINT_FILE}")
+    else:
+        remove_checkpoint_files()
+    regions = resolve_regions(target['regions']) if target['regions'] == 'all' else target['regions']
+    accounts = None
+    if target['org']:
+        accounts = target['accounts'] or get_all_accounts()
+    if not analyze(target['org'], target['dto'], regions, target['role_name'], accounts, target['details']):
+        print_both(f"[!] Target {target['name']}: no NAT Gateway usage data found.")
+    # Finished: the checkpoint store is only needed to resume a failed target
+    remove_checkpoint_files()
+
+def run_batch(targets):
+    """
+    Run every target headlessly, one after another, in this process. The
+    boto3 sessions, client pool, worker pool, credential cache, inventory
+    and history store are shared, so later targets start warm; each target
+    gets its own output file and checkpoint store. A failed target does not
+    stop the batch, and its checkpoint store is kept for `resume`.
+    """
+    global interactive, success_flag, output_file
+    interactive = False
+    load_credential_cache()
+    load_inventory()
+    failed = []
+    for target in targets:
+        open_output_file(target['slug'])
+        try:
+            run_target(target)
+        except Exception as e:
+            failed.append(target['name'])
+            print_both(f"\n[!] Target {target['name']} failed: {e}")
+            close_checkpoints()
+            if os.path.exists(CHECKPOINT_FILE):
+                print_both(f"    Its progress is kept in {CHECKPOINT_FILE}; set resume for this target to continue it.")
+        finally:
+            output_file.close()
+            output_file = None
+
+    succeeded = len(targets) - len(failed)
+    print(f"\n[✓] Batch finished: {succeeded}/{len(targets)} targets succeeded")
+    # cleanup_cache removes the credential cache only when every target succeeded
+    success_flag = not failed
+    if failed:
+        print(f"[!] Failed targets: {', '.join(failed)}")
+        sys.exit(1)
+
+# ------------ Cost and Usage Report Ingest ------------
+# NAT Gateway data processing usage types, e.g. NatGateway-Bytes (us-east-1),
+# USE2-NatGateway-Bytes. Billing has no upload/download split for these.
+NAT_USAGE_TYPE_PATTERN = re.compile(r'^(?:[A-Z0-9]+-)?NatGateway-Bytes$')
+# Pushed down into Parquet scans; rows are matched exactly against the patterns afterwards
+CUR_USAGE_TYPE_FILTER = r'(NatGateway|DataTransfer-Out)-Bytes$'
+CUR_FILE_SUFFIXES = ('.parquet', '.csv.gz', '.csv')
+# Line item types that carry usage; Tax, Credit, Refund etc. repeat or offset it
+CUR_USAGE_LINE_ITEMS = {'Usage', 'DiscountedUsage', 'SavingsPlanCoveredUsage'}
+# Field -> candidate column names: CUR 2.0 / Athena Parquet first, then legacy CSV headers
+CUR_COLUMNS = {
+    'Account': ('line_item_usage_account_id', 'lineItem/UsageAccountId'),
+    'UsageType': ('line_item_usage_type', 'lineItem/UsageType'),
+    'Amount': ('line_item_usage_amount', 'lineItem/UsageAmount'),
+    'Start': ('line_item_usage_start_date', 'lineItem/UsageStartDate'),
+    'Region': ('product_region_code', 'product_region', 'product/regionCode', 'product/region'),
+    'LineItemType': ('line_item_line_item_type', 'lineItem/LineItemType'),
+    'ProductCode': ('line_item_product_code', 'lineItem/ProductCode'),
+}
+CUR_REQUIRED = ('Account', 'UsageType', 'Amount', 'Start')
+CUR_GROUP = ['Kind', 'Account', 'Region', 'Month']
+cur_chunk_rows = 500000
+
+def find_input_files(paths, suffixes):
+    """Expand directories into the data files below them."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files += [os.path.join(root, n) for n in names if n.lower().endswith(suffixes)]
+        elif os.path.exists(path):
+            files.append(path)
+        else:
+            print_both(f"[!] File not found: {path}")
+    return sorted(set(files))
+
+def read_files(read_file, files, processes, *args):
+    """
+    Yield (path, result, error) for read_file(path, *args) over all files,
+    in worker processes when processes > 1. read_file must be a
+    module-level function and should return small partial aggregates.
+    """
+    if processes > 1 and len(files) > 1:
+        with ProcessPoolExecutor(max_workers=min(processes, len(files))) as pool:
+            futures = {pool.submit(read_file, f, *args): f for f in files}
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    yield futures[future], None, e
+    else:
+        for f in files:
+            try:
+                yield f, read_file(f, *args), None
+            except Exception as e:
+                yield f, None, e
+
+def resolve_cur_columns(available, path):
+    names = {}
+    for field, candidates in CUR_COLUMNS.items():
+        found = next((c for c in candidates if c in available), None)
+        if found:
+            names[field] = found
+    missing = [f for f in CUR_REQUIRED if f not in names]
+    if missing:
+        raise ValueError(f"{path} is missing CUR columns for: {', '.join(missing)}")
+    return names
+
+def iter_cur_chunks(path, chunk_rows):
+    """
+    Yield (column names, DataFrame) chunks holding only the CUR columns we
+    use. Parquet scans skip row groups without NAT/DTO usage types.
+    """
+    if path.lower().endswith('.parquet'):
+        if not load_pyarrow():
+            raise RuntimeError("reading Parquet CUR files requires pyarrow (pip install pyarrow)")
+        dataset = pa_dataset.dataset(path, format='parquet')
+        names = resolve_cur_columns(dataset.schema.names, path)
+        usage_filter = pa_compute.match_substring_regex(pa_dataset.field(names['UsageType']), CUR_USAGE_TYPE_FILTER)
+        for batch in dataset.to_batches(columns=sorted(set(names.values())), filter=usage_filter, batch_size=chunk_rows):
+            if batch.num_rows:
+                yield names, batch.to_pandas()
+        return
+    # CSV (optionally gzipped) has no statistics to push a filter into, so
+    # stream it in chunks and filter each one; account IDs stay strings
+    names = resolve_cur_columns(pd.read_csv(path, nrows=0).columns, path)
+    for chunk in pd.read_csv(path, usecols=sorted(set(names.values())), dtype=str, chunksize=chunk_rows):
+        yield names, chunk
+
+def aggregate_cur_chunk(chunk, names, month_labels):
+    """GB per (Kind, Account, Region, Month) for the NAT and DTO line items of one chunk."""
+    usage = chunk[names['UsageType']].astype(str)
+    is_nat = usage.str.match(NAT_USAGE_TYPE_PATTERN.pattern)
+    is_dto = usage.str.match(DTO_USAGE_TYPE_PATTERN.pattern)
+    if 'ProductCode' in names:
+        is_dto &= ~chunk[names['ProductCode']].isin(DTO_EXCLUDED_PRODUCT_CODES)
+    keep = is_nat | is_dto
+    if 'LineItemType' in names:
+        keep &= chunk[names['LineItemType']].isin(CUR_USAGE_LINE_ITEMS)
+    chunk = chunk[keep]
+    start = chunk[names['Start']]
+    if pd.api.types.is_datetime64_any_dtype(start):
+        month = start.dt.strftime('%Y-%m')
+    else:
+        month = start.astype(str).str[:7]
+    rows = pd.DataFrame({
+        'Kind': np.where(is_nat[keep], 'nat', 'dto'),
+        'Account': chunk[names['Account']].astype(str).values,
+        'Region': chunk[names['Region']].fillna('global').replace('', 'global').astype(str).values
+                  if 'Region' in names else 'global',
+        'Month': month.values,
+        'GB': pd.to_numeric(chunk[names['Amount']], errors='coerce').fillna(0).values,
+    })
+    rows = rows[rows['Month'].isin(month_labels)]
+    return rows.groupby(CUR_GROUP)['GB'].sum()
+
+def read_cur_file(path, month_labels, chunk_rows):
+    """
+    Stream one CUR file and return its (Kind, Account, Region, Month) -> GB
+    totals. Only one chunk plus the small running totals is held at a time.
+    Runs in worker processes, so it must stay a module-level function.
+    """
+    totals = None
+    rows = 0
+    for names, chunk in iter_cur_chunks(path, chunk_rows):
+        rows += len(chunk)
+        part = aggregate_cur_chunk(chunk, names, month_labels)
+        totals = part if totals is None else totals.add(part, fill_value=0)
+    return rows, totals
+
+def load_cur_totals(files, processes, chunk_rows):
+    month_labels = [start.strftime('%Y-%m') for start, _ in get_monthly_ranges()]
+    partials = []
+    failed = []
+    for path, result, error in read_files(read_cur_file, files, processes, month_labels, chunk_rows):
+        if error is not None:
+            failed.append(path)
+            print_both(f"[!] Could not read {path}: {error}")
+            continue
+        rows, totals = result
+        if totals is not None:
+            partials.append(totals)
+        print_both(f"[✓] {path}: {rows} rows read")
+
+    with timed('pandas'):
+        if partials:
+            totals = pd.concat(partials).groupby(level=CUR_GROUP).sum()
+        else:
+            totals = pd.Series(dtype=float, index=pd.MultiIndex.from_tuples([], names=CUR_GROUP))
+    return totals, failed
+
+def run_cur(paths, processes=1, chunk_rows=None, regions_value='all', show_details=False):
+    """
+    Compute the NAT and DTO totals from local Cost and Usage Report files
+    (Parquet, CSV or CSV.gz) instead of CloudWatch and Cost Explorer.
+    Makes no AWS calls.
+    """
+    files = find_input_files(paths, CUR_FILE_SUFFIXES)
+    if not files:
+        print_both("[!] No CUR files found (expected *.parquet, *.csv.gz or *.csv).")
+        sys.exit(1)
+
+    open_output_file()
+    print_both(f"[✓] Reading {len(files)} CUR file(s) with {max(1, processes)} process(es)")
+    totals, failed = load_cur_totals(files, max(1, processes), chunk_rows or cur_chunk_rows)
+    if failed and len(failed) == len(files):
+        sys.exit(1)
+
+    regions = None
+    if regions_value.strip().lower() != 'all':
+        regions = {r.strip() for r in regions_value.split(',') if r.strip()}
+
+    nat = NatAggregator()
+    dto_rows = []
+    for (kind, account, region, month), gb in totals.items():
+        if regions is not None and region not in regions:
+            continue
+        if kind == 'nat':
+            nat.add(account, region, month, float('nan'), float('nan'), round(gb, 2))
+        else:
+            dto_rows.append((account, region, month, round(gb, 2)))
+
+    if not len(nat) and not dto_rows:
+        print_both("No NAT Gateway or DTO usage found in the CUR files.")
+        sys.exit(0)
+
+    with timed('pandas'):
+        dto_df = pd.DataFrame(dto_rows, columns=['Account', 'Region', 'Month', 'DTO GB'])
+        dto_df = dto_df.sort_values(['Month', 'Account', 'Region'], ignore_index=True)
+    nat_df = build_nat_df(nat, None, None)
+    accounts = sorted(set(nat_df['Account']) | set(dto_df['Account']))
+    used_regions = sorted(set(nat_df['Region']) | set(dto_df['Region']))
+
+    if price_table is not None:
+        load_inventory()
+    costs = estimate_costs(nat_df, dto_df)
+
+    print_both("\n=== ORG NAT + DTO Usage Summary (Cost and Usage Report) ===\n")
+    print_summary(accounts, used_regions, True, True, nat.summary(), summarize_dto(dto_df), costs)
+    if failed:
+        print_both(f"\n[!] {len(failed)} CUR file(s) could not be read and are excluded: {', '.join(failed)}")
+    if show_details:
+        print_detailed_tables(nat_df, dto_df, costs)
+
+# ------------ VPC Flow Log Analysis ------------
+FLOW_LOG_FILE_SUFFIXES = ('.parquet', '.gz', '.log', '.txt')
+# Default (version 2) flow log format, for text files without a header line
+FLOW_LOG_DEFAULT_FIELDS = ['version', 'account_id', 'interface_id', 'srcaddr', 'dstaddr', 'srcport', 'dstport',
+                           'protocol', 'packets', 'bytes', 'start', 'end', 'action', 'log_status']
+FLOW_LOG_FIELDS = ('interface_id', 'dstaddr', 'bytes', 'start', 'flow_direction')
+FLOW_LOG_REQUIRED = ('interface_id', 'dstaddr', 'bytes', 'start')
+IP_RANGES_FILE = 'ip-ranges.json'
+# Destinations here are the NAT Gateway's own VPC side, not egress
+PRIVATE_NETWORKS = ('10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16', '100.64.0.0/10', '169.254.0.0/16', '127.0.0.0/8')
+# Services a free VPC gateway endpoint can take off the NAT Gateway
+GATEWAY_ENDPOINT_SERVICES = ('S3', 'DYNAMODB')
+FLOW_INTERNET = -1  # public, not in ip-ranges.json
+FLOW_UNPARSED = -2  # IPv6 or unparseable destination
+FLOW_GROUP = ['Gateway', 'Month', 'Owner', 'Network']
+flow_chunk_rows = 1000000
+internet_prefix_length = 16
+
+def build_prefix_table(ip_ranges_file):
+    """
+    Flatten ip-ranges.json IPv4 prefixes (plus the private ranges) into
+    sorted, non-overlapping intervals so a whole column of destinations is
+    classified with one searchsorted. Nested prefixes are painted from
+    least to most specific, and a named service wins over the AMAZON
+    superset on the same prefix. Interval i covers bounds[i] up to
+    bounds[i + 1] - 1 and belongs to labels[owners[i]] (-1: not AWS).
+    """
+    entries = []
+    if ip_ranges_file and os.path.exists(ip_ranges_file):
+        with open(ip_ranges_file) as f:
+            data = json.load(f)
+        entries = [(p['ip_prefix'], p['service'], p.get('region', 'GLOBAL')) for p in data.get('prefixes', [])]
+        print_both(f"[✓] Loaded {len(entries)} AWS IPv4 prefixes from {ip_ranges_file} ({data.get('createDate', 'unknown date')})")
+    else:
+        print_both(f"[!] {ip_ranges_file} not found; AWS service destinations will be reported as INTERNET "
+                   "(download https://ip-ranges.amazonaws.com/ip-ranges.json)")
+    prefixes = []
+    for cidr, service, region in entries:
+        net = ipaddress.ip_network(cidr)
+        prefixes.append((0, net.prefixlen, service != 'AMAZON', net, (service, region, cidr)))
+    for cidr in PRIVATE_NETWORKS:
+        net = ipaddress.ip_network(cidr)
+        prefixes.append((1, net.prefixlen, True, net, ('PRIVATE', '', cidr)))
+    prefixes.sort(key=lambda p: p[:3])
+
+    starts = [int(p[3].network_address) for p in prefixes]
+    ends = [int(p[3].broadcast_address) + 1 for p in prefixes]
+    bounds = np.unique(np.array([0, 2**32] + starts + ends, dtype=np.int64))
+    owners = np.full(len(bounds), -1, dtype=np.int64)
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        owners[np.searchsorted(bounds, start):np.searchsorted(bounds, end)] = i
+    labels = [p[4] for p in prefixes]
+    private = np.array([label[0] == 'PRIVATE' for label in labels], dtype=bool)
+    return bounds, owners, labels, private
+
+def nat_gateway_enis(account_filter=None):
+    """Map each NAT Gateway ENI in the inventory to a gateway index."""
+    gateways = []
+    eni_index = {}
+    for account_id, account in sorted(nat_inventory.items()):
+        if account_filter and account_id not in account_filter:
+            continue
+        for region, entry in sorted(account.get('Regions', {}).items()):
+            for nat_id, gw in sorted(entry['Gateways'].items()):
+                enis = gw.get('NetworkInterfaceIds') or []
+                if enis:
+                    for eni in enis:
+                        eni_index[eni] = len(gateways)
+                    gateways.append((account_id, region, nat_id))
+    return gateways, eni_index
+
+def iter_flow_log_chunks(path, enis, chunk_rows):
+    """
+    Yield DataFrame chunks of the flow log fields we use, with field names
+    normalized to underscores. Parquet scans only return NAT Gateway ENIs.
+    """
+    if path.lower().endswith('.parquet'):
+        if not load_pyarrow():
+            raise RuntimeError("reading Parquet flow logs requires pyarrow (pip install pyarrow)")
+        dataset = pa_dataset.dataset(path, format='parquet')
+        columns = [c for c in dataset.schema.names if c.replace('-', '_') in FLOW_LOG_FIELDS]
+        fields = [c.replace('-', '_') for c in columns]
+        missing = [f for f in FLOW_LOG_REQUIRED if f not in fields]
+        if missing:
+            raise ValueError(f"missing flow log fields: {', '.join(missing)}")
+        eni_filter = pa_dataset.field(columns[fields.index('interface_id')]).isin(enis)
+        for batch in dataset.to_batches(columns=columns, filter=eni_filter, batch_size=chunk_rows):
+            if batch.num_rows:
+                yield batch.to_pandas().rename(columns=lambda c: c.replace('-', '_'))
+        return
+    # Text logs are space separated; files delivered to S3 start with a header line
+    opener = gzip.open if path.lower().endswith('.gz') else open
+    with opener(path, 'rt') as f:
+        first = f.readline().split()
+    header = [c.replace('-', '_') for c in first]
+    if 'interface_id' in header:
+        names, skip = header, 1
+    else:
+        names, skip = FLOW_LOG_DEFAULT_FIELDS, 0
+    missing = [f for f in FLOW_LOG_REQUIRED if f not in names]
+    if missing:
+        raise ValueError(f"missing flow log fields: {', '.join(missing)}")
+    usecols = [c for c in names if c in FLOW_LOG_FIELDS]
+    yield from pd.read_csv(path, sep=' ', header=None, names=names, skiprows=skip, usecols=usecols,
+                           dtype=str, chunksize=chunk_rows)
+
+def parse_ipv4(address):
+    try:
+        return int(ipaddress.IPv4Address(address))
+    except ValueError:
+        return FLOW_UNPARSED
+
+def aggregate_flow_chunk(chunk, eni_index, table, prefix_length):
+    """
+    Bytes per (gateway, month, destination owner, network) for the NAT
+    Gateway egress records of one chunk. Records to private addresses are
+    the VPC side of the gateway and are dropped.
+    """
+    bounds, owners, _, private = table
+    gateway = chunk['interface_id'].map(eni_index)
+    keep = gateway.notna()
+    if 'flow_direction' in chunk:
+        keep &= chunk['flow_direction'] != 'ingress'
+    chunk, gateway = chunk[keep], gateway[keep]
+    nbytes = pd.to_numeric(chunk['bytes'], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    start = pd.to_numeric(chunk['start'], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    # Each distinct destination is parsed once, however many records it has
+    codes, uniques = pd.factorize(chunk['dstaddr'])
+    addresses = np.array([parse_ipv4(a) for a in uniques] + [FLOW_UNPARSED], dtype=np.int64)
+    dst = addresses[codes]  # code -1 (missing) picks the trailing FLOW_UNPARSED
+    owner = np.where(dst >= 0, owners[np.searchsorted(bounds, np.maximum(dst, 0), side='right') - 1], FLOW_UNPARSED)
+    network = np.where(owner == FLOW_INTERNET, dst & ~((1 << (32 - prefix_length)) - 1), 0)
+    is_private = np.where(owner >= 0, private[np.maximum(owner, 0)], False)
+    valid = ~np.isnan(nbytes) & ~np.isnan(start) & ~is_private
+    rows = pd.DataFrame({
+        'Gateway': gateway.to_numpy()[valid].astype(np.int64),
+        'Month': start[valid].astype('datetime64[s]').astype('datetime64[M]').astype(np.int64),
+        'Owner': owner[valid],
+        'Network': network[valid],
+        'Bytes': nbytes[valid],
+    })
+    return rows.groupby(FLOW_GROUP)['Bytes'].sum()
+
+def read_flow_log_file(path, eni_index, table, chunk_rows, prefix_length):
+    """
+    Stream one flow log file and return its (gateway, month, owner,
+    network) -> bytes totals. Runs in worker processes.
+    """
+    totals = None
+    rows = 0
+    enis = list(eni_index)
+    for chunk in iter_flow_log_chunks(path, enis, chunk_rows):
+        rows += len(chunk)
+        part = aggregate_flow_chunk(chunk, eni_index, table, prefix_length)
+        totals = part if totals is None else totals.add(part, fill_value=0)
+    return rows, totals
+
+def build_flow_df(totals, gateways, table, prefix_length):
+    """Per account/region/month/destination egress GB, largest first."""
+    labels = table[2]
+    flows = totals.reset_index()
+    gateway = np.array(gateways, dtype=object).reshape(-1, 3)[flows['Gateway'].to_numpy()]
+    special = {FLOW_INTERNET: ('INTERNET', ''), FLOW_UNPARSED: ('IPV6/OTHER', '')}
+
+    def destination(owner, network):
+        if owner >= 0:
+            return labels[owner]
+        if owner == FLOW_INTERNET:
+            return special[owner] + (f"{ipaddress.IPv4Address(int(network))}/{prefix_length}",)
+        return special[owner] + ('-',)
+
+    pairs = flows[['Owner', 'Network']].drop_duplicates()
+    lookup = {(o, n): destination(o, n) for o, n in zip(pairs['Owner'], pairs['Network'])}
+    dest = [lookup[key] for key in zip(flows['Owner'], flows['Network'])]
+    df = pd.DataFrame({
+        'Account': gateway[:, 0],
+        'Region': gateway[:, 1],
+        'Month': flows['Month'].to_numpy().astype('datetime64[M]').astype(str),
+        'Service': [d[0] for d in dest],
+        'Service Region': [d[1] for d in dest],
+        'Prefix': [d[2] for d in dest],
+        'GB': flows['Bytes'].to_numpy() / (1024**3),
+    })
+    df = df.groupby(['Account', 'Region', 'Month', 'Service', 'Service Region', 'Prefix'], as_index=False)['GB'].sum()
+    return df.sort_values(['Month', 'Account', 'Region', 'GB'], ascending=[True, True, True, False], ignore_index=True)
+
+def print_flow_summary(flow_df, gateway_count, top_n=20):
+    total = flow_df['GB'].sum()
+    print_both("\n=== NAT Gateway Egress by Destination ===")
+    print_both(f"- NAT Gateways with flow log records: {gateway_count}")
+    print_both(f"- Accounts: {', '.join(sorted(flow_df['Account'].unique()))}")
+    print_both(f"- Months: {', '.join(sorted(flow_df['Month'].unique()))}")
+    print_both(f"- Total NAT Gateway egress in flow logs: {total:.2f} GB\n")
+    by_service = flow_df.groupby('Service')['GB'].sum().sort_values(ascending=False)
+    for service, gb in by_service.items():
+        share = gb / total * 100 if total else 0
+        print_both(f"- {service}: {gb:.2f} GB ({share:.1f}%)")
+
+    endpoint_gb = by_service[by_service.index.isin(GATEWAY_ENDPOINT_SERVICES)].sum()
+    if endpoint_gb > 0:
+        share = endpoint_gb / total * 100 if total else 0
+        print_both(f"\n[!] {endpoint_gb:.2f} GB ({share:.1f}%) went to {'/'.join(GATEWAY_ENDPOINT_SERVICES)}. "
+                   "A VPC gateway endpoint carries this traffic without NAT Gateway data processing charges.")
+
+    print_both(f"\n=== Top {top_n} Destination Prefixes ===")
+    top = flow_df.groupby(['Service', 'Service Region', 'Prefix'], as_index=False)['GB'].sum()
+    top = top.nlargest(top_n, 'GB')
+    print_both(top.round(2).to_string(index=False))
+
+def print_flow_details(flow_df):
+    for account, subset in flow_df.groupby('Account', sort=True):
+        print_both(f"\n=== NAT Gateway Egress by Destination for Account: {account} ===")
+        pivot = subset.pivot_table(index=['Region', 'Service'], columns='Month', values='GB', aggfunc='sum', fill_value=0)
+        print_both(pivot.round(2).to_string())
+
+def run_flow_logs(paths, ip_ranges_file=IP_RANGES_FILE, inventory_file=None, processes=1, chunk_rows=None,
+                  prefix_length=None, top_n=20, output=None, show_details=False):
+    """
+    Break NAT Gateway egress down by destination (AWS service prefix or
+    internet network) from local VPC Flow Log files, joined to the NAT
+    Gateway ENIs in the inventory. Makes no AWS calls.
+    """
+    global INVENTORY_FILE
+    files = find_input_files(paths, FLOW_LOG_FILE_SUFFIXES)
+    if not files:
+        print_both("[!] No flow log files found (expected *.log.gz, *.log or *.parquet).")
+        sys.exit(1)
+    if inventory_file:
+        INVENTORY_FILE = inventory_file
+    open_output_file()
+    load_inventory()
+    gateways, eni_index = nat_gateway_enis()
+    if not eni_index:
+        print_both(f"[!] No NAT Gateway network interfaces in {INVENTORY_FILE}. Run a normal analysis first to build the inventory.")
+        sys.exit(1)
+    prefix_length = min(max(prefix_length or internet_prefix_length, 0), 32)
+    table = build_prefix_table(ip_ranges_file)
+    print_both(f"[✓] Reading {len(files)} flow log file(s) for {len(gateways)} NAT Gateways ({len(eni_index)} ENIs) "
+               f"with {max(1, processes)} process(es)")
+
+    partials = []
+    failed = []
+    for path, result, error in read_files(read_flow_log_file, files, max(1, processes),
+                                          eni_index, table, chunk_rows or flow_chunk_rows, prefix_length):
+        if error is not None:
+            failed.append(path)
+            print_both(f"[!] Could not read {path}: {error}")
+            continue
+        rows, totals = result
+        if totals is not None:
+            partials.append(totals)
+        print_both(f"[✓] {path}: {rows} rows read")
+
+    if not partials:
+        print_both("No NAT Gateway egress found in the flow logs.")
+        sys.exit(1 if failed else 0)
+    with timed('pandas'):
+        totals = pd.concat(partials).groupby(level=FLOW_GROUP).sum()
+        flow_df = build_flow_df(totals, gateways, table, prefix_length)
+
+    print_flow_summary(flow_df, totals.index.get_level_values('Gateway').nunique(), top_n)
+    if failed:
+        print_both(f"\n[!] {len(failed)} flow log file(s) could not be read and are excluded: {', '.join(failed)}")
+    if show_details:
+        print_flow_details(flow_df)
+    if output:
+        flow_df.round(6).to_csv(output, index=False)
+        print_both(f"\n[✓] Wrote {len(flow_df)} destination rows to {output}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Calculate AWS NAT Gateway and DTO egress traffic across accounts and regions.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of account/region work units to scan concurrently (default: 1)")
+    parser.add_argument("--backend", choices=['threads', 'async'], default='threads',
+                        help="Collection engine: thread pool (default) or asyncio/aiobotocore")
+    parser.add_argument("--region-concurrency", type=int, default=REGION_CONCURRENCY,
+                        help=f"Maximum in-flight AWS requests per region (default: {REGION_CONCURRENCY})")
+    parser.add_argument("--api-limit", action="append", default=[], metavar="API=N",
+                        help="Maximum in-flight requests per region for an API, e.g. get_metric_data=8 (repeatable)")
+    parser.add_argument("--refresh-regions", action="store_true",
+                        help=f"Refresh the region list with describe_regions and cache it in {REGIONS_FILE} "
+                             "(otherwise the cached or built-in default list is used)")
+    parser.add_argument("--no-region-prefilter", action="store_true",
+                        help="Scan every selected region instead of only regions where describe_nat_gateways finds gateways")
+    parser.add_argument("--granularity", choices=['monthly', 'daily'], default='monthly',
+                        help="daily also keeps per-gateway daily series and reports peak day, p95 daily egress and month-over-month growth")
+    parser.add_argument("--incremental", action="store_true",
+                        help=f"Reuse finalized months from {HISTORY_FILE} and only fetch months that are missing or still open")
+    parser.add_argument("--inventory-ttl", type=float, default=inventory_ttl_hours, metavar="HOURS",
+                        help=f"Reuse NAT Gateway inventory entries younger than this (default: {inventory_ttl_hours}, 0 forces a refresh)")
+    parser.add_argument("--role-duration", type=int, default=3600, metavar="SECONDS",
+                        help="DurationSeconds to request when assuming roles (default: 3600, max 43200)")
+    parser.add_argument("--persist-credentials", action="store_true",
+                        help=f"Keep assumed-role credentials in {CREDENTIAL_CACHE_FILE} (mode 0600) so resumed runs reuse them")
+    parser.add_argument("--max-pool-connections", type=int, default=max_pool_connections,
+                        help=f"HTTP connections kept per client (default: {max_pool_connections}, never below --workers)")
+    parser.add_argument("--retry-mode", choices=['legacy', 'standard', 'adaptive'], default=retry_mode,
+                        help=f"botocore retry mode (default: {retry_mode})")
+    parser.add_argument("--max-attempts", type=int, default=max_attempts,
+                        help=f"botocore attempts per request, including the first (default: {max_attempts}; "
+                             "retries are normally left to --max-retries and --retry-budget)")
+    parser.add_argument("--max-retries", type=int, default=retry_limit,
+                        help=f"Jittered retries per request for throttling and transient errors (default: {retry_limit})")
+    parser.add_argument("--retry-budget", type=int, default=retry_budget,
+                        help=f"Retries allowed across the whole run, refilled slowly by successful calls (default: {retry_budget})")
+    parser.add_argument("--no-keepalive", action="store_true",
+                        help="Disable TCP keep-alive on pooled connections")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="Write a JSON run profile with per-API/region/account call counts and latencies, e.g. aws-profile.json")
+    parser.add_argument("--prometheus", metavar="FILE",
+                        help="Write the run profile as a Prometheus textfile, e.g. for node_exporter's textfile collector")
+    parser.add_argument("--export", metavar="DIR",
+                        help="Also write per-gateway NAT bytes and DTO as a dataset partitioned by account and month, "
+                             "unit by unit as they complete (needs pyarrow)")
+    parser.add_argument("--export-format", choices=['parquet', 'arrow'], default='parquet',
+                        help="File format for --export: Parquet (default) or Arrow IPC")
+    parser.add_argument("--prices", metavar="FILE",
+                        help=f"Price table for the cost estimate and forecast (default: {os.path.basename(PRICES_FILE)} next to this script)")
+    parser.add_argument("--no-costs", action="store_true", help="Skip the cost estimate and forecast")
+    parser.add_argument("--what-if", action="append", default=[], metavar="[NAME:]FACTOR=VALUE,...",
+                        help="Also price a what-if scenario, e.g. endpoints:nat=0.6 or dto_price=-10%% "
+                             f"(repeatable; factors: {', '.join(WHAT_IF_FACTORS)})")
+
+    batch = parser.add_argument_group("batch runs (no prompts)")
+    batch.add_argument("--config", metavar="FILE",
+                       help="Run every target in a YAML or TOML config, sharing clients and workers across them")
+    batch.add_argument("--non-interactive", action="store_true",
+                       help="Run one target from the flags below instead of prompting")
+    batch.add_argument("--target-name", help="Name used in the output file of a --non-interactive run")
+    batch.add_argument("--aws-profile", help="AWS named profile for the caller's credentials")
+    batch.add_argument("--org", action="store_true", help="Org mode (implied by --role-name)")
+    batch.add_argument("--dto", action="store_true", help="Include DTO (Data Transfer Out) metrics")
+
+    shards = parser.add_argument_group("sharded and batch runs")
+    shards.add_argument("--shard", metavar="I/N",
+                        help="Collect only accounts in shard I of N (hash of account ID) and write a partial result file")
+    shards.add_argument("--shards", type=int, metavar="N",
+                        help="Run all N shards as local processes, then merge them")
+    shards.add_argument("--shard-processes", type=int, metavar="N",
+                        help="Maximum shard processes to run at once with --shards (default: N)")
+    shards.add_argument("--role-name", help="IAM role to assume in each account")
+    shards.add_argument("--regions", default="all",
+                        help="Comma-separated regions, or 'all' (default: all)")
+    shards.add_argument("--accounts", help="Comma-separated account IDs instead of listing the Organization")
+    shards.add_argument("--partial-output", help=f"Partial result file for --shard (default: {PARTIAL_FILE_PATTERN})")
+    shards.add_argument("--resume", action="store_true", help="Keep the checkpoint store from a previous --shards or batch run")
+    shards.add_argument("--details", action="store_true", help="Print detailed tables after merging or for a batch run")
+
+    subparsers = parser.add_subparsers(dest="command")
+    merge = subparsers.add_parser("merge", help="Merge partial shard result files and print the summary")
+    merge.add_argument("files", nargs="*", help=f"Partial files (default: all {PARTIAL_FILE_PATTERN.format(index='*', count='*')})")
+    merge.add_argument("--details", action="store_true", help="Print detailed tables per account and region")
+    cur = subparsers.add_parser("cur", help="Compute NAT and DTO totals from local Cost and Usage Report files (no AWS calls)")
+    cur.add_argument("paths", nargs="+", help="CUR files or directories (*.parquet needs pyarrow, *.csv.gz, *.csv)")
+    cur.add_argument("--processes", type=int, default=1,
+                     help="Number of CUR files to read in parallel processes (default: 1)")
+    cur.add_argument("--chunk-rows", type=int, default=cur_chunk_rows,
+                     help=f"Rows read per chunk; bounds memory per process (default: {cur_chunk_rows})")
+    cur.add_argument("--regions", default="all", help="Comma-separated regions, or 'all' (default: all)")
+    cur.add_argument("--details", action="store_true", help="Print detailed tables per account and region")
+    flows = subparsers.add_parser("flowlogs", help="Break NAT Gateway egress down by destination from local VPC Flow Log files (no AWS calls)")
+    flows.add_argument("paths", nargs="+", help="Flow log files or directories (*.log.gz, *.log, *.parquet needs pyarrow)")
+    flows.add_argument("--ip-ranges", default=IP_RANGES_FILE,
+                       help=f"Local copy of https://ip-ranges.amazonaws.com/ip-ranges.json (default: {IP_RANGES_FILE})")
+    flows.add_argument("--inventory", help=f"NAT Gateway inventory holding the gateway ENIs (default: {INVENTORY_FILE})")
+    flows.add_argument("--processes", type=int, default=1,
+                       help="Number of flow log files to read in parallel processes (default: 1)")
+    flows.add_argument("--chunk-rows", type=int, default=flow_chunk_rows,
+                       help=f"Records read per chunk; bounds memory per process (default: {flow_chunk_rows})")
+    flows.add_argument("--internet-prefix", type=int, default=internet_prefix_length, metavar="BITS",
+                       help=f"Group non-AWS destinations into networks of this prefix length (default: /{internet_prefix_length})")
+    flows.add_argument("--top", type=int, default=20, help="Number of destination prefixes to list (default: 20)")
+    flows.add_argument("--output", metavar="FILE", help="Also write every account/region/month/destination row to a CSV file")
+    flows.add_argument("--details", action="store_true", help="Print per-account tables by region and destination")
+    return parser.parse_args(argv)
+
+def apply_args(args):
+    global max_workers, REGION_CONCURRENCY, role_duration, persist_credentials, region_prefilter
+    global inventory_ttl_hours, incremental_mode, collection_backend, aws_profile, refresh_regions
+    collection_backend = args.backend
+    aws_profile = args.aws_profile
+    refresh_regions = args.refresh_regions
+    if collection_backend == 'async' and not load_aiobotocore():
+        print_both("[!] aiobotocore is not installed; falling back to the threaded backend (pip install aiobotocore).")
+        collection_backend = 'threads'
+    incremental_mode = args.incremental
+    global granularity
+    granularity = args.granularity
+    inventory_ttl_hours = max(0, args.inventory_ttl)
+    max_workers = max(1, args.workers)
+    region_prefilter = not args.no_region_prefilter
+    role_duration = min(max(900, args.role_duration), 43200)
+    persist_credentials = args.persist_credentials
+    global INVENTORY_FILE, CREDENTIAL_CACHE_FILE, CHECKPOINT_FILE, profile_file, prometheus_file
+    profile_file = args.profile
+    prometheus_file = args.prometheus
+    global export_dir, export_format
+    export_dir = args.export
+    export_format = args.export_format
+    if export_dir and not load_pyarrow():
+        print_both("[!] --export needs pyarrow (pip install pyarrow).")
+        sys.exit(2)
+    global price_table, what_if_scenarios
+    price_table = None
+    prices_path = args.prices or PRICES_FILE
+    if not args.no_costs and os.path.exists(prices_path):
+        try:
+            price_table = PriceTable(prices_path)
+        except (ValueError, KeyError, TypeError) as e:
+            print_both(f"[!] Ignoring invalid price table {prices_path}: {e}")
+    elif args.prices and not args.no_costs:
+        print_both(f"[!] Price table not found: {prices_path}")
+    try:
+        what_if_scenarios = [parse_what_if(spec) for spec in args.what_if]
+    except ValueError as e:
+        print_both(f"[!] Invalid --what-if scenario: {e}")
+        sys.exit(2)
+    if getattr(args, 'shard', None):
+        # Concurrent shards rewrite these files, so each keeps its own;
+        # `merge` folds the inventories back and removes the shard files
+        shard_index, shard_count = parse_shard(args.shard)
+        INVENTORY_FILE = shard_file(INVENTORY_FILE, shard_index, shard_count)
+        CREDENTIAL_CACHE_FILE = shard_file(CREDENTIAL_CACHE_FILE, shard_index, shard_count)
+        CHECKPOINT_FILE = shard_file(CHECKPOINT_FILE, shard_index, shard_count)
+        if profile_file:
+            profile_file = shard_file(profile_file, shard_index, shard_count)
+        if prometheus_file:
+            prometheus_file = shard_file(prometheus_file, shard_index, shard_count)
+    global max_pool_connections, tcp_keepalive, retry_mode, max_attempts
+    max_pool_connections = max(args.max_pool_connections, max_workers)
+    tcp_keepalive = not args.no_keepalive
+    retry_mode = args.retry_mode
+    max_attempts = max(1, args.max_attempts)
+    global retry_limit, retry_budget
+    retry_limit = max(0, args.max_retries)
+    retry_budget = max(0, args.retry_budget)
+    REGION_CONCURRENCY = max(1, args.region_concurrency)
+    for limit in args.api_limit:
+        api, _, value = limit.partition("=")
+        try:
+            API_CONCURRENCY[api.strip()] = max(1, int(value))
+        except ValueError:
+            print_both(f"[!] Ignoring invalid --api-limit value: {limit}")
+
 # Entry
 if __name__ == "__main__":
-    run_aws_analysis()
\ No newline at end of file
+    args = parse_args()
+    apply_args(args)
+    if args.command == "merge":
+        run_merge(args.files, args.details)
+    elif args.command == "cur":
+        run_cur(args.paths, args.processes, args.chunk_rows, args.regions, args.details)
+    elif args.command == "flowlogs":
+        run_flow_logs(args.paths, args.ip_ranges, args.inventory, args.processes, args.chunk_rows,
+                      args.internet_prefix, args.top, args.output, args.details)
+    elif args.config or args.non_interactive:
+        try:
+            targets = load_batch_config(args.config) if args.config else [target_from_args(args)]
+        except Exception as e:
+            print_both(f"[!] Invalid batch configuration: {e}")
+            sys.exit(2)
+        run_batch(targets)
+    elif args.shards:
+        run_local_shards(args, sys.argv[1:])
+    elif args.shard:
+        run_shard(args)
+    else:
+        run_aws_analysis()
\ No newline at end of file
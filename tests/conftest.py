@@ -0,0 +1,14 @@
+import importlib.util
+import os
+
+import pytest
+
+CALCULATOR_PATH = os.path.join(os.path.dirname(__file__), os.pardir, 'aws-egress-calculator.py')
+
+
+@pytest.fixture(scope='session')
+def calc():
+    spec = importlib.util.spec_from_file_location('aws_egress_calculator', CALCULATOR_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
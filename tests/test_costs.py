@@ -0,0 +1,64 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+NOW = datetime(2026, 10, 17, 12, 0, tzinfo=timezone.utc)
+
+
+def usage(rows):
+    return pd.DataFrame(rows, columns=['Account', 'Region', 'Month', 'NAT GB', 'DTO GB', 'Gateway Hours'])
+
+
+def test_linear_trend_fits_each_row_and_skips_nan(calc):
+    values = np.array([[1.0, 2.0, 3.0], [5.0, np.nan, 5.0], [np.nan, np.nan, 4.0], [3.0, 2.0, 1.0]])
+    trend = calc.linear_trend(values, np.array([-2.0, -1.0, 0.0]), np.array([1.0, 2.0]))
+    np.testing.assert_allclose(trend, [[4, 5], [5, 5], [4, 4], [0, 0]])
+
+
+def test_tiered_cost_charges_each_tier_at_its_rate(calc):
+    starts = np.array([[0.0, 10.0, np.inf], [0.0, 10.0, 20.0]])
+    rates = np.array([[1.0, 0.5, 0.0], [2.0, 1.0, 0.5]])
+    cost = calc.tiered_cost(np.array([15.0, 30.0]), starts, rates)
+    np.testing.assert_allclose(cost, [10 + 2.5, 20 + 10 + 5])
+
+
+def test_forecast_starts_after_the_last_closed_month(calc):
+    forecast = calc.forecast_usage(usage([('a', 'r', '2026-08', 10.0, 0.0, 0.0)]), horizon=3, now=NOW)
+    assert list(forecast['Month']) == ['2026-10', '2026-11', '2026-12']
+
+
+def test_forecast_counts_months_without_rows_as_zero(calc):
+    rows = usage([
+        ('a', 'r', '2026-01', 100.0, 0.0, 0.0),
+        ('a', 'r', '2026-02', 120.0, 0.0, 0.0),
+    ])
+    forecast = calc.forecast_usage(rows, horizon=12, now=NOW)
+    assert forecast['Month'].iloc[0] == '2026-10'
+    assert forecast['NAT GB'].sum() == 0
+
+
+def test_forecast_leaves_only_missing_nat_rows_out_of_the_fit(calc):
+    months = [f"2026-{m:02d}" for m in range(1, 10)]
+    rows = usage([('a', 'r', m, 50.0, 0.0, 744.0) for m in months])
+    rows.loc[rows['Month'] == '2026-05', 'NAT GB'] = np.nan
+    forecast = calc.forecast_usage(rows, horizon=2, now=NOW)
+    np.testing.assert_allclose(forecast['NAT GB'], [50, 50])
+    # One gateway running all of September is carried forward
+    np.testing.assert_allclose(forecast['Gateway Hours'], [744 / 720 * 744, 744 / 720 * 720])
+
+
+def test_gateway_hours_of_metric_only_gateways_start_at_their_first_datapoint(calc, monkeypatch):
+    monkeypatch.setattr(calc, 'nat_inventory', {'a': {'Regions': {
+        'r': {'RefreshedAt': '2026-09-30T00:00:00+00:00', 'Gateways': {'nat-1': {
+            'FirstSeen': '2026-09-30T00:00:00+00:00', 'LastSeen': '2026-09-30T00:00:00+00:00', 'Sources': ['list_metrics'],
+            'FirstDatapoint': '2026-09-21T00:00:00+00:00', 'LastDatapoint': '2026-09-29T00:00:00+00:00'}}},
+        'q': {'RefreshedAt': None, 'Gateways': {'nat-2': {
+            'FirstSeen': '2026-08-01T00:00:00+00:00', 'LastSeen': '2026-08-11T00:00:00+00:00', 'Sources': ['list_metrics']}}},
+    }}})
+    frame, approximated = calc.gateway_hours_frame([('a', 'r'), ('a', 'q')], ['2026-07', '2026-08', '2026-09'])
+    hours = frame.set_index(['Region', 'Month'])['Gateway Hours']
+    assert approximated == 2
+    assert hours[('r', '2026-07')] == 0 and hours[('r', '2026-08')] == 0
+    assert hours[('r', '2026-09')] == 10 * 24
+    assert hours[('q', '2026-08')] == 10 * 24 and hours[('q', '2026-09')] == 0
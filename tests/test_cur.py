@@ -0,0 +1,23 @@
+import os
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'cur-sample.csv')
+
+
+def test_cloudfront_data_transfer_is_not_counted_as_dto(calc):
+    rows, totals = calc.read_cur_file(FIXTURE, ['2026-02'], 1000)
+    assert rows == 7
+    assert totals.to_dict() == {
+        ('dto', '111111111111', 'eu-west-1', '2026-02'): 3.0,
+        ('dto', '111111111111', 'us-east-1', '2026-02'): 2.0,
+        ('dto', '111111111111', 'us-east-2', '2026-02'): 5.0,
+        ('nat', '111111111111', 'us-east-2', '2026-02'): 10.0,
+    }
+
+
+def test_dto_usage_type_pattern_skips_cloudfront_edge_prefixes(calc):
+    matches = calc.DTO_USAGE_TYPE_PATTERN.match
+    assert matches('DataTransfer-Out-Bytes')
+    assert matches('USE2-DataTransfer-Out-Bytes')
+    assert matches('EU-DataTransfer-Out-Bytes')
+    assert not matches('US-DataTransfer-Out-Bytes')
+    assert not matches('JP-DataTransfer-Out-Bytes')
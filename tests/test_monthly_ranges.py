@@ -0,0 +1,12 @@
+from datetime import datetime, timezone
+
+
+def test_month_boundaries_are_midnight_utc_for_a_mid_day_now(calc):
+    now = datetime(2026, 3, 17, 14, 35, 12, 345678, tzinfo=timezone.utc)
+    ranges = calc.get_monthly_ranges(3, now=now)
+    assert ranges == [
+        (datetime(2025, 12, 1, tzinfo=timezone.utc), datetime(2026, 1, 1, tzinfo=timezone.utc)),
+        (datetime(2026, 1, 1, tzinfo=timezone.utc), datetime(2026, 2, 1, tzinfo=timezone.utc)),
+        (datetime(2026, 2, 1, tzinfo=timezone.utc), datetime(2026, 3, 1, tzinfo=timezone.utc)),
+        (datetime(2026, 3, 1, tzinfo=timezone.utc), now),
+    ]